@@ -0,0 +1,95 @@
+"""
+进程内响应缓存
+
+缓存已序列化的JSON响应字节（详情响应连同其ETag一起缓存），按LRU淘汰并设置TTL。
+写操作提交后由路由调用失效方法；每次失效都会递增generation，
+读请求在查询前记录generation，写入缓存时若已变化则放弃，避免并发写入后回填旧数据。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional, Tuple
+
+from .config import settings
+
+# 缓存键的命名空间
+LIST_NAMESPACE = "list"
+ITEM_NAMESPACE = "item"
+
+
+class ResponseCache:
+    """
+    LRU + TTL 响应缓存
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, enabled: bool = True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Any]:
+        """
+        读取缓存，未命中或已过期返回None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Tuple[Hashable, ...], value: Any, generation: int) -> None:
+        """
+        写入缓存；generation与读取前记录的值不一致时说明期间发生过写操作，放弃写入
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, namespace: str, ids: Optional[Iterable[int]] = None) -> None:
+        """
+        使命名空间下的缓存失效；ids为空时使整个命名空间失效
+        """
+        with self._lock:
+            self.generation += 1
+            if ids is not None:
+                for todo_id in ids:
+                    self._entries.pop((namespace, todo_id), None)
+                return
+            for key in [key for key in self._entries if key[0] == namespace]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """
+        清空缓存
+        """
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+response_cache = ResponseCache(
+    max_entries=settings.cache_max_entries,
+    ttl_seconds=settings.cache_ttl_seconds,
+    enabled=settings.cache_enabled,
+)
@@ -0,0 +1,261 @@
+"""
+跨进程的变更日志
+
+多个工作进程各自持有响应缓存、表版本号和SSE事件缓冲区，这些状态通过数据库中的变更日志保持一致：
+- 写操作在同一事务中向 todo_changes 追加一条记录，自增的seq即为全局的表版本号和事件序号，
+  日志的顺序与各事务的提交顺序一致
+- 每个进程按固定间隔读取新的日志，依次递增版本号、使缓存失效、更新内存读模型并向本进程的订阅者广播事件；
+  写操作所在的进程在返回响应前立即同步，保证读到自己的写入
+- todo_changes_epoch 保存数据库的epoch，替换数据库文件后epoch变化，各进程清空缓存、重新加载读模型并发送reset事件
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .cache import ITEM_NAMESPACE, LIST_NAMESPACE, ResponseCache, response_cache
+from .config import settings
+from .events import RESET_EVENT, EventHub, event_hub
+from .models import Todo
+from .readmodel import TodoStore, todo_store
+from .serialization import dumps
+from .versioning import TableVersion, todos_version
+
+logger = logging.getLogger(__name__)
+
+CHANGES_TABLE = "todo_changes"
+EPOCH_TABLE = "todo_changes_epoch"
+
+# 每追加多少条日志清理一次过期记录
+PRUNE_EVERY = 100
+# 每次同步最多读取的日志条数
+SYNC_LIMIT = 1000
+
+CREATE_CHANGELOG = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        event TEXT NOT NULL,
+        data TEXT NOT NULL,
+        todo_ids TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {EPOCH_TABLE} (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        epoch TEXT NOT NULL
+    )
+    """,
+    f"INSERT OR IGNORE INTO {EPOCH_TABLE} (id, epoch) VALUES (1, lower(hex(randomblob(8))))",
+]
+
+# 一次查询读取epoch、最新序号及之后的日志；没有新日志时返回一行，日志字段为NULL
+SYNC_SQL = text(
+    f"SELECT e.epoch, (SELECT max(seq) FROM {CHANGES_TABLE}) AS last_seq, "
+    f"c.seq, c.event, c.data, c.todo_ids "
+    f"FROM {EPOCH_TABLE} e LEFT JOIN {CHANGES_TABLE} c ON c.seq > :applied "
+    f"ORDER BY c.seq LIMIT :limit"
+)
+
+APPEND_SQL = text(
+    f"INSERT INTO {CHANGES_TABLE} (event, data, todo_ids) VALUES (:event, :data, :todo_ids) RETURNING seq"
+)
+
+
+def ensure_changelog(connection: Connection) -> None:
+    """
+    创建变更日志表并生成数据库epoch
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in CREATE_CHANGELOG:
+        connection.execute(text(statement))
+
+
+def drop_changelog(connection: Connection) -> None:
+    """
+    删除变更日志表
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(text(f"DROP TABLE IF EXISTS {CHANGES_TABLE}"))
+    connection.execute(text(f"DROP TABLE IF EXISTS {EPOCH_TABLE}"))
+
+
+# 随todos表一起创建和删除
+event.listen(
+    Todo.__table__, "after_create",
+    lambda target, connection, **kw: ensure_changelog(connection)
+)
+event.listen(
+    Todo.__table__, "before_drop",
+    lambda target, connection, **kw: drop_changelog(connection)
+)
+
+
+class ChangeFeed:
+    """
+    读取变更日志并应用到本进程的缓存、版本号、读模型和事件广播；每个数据库（分片）各有一组
+    """
+
+    def __init__(
+        self,
+        poll_interval: float,
+        retention: int,
+        version: TableVersion = todos_version,
+        cache: ResponseCache = response_cache,
+        events: EventHub = event_hub,
+        store: TodoStore = todo_store,
+    ):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.version = version
+        self.cache = cache
+        self.events = events
+        self.store = store
+        self.epoch: Optional[str] = None
+        self.applied = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self, connection: Connection) -> None:
+        """
+        进程启动时同步：采用数据库的epoch和最新序号，加载读模型，并用最近的日志填充事件缓冲区以便续传
+        """
+        row = connection.execute(
+            text(f"SELECT epoch, (SELECT max(seq) FROM {CHANGES_TABLE}) AS last_seq FROM {EPOCH_TABLE}")
+        ).first()
+        self.epoch = row.epoch
+        self.applied = max((row.last_seq or 0) - self.events.history.maxlen, 0)
+        self.version.set(self.epoch, row.last_seq or 0)
+        self.cache.clear()
+        self.events.reset(self.applied)
+        # 读模型跳过加载前已有的日志，之后的日志即使已包含在加载的数据中，重新应用也得到相同的结果
+        self.store.load(connection, row.last_seq or 0)
+        while True:
+            rows = connection.execute(SYNC_SQL, {"applied": self.applied, "limit": SYNC_LIMIT}).all()
+            if not self._apply(rows):
+                break
+        if self.store.stale:
+            self.store.load(connection, self.applied)
+
+    async def append(
+        self,
+        db: AsyncSession,
+        event_type: str,
+        data: Dict[str, Any],
+        todo_ids: Optional[Sequence[int]] = None,
+    ) -> int:
+        """
+        在当前事务中追加一条变更日志，返回序号；todo_ids为空表示影响范围未知。
+        提交后需调用sync使本进程生效
+        """
+        ids = json.dumps(sorted(todo_ids)) if todo_ids is not None else None
+        seq = (
+            await db.execute(APPEND_SQL, {"event": event_type, "data": dumps(data).decode("utf-8"), "todo_ids": ids})
+        ).scalar_one()
+        if seq % PRUNE_EVERY == 0:
+            await db.execute(text(f"DELETE FROM {CHANGES_TABLE} WHERE seq <= :seq"), {"seq": seq - self.retention})
+        return seq
+
+    async def record(
+        self,
+        db: AsyncSession,
+        event_type: str,
+        data: Dict[str, Any],
+        todo_ids: Optional[Sequence[int]] = None,
+    ) -> int:
+        """
+        在当前事务中追加一条变更日志、与写操作一起提交并立即同步本进程，返回序号
+        """
+        seq = await self.append(db, event_type, data, todo_ids)
+        await db.commit()
+        await self.sync(db)
+        return seq
+
+    async def sync(self, db: AsyncSession) -> None:
+        """
+        应用本进程尚未处理的日志
+        """
+        async with self._lock:
+            while True:
+                rows = (await db.execute(SYNC_SQL, {"applied": self.applied, "limit": SYNC_LIMIT})).all()
+                if not self._apply(rows):
+                    break
+            if self.store.stale:
+                await self.store.reload(db, self.applied)
+
+    def _apply(self, rows: List[Any]) -> bool:
+        """
+        依次应用日志；返回是否可能还有未读取的日志
+        """
+        if not rows:
+            return False
+        epoch, last_seq = rows[0].epoch, rows[0].last_seq or 0
+        if epoch != self.epoch or last_seq < self.applied:
+            self._resync(epoch, last_seq)
+            return False
+        for row in rows:
+            if row.seq is None:
+                return False
+            ids = json.loads(row.todo_ids) if row.todo_ids is not None else None
+            data = json.loads(row.data)
+            self.version.set(epoch, row.seq)
+            self.store.apply(row.seq, row.event, data)
+            self.cache.invalidate(LIST_NAMESPACE)
+            self.cache.invalidate(ITEM_NAMESPACE, ids)
+            self.events.publish(row.seq, data, row.event)
+            self.applied = row.seq
+        return len(rows) >= SYNC_LIMIT
+
+    def _resync(self, epoch: str, last_seq: int) -> None:
+        """
+        数据库被替换或回退：清空缓存，通知订阅者重新加载
+        """
+        logger.warning("数据库变更日志不连续（epoch %s -> %s），清空缓存并重新同步", self.epoch, epoch)
+        self.epoch = epoch
+        self.applied = last_seq
+        self.version.set(epoch, last_seq)
+        self.cache.clear()
+        self.store.invalidate()
+        self.events.reset(last_seq)
+        self.events.publish(last_seq, {"reason": "resync"}, RESET_EVENT)
+
+    def start(self, session_factory: async_sessionmaker) -> None:
+        """
+        启动后台轮询；间隔为0时不轮询（单进程部署）
+        """
+        if self.poll_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._poll(session_factory))
+
+    async def stop(self) -> None:
+        """
+        停止后台轮询
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _poll(self, session_factory: async_sessionmaker) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                async with session_factory() as db:
+                    await self.sync(db)
+            except Exception as e:
+                logger.warning("同步变更日志失败: %s", e)
+
+
+change_feed = ChangeFeed(
+    poll_interval=settings.changes_poll_interval_ms / 1000,
+    retention=settings.changes_retention,
+)
@@ -0,0 +1,145 @@
+"""
+响应压缩
+
+列表和统计响应按请求的Accept-Encoding协商压缩算法，不小于 COMPRESSION_MIN_SIZE 字节时压缩后返回。
+可用算法按 zstd、br、gzip 的顺序优先（q值相同时），brotli 和 zstandard 为可选依赖，未安装时不提供对应算法。
+这些响应的ETag都是弱ETag，压缩前后语义相同，304判断不受影响；详情响应的强ETag用于If-Match，不压缩。
+
+缓存的列表响应保存为Payload：压缩结果在第一次被请求时生成并随缓存条目保存，
+之后相同编码的请求直接返回。缓存条目在每次写操作后失效，压缩结果随之丢弃，
+因此保存的压缩结果总是对应当前的版本号，热门响应不会每次请求都重新压缩。
+"""
+import gzip
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from .config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli为可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard为可选依赖
+    zstandard = None
+
+# 压缩响应需要在Vary中声明
+VARY_HEADER = "Accept-Encoding"
+
+
+def _gzip(body: bytes, level: int) -> bytes:
+    # mtime固定为0，相同内容的压缩结果相同
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def _brotli(body: bytes, level: int) -> bytes:
+    return brotli.compress(body, quality=level)
+
+
+def _zstd(body: bytes, level: int) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(body)
+
+
+# 按优先级排列的可用算法
+ENCODERS: Dict[str, Callable[[bytes, int], bytes]] = {}
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+ENCODERS["gzip"] = _gzip
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """
+    解析Accept-Encoding为 {编码: q值}，q值无效时视为0
+    """
+    weights = {}
+    for part in header.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    return weights
+
+
+class Payload:
+    """
+    已序列化的响应体及其各编码的压缩结果
+    """
+
+    __slots__ = ("body", "variants")
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.variants: Dict[str, bytes] = {}
+
+
+class ResponseCompressor:
+    """
+    按Accept-Encoding压缩响应，并统计压缩前后的字节数
+    """
+
+    def __init__(self, enabled: bool, min_size: int, levels: Dict[str, int], encodings: Iterable[str] = ENCODERS):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.levels = levels
+        self.encodings = [name for name in encodings if name in ENCODERS]
+        self.compressed = 0
+        self.reused = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def negotiate(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """
+        选择客户端接受的q值最高的算法；q值相同时按服务端的优先级，都不接受时返回None
+        """
+        if not accept_encoding:
+            return None
+        weights = parse_accept_encoding(accept_encoding)
+        default = weights.get("*", 0.0)
+        chosen, best = None, 0.0
+        for name in self.encodings:
+            weight = weights.get(name, default)
+            if weight > best:
+                chosen, best = name, weight
+        return chosen
+
+    def encode(self, payload: Payload, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+        """
+        返回 (响应体, Content-Encoding)；不压缩时编码为None
+        """
+        if not self.enabled or len(payload.body) < self.min_size:
+            return payload.body, None
+        encoding = self.negotiate(accept_encoding)
+        if encoding is None:
+            return payload.body, None
+        data = payload.variants.get(encoding)
+        if data is not None:
+            self.reused += 1
+        else:
+            data = payload.variants[encoding] = ENCODERS[encoding](payload.body, self.levels[encoding])
+            self.compressed += 1
+        self.bytes_in += len(payload.body)
+        self.bytes_out += len(data)
+        return data, encoding
+
+
+response_compressor = ResponseCompressor(
+    enabled=settings.compression_enabled,
+    min_size=settings.compression_min_size,
+    levels={
+        "gzip": settings.compression_gzip_level,
+        "br": settings.compression_brotli_level,
+        "zstd": settings.compression_zstd_level,
+    },
+)
@@ -0,0 +1,126 @@
+"""
+应用配置
+
+所有配置项均从环境变量读取，未设置时使用默认值
+"""
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    """读取整数环境变量"""
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def env_float(name: str, default: float) -> float:
+    """读取浮点数环境变量"""
+    value = os.getenv(name)
+    return float(value) if value not in (None, "") else default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """读取布尔环境变量，支持 1/true/yes/on"""
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class Settings:
+    """
+    应用配置项
+    """
+
+    def __init__(self):
+        # 数据库连接
+        self.database_url = os.getenv("DATABASE_URL", "sqlite:///./todos.db")
+        # 异步驱动URL，未设置时由database_url推导（sqlite -> sqlite+aiosqlite）
+        self.async_database_url = os.getenv("ASYNC_DATABASE_URL") or None
+
+        # 按工作空间分片：分片数为0时所有工作空间共用database_url，
+        # 否则按工作空间名称的哈希分布到SHARD_URL（{shard}替换为分片序号）指向的数据库
+        self.shard_count = env_int("SHARD_COUNT", 0)
+        self.shard_url = os.getenv("SHARD_URL", "sqlite:///./shards/todos-{shard}.db")
+
+        # SQLite引擎配置档: tuned(WAL等生产参数) | baseline(SQLite默认参数)
+        self.db_profile = os.getenv("DB_PROFILE", "tuned")
+        self.db_pool_size = env_int("DB_POOL_SIZE", 8)
+        self.db_max_overflow = env_int("DB_MAX_OVERFLOW", 8)
+        self.db_pool_timeout = env_float("DB_POOL_TIMEOUT", 30.0)
+
+        # tuned配置档使用的PRAGMA参数
+        self.sqlite_busy_timeout_ms = env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)
+        self.sqlite_mmap_size = env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)
+        self.sqlite_cache_size_kb = env_int("SQLITE_CACHE_SIZE_KB", 64 * 1024)
+        self.sqlite_synchronous = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+        # 列表/详情响应缓存
+        self.cache_enabled = env_bool("CACHE_ENABLED", True)
+        self.cache_max_entries = env_int("CACHE_MAX_ENTRIES", 1024)
+        self.cache_ttl_seconds = env_float("CACHE_TTL_SECONDS", 30.0)
+
+        # 变更事件推送(SSE)
+        self.events_history_size = env_int("EVENTS_HISTORY_SIZE", 1000)
+        self.events_queue_size = env_int("EVENTS_QUEUE_SIZE", 256)
+        self.events_keepalive_seconds = env_float("EVENTS_KEEPALIVE_SECONDS", 15.0)
+
+        # 多进程部署时各进程轮询变更日志的间隔，0表示不轮询（单进程部署）
+        self.changes_poll_interval_ms = env_float("CHANGES_POLL_INTERVAL_MS", 200.0)
+        # 变更日志保留的条数，应不小于EVENTS_HISTORY_SIZE，以便重启后的进程恢复续传缓冲区
+        self.changes_retention = env_int("CHANGES_RETENTION", 10000)
+
+        # 写操作合并提交：单条创建/更新/删除排队后按批在一个事务中提交
+        self.write_coalescing = env_bool("WRITE_COALESCING", False)
+        # 取到第一个操作后等待更多操作的最长时间
+        self.write_batch_window_ms = env_float("WRITE_BATCH_WINDOW_MS", 2.0)
+        self.write_batch_max_size = env_int("WRITE_BATCH_MAX_SIZE", 256)
+
+        # 后台维护：清除软删除记录、增量VACUUM、ANALYZE；间隔为0表示不运行
+        self.maintenance_interval_seconds = env_float("MAINTENANCE_INTERVAL_SECONDS", 10.0)
+        # 最近多长时间内没有请求才视为空闲
+        self.maintenance_idle_ms = env_float("MAINTENANCE_IDLE_MS", 500.0)
+        # 软删除的记录保留多久后清除
+        self.tombstone_retention_seconds = env_float("TOMBSTONE_RETENTION_SECONDS", 60.0)
+        self.purge_batch_size = env_int("PURGE_BATCH_SIZE", 200)
+        self.vacuum_step_pages = env_int("VACUUM_STEP_PAGES", 256)
+        # 累计清除多少行后重新ANALYZE
+        self.analyze_threshold = env_int("ANALYZE_THRESHOLD", 10000)
+        self.optimize_interval_seconds = env_float("OPTIMIZE_INTERVAL_SECONDS", 3600.0)
+
+        # 响应压缩：列表和统计响应不小于COMPRESSION_MIN_SIZE字节时按Accept-Encoding压缩
+        self.compression_enabled = env_bool("COMPRESSION_ENABLED", True)
+        self.compression_min_size = env_int("COMPRESSION_MIN_SIZE", 1024)
+        # 各算法的压缩级别：gzip 1~9，brotli 0~11，zstd 1~22
+        self.compression_gzip_level = env_int("COMPRESSION_GZIP_LEVEL", 6)
+        self.compression_brotli_level = env_int("COMPRESSION_BROTLI_LEVEL", 5)
+        self.compression_zstd_level = env_int("COMPRESSION_ZSTD_LEVEL", 3)
+
+        # 写接口的幂等键(Idempotency-Key)：保存首次执行的响应，重试时原样返回
+        self.idempotency_enabled = env_bool("IDEMPOTENCY_ENABLED", True)
+        self.idempotency_ttl_seconds = env_float("IDEMPOTENCY_TTL_SECONDS", 86400.0)
+        # 每个进程在内存中保存的响应数，超出时按LRU淘汰（数据库中的记录不受影响）
+        self.idempotency_max_entries = env_int("IDEMPOTENCY_MAX_ENTRIES", 10000)
+        # 相同键的请求执行中时，重复请求最多等待的秒数，超时返回409
+        self.idempotency_wait_seconds = env_float("IDEMPOTENCY_WAIT_SECONDS", 30.0)
+        # 执行中的记录超过该秒数仍未完成（进程崩溃）时可被重试的请求接管
+        self.idempotency_lock_seconds = env_float("IDEMPOTENCY_LOCK_SECONDS", 300.0)
+
+        # 内存读模型：列表和详情请求直接从内存返回，写操作提交后同步
+        self.read_model_enabled = env_bool("READ_MODEL_ENABLED", False)
+
+        # 导出/导入每批处理的行数
+        self.transfer_batch_size = env_int("TRANSFER_BATCH_SIZE", 1000)
+
+        # 请求剖析与指标
+        self.metrics_enabled = env_bool("METRICS_ENABLED", True)
+        self.slow_query_ms = env_float("SLOW_QUERY_MS", 100.0)
+        # 同一条SQL在一个请求内执行次数达到该值时视为疑似N+1
+        self.n_plus_one_threshold = env_int("N_PLUS_ONE_THRESHOLD", 10)
+        # ?profile=1 采样剖析会暴露内部调用栈，默认关闭
+        self.profile_enabled = env_bool("PROFILE_ENABLED", False)
+        self.profile_interval_ms = env_float("PROFILE_INTERVAL_MS", 1.0)
+        # ?explain=1 返回列表查询的SQL和查询计划，默认关闭
+        self.explain_enabled = env_bool("EXPLAIN_ENABLED", False)
+
+
+settings = Settings()
@@ -1,26 +1,159 @@
 """
 数据库配置和连接管理
 """
-from sqlalchemy import create_engine
+from fastapi import Depends
+from sqlalchemy import Column, Integer, String, Table, create_engine, event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
-import os
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.schema import CreateIndex, CreateTable
+from typing import Dict, List, Optional
+import hashlib
+import time
+
+from .config import Settings, settings
+from .profiling import record_query
+from .workspaces import get_workspace
+
+# 数据库连接地址（可通过环境变量DATABASE_URL修改）
+DATABASE_URL = settings.database_url
+
+
+def to_async_url(url: str) -> str:
+    """
+    由同步连接地址推导异步驱动地址
+    """
+    if url.startswith("sqlite://"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    return url
+
+
+# 异步驱动访问同一个数据库
+ASYNC_DATABASE_URL = settings.async_database_url or to_async_url(DATABASE_URL)
+
+
+def sqlite_pragmas(config: Settings) -> List[str]:
+    """
+    返回配置档对应的连接级PRAGMA语句
+    """
+    if config.db_profile == "baseline":
+        return [f"busy_timeout={config.sqlite_busy_timeout_ms}"]
+    return [
+        # 新建数据库时生效（须在建表前设置），空闲页可由维护任务增量归还给文件系统；
+        # 已有数据库需执行一次 python -m app.maintenance --vacuum 转换
+        "auto_vacuum=INCREMENTAL",
+        "journal_mode=WAL",  # 读写互不阻塞
+        f"synchronous={config.sqlite_synchronous}",  # WAL下NORMAL仅在检查点时fsync
+        f"mmap_size={config.sqlite_mmap_size}",
+        f"cache_size=-{config.sqlite_cache_size_kb}",  # 负数表示KB
+        f"busy_timeout={config.sqlite_busy_timeout_ms}",  # 写锁冲突时等待而不是立即报错
+        "temp_store=MEMORY",
+    ]
+
+
+def configure_sqlite(sync_engine, config: Settings = settings) -> None:
+    """
+    在每个新连接上执行PRAGMA
+    """
+    pragmas = sqlite_pragmas(config)
+
+    @event.listens_for(sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(f"PRAGMA {pragma}")
+        cursor.close()
+
+
+def instrument_engine(sync_engine) -> None:
+    """
+    记录每条SQL的执行耗时，计入当前请求的统计并检查慢查询
+    """
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        record_query(statement, time.perf_counter() - context._query_started, executemany)
+
+
+def build_engine(url: str, config: Settings = settings):
+    """
+    按配置创建同步引擎
+    """
+    if not url.startswith("sqlite"):
+        sync_engine = create_engine(
+            url, pool_size=config.db_pool_size, max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout
+        )
+        instrument_engine(sync_engine)
+        return sync_engine
+    sync_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},  # SQLite特有配置
+        poolclass=QueuePool,
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout,
+    )
+    configure_sqlite(sync_engine, config)
+    instrument_engine(sync_engine)
+    return sync_engine
+
+
+def build_async_engine(url: str, config: Settings = settings):
+    """
+    按配置创建异步引擎
+
+    aiosqlite默认不使用连接池，每个会话都会新建连接和后台线程，这里显式启用连接池
+    """
+    if not url.startswith("sqlite"):
+        async_engine = create_async_engine(
+            url, pool_size=config.db_pool_size, max_overflow=config.db_max_overflow,
+            pool_timeout=config.db_pool_timeout
+        )
+        instrument_engine(async_engine.sync_engine)
+        return async_engine
+    async_engine = create_async_engine(
+        url,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_timeout=config.db_pool_timeout,
+    )
+    configure_sqlite(async_engine.sync_engine, config)
+    instrument_engine(async_engine.sync_engine)
+    return async_engine
 
-# 数据库文件路径
-DATABASE_URL = "sqlite:///./todos.db"
 
 # 创建数据库引擎
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}  # SQLite特有配置
-)
+engine = build_engine(DATABASE_URL)
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 创建异步数据库引擎，供API路由使用，查询期间不阻塞事件循环
+async_engine = build_async_engine(ASYNC_DATABASE_URL)
+
+# 创建异步会话工厂；提交后不过期对象，避免在响应序列化时触发隐式IO
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 # 创建基础模型类
 Base = declarative_base()
 
+# 已应用的表结构哈希，init_db据此跳过未变化的表结构；随todos一起由drop_all删除
+schema_info = Table(
+    "schema_info",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("hash", String(64), nullable=False),
+)
+
 def get_db():
     """
     获取数据库会话
@@ -31,9 +164,118 @@ def get_db():
     finally:
         db.close()
 
-def init_db():
+async def get_shard(workspace: str = Depends(get_workspace)):
+    """
+    获取请求的工作空间所在的分片；未开启分片时为默认数据库
+    """
+    from .sharding import shard_router  # 避免循环导入
+
+    return await shard_router.route(workspace)
+
+def get_async_sessionmaker(shard=Depends(get_shard)):
+    """
+    获取异步会话工厂，供需要自行管理会话生命周期的流式响应使用
+    """
+    return shard.session_factory
+
+async def get_async_db(session_factory: async_sessionmaker = Depends(get_async_sessionmaker)):
+    """
+    获取异步数据库会话
+    """
+    async with session_factory() as db:
+        yield db
+
+def upgrade_existing_tables(connection) -> None:
+    """
+    为已有的表补充模型中新增的列和索引（SQLite的create_all不会修改已存在的表）
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for table in Base.metadata.sorted_tables:
+        existing = {row[1] for row in connection.exec_driver_sql(f"PRAGMA table_info({table.name})")}
+        if not existing:
+            continue
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(connection.dialect)}"
+            if column.server_default is not None:
+                default = column.server_default.arg
+                if isinstance(default, str):
+                    default = "'" + default.replace("'", "''") + "'"
+                ddl += f" DEFAULT {default}"
+            if not column.nullable:
+                ddl += " NOT NULL"
+            connection.exec_driver_sql(ddl)
+        for name in table.info.get("retired_indexes", ()):
+            connection.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+_schema_hashes: Dict[str, str] = {}
+
+def schema_hash(dialect) -> str:
     """
-    初始化数据库表
+    当前代码的表结构哈希：模型的建表和索引语句、已废弃的索引，以及全文索引、统计汇总表、变更日志和幂等键表的DDL
+    """
+    if dialect.name not in _schema_hashes:
+        from .changelog import CREATE_CHANGELOG  # 避免循环导入
+        from .idempotency import CREATE_IDEMPOTENCY
+        from .search import CREATE_FTS_TABLE, CREATE_FTS_TRIGGERS
+        from .stats import CREATE_STATS_TABLES, CREATE_STATS_TRIGGERS
+
+        statements = []
+        for table in Base.metadata.sorted_tables:
+            statements.append(str(CreateTable(table).compile(dialect=dialect)))
+            statements.extend(
+                str(CreateIndex(index).compile(dialect=dialect))
+                for index in sorted(table.indexes, key=lambda index: index.name)
+            )
+            statements.extend(f"DROP INDEX {name}" for name in table.info.get("retired_indexes", ()))
+        if dialect.name == "sqlite":
+            statements += [
+                CREATE_FTS_TABLE, *CREATE_FTS_TRIGGERS, *CREATE_STATS_TABLES, *CREATE_STATS_TRIGGERS,
+                *CREATE_CHANGELOG, *CREATE_IDEMPOTENCY,
+            ]
+        digest = hashlib.sha256()
+        for statement in statements:
+            digest.update(" ".join(statement.split()).encode("utf-8"))
+            digest.update(b"\0")
+        _schema_hashes[dialect.name] = digest.hexdigest()
+    return _schema_hashes[dialect.name]
+
+def applied_schema_hash(bind) -> Optional[str]:
+    """
+    数据库中记录的表结构哈希；新数据库或旧版本创建的数据库返回None
+    """
+    try:
+        with bind.connect() as connection:
+            return connection.execute(schema_info.select().with_only_columns(schema_info.c.hash)).scalar()
+    except DBAPIError:
+        return None
+
+def init_db(bind=None) -> bool:
+    """
+    初始化数据库表、全文索引、统计汇总表、变更日志及幂等键表；bind为空时使用默认数据库
+
+    数据库中记录的表结构哈希与当前代码一致时只需一次读取，不开启写事务；返回是否执行了建表和升级
     """
-    Base.metadata.create_all(bind=engine)
+    from .changelog import ensure_changelog  # 避免循环导入
+    from .idempotency import ensure_idempotency
+    from .search import ensure_search_index
+    from .stats import ensure_stats
 
+    bind = bind if bind is not None else engine
+    expected = schema_hash(bind.dialect)
+    if applied_schema_hash(bind) == expected:
+        return False
+    Base.metadata.create_all(bind=bind)
+    with bind.begin() as connection:
+        upgrade_existing_tables(connection)
+        ensure_search_index(connection)
+        ensure_stats(connection)
+        ensure_changelog(connection)
+        ensure_idempotency(connection)
+        connection.execute(schema_info.delete())
+        connection.execute(schema_info.insert().values(id=1, hash=expected))
+    return True
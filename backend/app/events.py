@@ -0,0 +1,166 @@
+"""
+待办事项变更事件广播
+
+写操作提交后发布一条变更事件，序号与todos表版本号一致。
+每个订阅者拥有独立的有界队列，消费过慢导致队列写满时，订阅者会收到reset事件并被断开，
+由客户端重新加载列表后再订阅；最近的事件保存在环形缓冲区中，用于断线重连后按序号续传。
+"""
+import asyncio
+import json
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from .config import settings
+
+RESET_EVENT = "reset"
+CHANGE_EVENT = "change"
+
+
+class ChangeEvent:
+    """
+    一次写操作对应的变更事件
+    """
+
+    __slots__ = ("seq", "event", "data")
+
+    def __init__(self, seq: int, event: str, data: Dict[str, Any]):
+        self.seq = seq
+        self.event = event
+        self.data = data
+
+    def encode(self, epoch: str) -> str:
+        """
+        编码为SSE消息，id格式为 {epoch}-{seq}
+        """
+        payload = json.dumps({"seq": self.seq, **self.data}, ensure_ascii=False, separators=(",", ":"))
+        return f"id: {epoch}-{self.seq}\nevent: {self.event}\ndata: {payload}\n\n"
+
+
+class Subscriber:
+    """
+    事件订阅者
+    """
+
+    def __init__(self, queue_size: int):
+        self.queue: "asyncio.Queue[ChangeEvent]" = asyncio.Queue(maxsize=queue_size)
+        self.overflowed = False
+        # 溢出后收到的最新序号，reset事件携带该序号，客户端重新加载后从这里续传
+        self.reset_seq = 0
+
+    def offer(self, event: ChangeEvent) -> None:
+        """
+        非阻塞投递事件；队列已满时标记溢出，后续事件不再投递
+        """
+        if self.overflowed:
+            self.reset_seq = event.seq
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            self.reset_seq = event.seq
+
+    async def next_event(self, timeout: float) -> Optional[ChangeEvent]:
+        """
+        等待下一个事件，超时返回None；溢出后返回reset事件
+        """
+        if self.overflowed and self.queue.empty():
+            return ChangeEvent(self.reset_seq, RESET_EVENT, {"reason": "overflow"})
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventHub:
+    """
+    进程内变更事件广播中心
+    """
+
+    def __init__(self, history_size: int, queue_size: int):
+        self.queue_size = queue_size
+        self.history: Deque[ChangeEvent] = deque(maxlen=history_size)
+        self.subscribers: Set[Subscriber] = set()
+        self.last_seq = 0
+
+    def publish(self, seq: int, data: Dict[str, Any], event_type: str = CHANGE_EVENT) -> ChangeEvent:
+        """
+        发布变更事件；影响范围无法逐条描述的写操作（如导入）发布reset事件，客户端收到后重新加载
+        """
+        event = ChangeEvent(seq, event_type, data)
+        self.last_seq = seq
+        self.history.append(event)
+        for subscriber in list(self.subscribers):
+            subscriber.offer(event)
+        return event
+
+    def reset(self, seq: int) -> None:
+        """
+        清空缓冲区并从seq重新开始计数，已缓存的事件序号不再有效时调用
+        """
+        self.history.clear()
+        self.last_seq = seq
+
+    def subscribe(self, since: Optional[int] = None) -> Subscriber:
+        """
+        新建订阅；since为上次收到的序号，缓冲区仍覆盖时补发之后的事件，否则先发送reset
+        """
+        subscriber = Subscriber(self.queue_size)
+        if since is not None:
+            oldest = self.history[0].seq if self.history else self.last_seq + 1
+            if since + 1 < oldest and since < self.last_seq:
+                subscriber.offer(ChangeEvent(self.last_seq, RESET_EVENT, {"reason": "history_expired"}))
+            else:
+                for event in self.history:
+                    if event.seq > since:
+                        subscriber.offer(event)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """
+        取消订阅
+        """
+        self.subscribers.discard(subscriber)
+
+
+def parse_event_id(value: Optional[str], epoch: str) -> Optional[int]:
+    """
+    解析Last-Event-ID或since参数，返回序号；epoch与当前数据库不一致时返回-1，表示需要重新加载
+    """
+    if not value:
+        return None
+    event_epoch, _, seq = value.rpartition("-")
+    try:
+        seq_number = int(seq)
+    except ValueError:
+        return -1
+    if event_epoch and event_epoch != epoch:
+        return -1
+    return seq_number
+
+
+def change_payload(
+    upserted: Optional[List[Dict[str, Any]]] = None,
+    deleted: Optional[List[int]] = None,
+    cleared: Optional[str] = None,
+    workspace: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    构造变更事件数据: upserted为新增或更新后的记录，deleted为删除的ID，
+    cleared为集合删除的范围（completed | all）；workspace为空的事件推送给所有订阅者
+    """
+    return {"workspace": workspace, "upserted": upserted or [], "deleted": deleted or [], "cleared": cleared}
+
+
+def visible_to(event: ChangeEvent, workspace: str) -> bool:
+    """
+    事件是否推送给订阅该工作空间的客户端；同一分片中其他工作空间的变更不推送
+    """
+    return event.data.get("workspace") in (None, workspace)
+
+
+event_hub = EventHub(
+    history_size=settings.events_history_size,
+    queue_size=settings.events_queue_size,
+)
@@ -0,0 +1,183 @@
+"""
+列表查询的筛选与排序
+
+排序参数形如 sort=-updated_at,title：逗号分隔的字段名，前缀 - 表示倒序，字段必须在白名单 SORT_FIELDS 内。
+最后自动追加id作为决胜键（方向与最后一个字段相同），保证游标分页稳定。
+日期字段以数据库中的原始文本比较和编码进游标，与 ORDER BY 的比较规则一致。
+
+筛选与排序的每种组合都有可用的复合索引（见 models.Todo），
+开启 EXPLAIN_ENABLED 后请求带 ?explain=1 返回 EXPLAIN QUERY PLAN，用于确认没有退化为全表扫描。
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from sqlalchemy import Integer, Select, String, and_, literal, or_, text, tuple_, type_coerce
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import ColumnElement
+
+from .models import Todo
+
+# 允许排序的字段；日期按原始文本比较
+SORT_FIELDS = {
+    "created_at": type_coerce(Todo.created_at, String),
+    "updated_at": type_coerce(Todo.updated_at, String),
+    "title": Todo.title,
+    "completed": type_coerce(Todo.completed, Integer),
+}
+DEFAULT_SORT = "-created_at"
+MAX_SORT_FIELDS = 3
+# 数据库中时间戳的文本格式（CURRENT_TIMESTAMP，UTC）
+DB_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class InvalidQueryError(ValueError):
+    """筛选或排序参数无效"""
+
+
+class SortKey(NamedTuple):
+    """排序键：字段名及是否倒序"""
+    field: str
+    descending: bool
+
+    @property
+    def column(self) -> ColumnElement:
+        return Todo.id if self.field == "id" else SORT_FIELDS[self.field]
+
+
+def parse_sort(sort: Optional[str]) -> List[SortKey]:
+    """
+    解析排序参数，返回追加了id决胜键的排序键列表
+    """
+    keys: List[SortKey] = []
+    for part in (sort or DEFAULT_SORT).split(","):
+        part = part.strip()
+        field = part.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise InvalidQueryError(f"不支持的排序字段: {field or part}，可选: {', '.join(sorted(SORT_FIELDS))}")
+        if field in (key.field for key in keys):
+            raise InvalidQueryError(f"排序字段重复: {field}")
+        keys.append(SortKey(field, part.startswith("-")))
+    if len(keys) > MAX_SORT_FIELDS:
+        raise InvalidQueryError(f"排序字段最多 {MAX_SORT_FIELDS} 个")
+    keys.append(SortKey("id", keys[-1].descending))
+    return keys
+
+
+def format_sort(keys: Sequence[SortKey]) -> str:
+    """
+    排序键的规范形式（不含id），用作缓存键
+    """
+    return ",".join(f"{'-' if key.descending else ''}{key.field}" for key in keys if key.field != "id")
+
+
+def order_by(keys: Sequence[SortKey]) -> List[ColumnElement]:
+    return [key.column.desc() if key.descending else key.column.asc() for key in keys]
+
+
+def validate_cursor_values(keys: Sequence[SortKey], values: Sequence[Any]) -> None:
+    """
+    游标中的值与排序字段类型不符时抛出InvalidQueryError
+    """
+    for key, value in zip(keys, values):
+        expected = int if key.field in ("id", "completed") else str
+        if not isinstance(value, expected) or isinstance(value, bool) and expected is int:
+            raise InvalidQueryError("分页游标与排序参数不匹配")
+
+
+def after_cursor(keys: Sequence[SortKey], values: Sequence[Any]) -> ColumnElement:
+    """
+    排在游标之后的行；所有字段同向时使用行值比较，可直接走复合索引
+    """
+    bounds = [literal(value, key.column.type) for key, value in zip(keys, values)]
+    if len({key.descending for key in keys}) == 1:
+        columns, cursor = tuple_(*(key.column for key in keys)), tuple_(*bounds)
+        return columns < cursor if keys[0].descending else columns > cursor
+    # 方向不一致时展开为: k1 越过 或 (k1相等 且 k2越过) 或 ...
+    conditions = []
+    for i, key in enumerate(keys):
+        beyond = key.column < bounds[i] if key.descending else key.column > bounds[i]
+        conditions.append(and_(*(keys[j].column == bounds[j] for j in range(i)), beyond))
+    return or_(*conditions)
+
+
+def to_utc(value: datetime) -> datetime:
+    """
+    转换为数据库中保存的不带时区的UTC时间；带时区的时间先换算为UTC，不带时区的视为UTC
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_db_timestamp(value: datetime) -> str:
+    """
+    转换为数据库中的时间戳文本，时区处理同 to_utc
+    """
+    return to_utc(value).strftime(DB_TIMESTAMP_FORMAT)
+
+
+def title_prefix_condition(prefix: str) -> ColumnElement:
+    """
+    标题前缀匹配（区分大小写），改写为范围条件以便使用标题索引
+    """
+    condition = Todo.title >= prefix
+    upper = prefix_upper_bound(prefix)
+    if upper is not None:
+        condition = and_(condition, Todo.title < upper)
+    return condition
+
+
+def prefix_upper_bound(prefix: str) -> Optional[str]:
+    """
+    以prefix开头的字符串的上界：去掉末尾的最大码位后把最后一个字符加1，跳过代理区（无法编码为UTF-8）；
+    全部是最大码位时没有上界，返回None
+    """
+    stripped = prefix.rstrip(chr(0x10FFFF))
+    if not stripped:
+        return None
+    last = ord(stripped[-1]) + 1
+    if 0xD800 <= last <= 0xDFFF:
+        last = 0xE000
+    return stripped[:-1] + chr(last)
+
+
+def apply_filters(
+    query: Select,
+    completed: Optional[bool] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    updated_since: Optional[datetime] = None,
+    title_prefix: Optional[str] = None,
+) -> Select:
+    """
+    添加筛选条件：创建时间为 [created_after, created_before) 区间，更新时间不早于updated_since
+    """
+    if completed is not None:
+        query = query.where(Todo.completed == completed)
+    if created_after is not None:
+        query = query.where(SORT_FIELDS["created_at"] >= to_db_timestamp(created_after))
+    if created_before is not None:
+        query = query.where(SORT_FIELDS["created_at"] < to_db_timestamp(created_before))
+    if updated_since is not None:
+        query = query.where(SORT_FIELDS["updated_at"] >= to_db_timestamp(updated_since))
+    if title_prefix:
+        query = query.where(title_prefix_condition(title_prefix))
+    return query
+
+
+async def explain_query_plan(db: AsyncSession, query: Select) -> Dict[str, Any]:
+    """
+    返回查询的SQL及 EXPLAIN QUERY PLAN，并标出全表扫描和临时排序
+    """
+    compiled = query.compile(dialect=sqlite.dialect(paramstyle="named"))
+    result = await db.execute(text(f"EXPLAIN QUERY PLAN {compiled}"), compiled.params)
+    plan = [{"id": row[0], "parent": row[1], "detail": row[3]} for row in result]
+    details = [step["detail"] for step in plan]
+    return {
+        "sql": str(compiled),
+        "params": {name: str(value) for name, value in compiled.params.items()},
+        "plan": plan,
+        "full_scan": any(detail.startswith("SCAN todos") and "INDEX" not in detail for detail in details),
+        "temp_sort": any("TEMP B-TREE" in detail for detail in details),
+    }
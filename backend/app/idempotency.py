@@ -0,0 +1,371 @@
+"""
+写接口的幂等键
+
+移动端在网络不稳定时会重试写请求，写接口（POST/PUT/DELETE）因此接受 Idempotency-Key 请求头：
+- 第一次请求正常执行，响应（状态码、响应头、响应体）按 (工作空间, 键) 保存在本进程的内存LRU
+  （IDEMPOTENCY_MAX_ENTRIES 条）和所在数据库的 idempotency_keys 表中，保存 IDEMPOTENCY_TTL_SECONDS
+- 重试时直接返回保存的响应，不再执行写操作，响应带 Idempotent-Replayed: true 头
+- 同一个键的请求正在执行时，本进程的重复请求等待它完成，其他进程的重复请求轮询数据库，
+  超过 IDEMPOTENCY_WAIT_SECONDS 仍未完成时返回409
+- 同一个键用于不同的请求（方法、路径、查询参数或JSON请求体不同）时返回422
+- 执行失败（5xx、请求校验失败）时删除记录，客户端可以用同一个键重试；
+  执行中的进程崩溃留下的记录在 IDEMPOTENCY_LOCK_SECONDS 后可被重试的请求接管
+
+认领键的语句和写操作本身不在同一个事务中：写操作提交后、保存响应前进程崩溃时，重试会再执行一次。
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import Depends, Header, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from .cache import ResponseCache
+from .config import settings
+from .database import get_async_sessionmaker
+from .models import Todo
+from .workspaces import get_workspace
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TABLE = "idempotency_keys"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+# 等待其他进程执行中的请求时轮询数据库的间隔（秒）
+POLL_INTERVAL = 0.05
+# 每认领多少个键清理一次过期记录
+PRUNE_EVERY = 100
+# 保存的响应不包含这些头：长度由响应体决定，Server-Timing由中间件按本次请求生成
+SKIPPED_HEADERS = ("content-length", "server-timing")
+
+CREATE_IDEMPOTENCY = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {IDEMPOTENCY_TABLE} (
+        workspace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        fingerprint TEXT NOT NULL,
+        status_code INTEGER,
+        headers TEXT,
+        body BLOB,
+        created_at REAL NOT NULL,
+        PRIMARY KEY (workspace, key)
+    )
+    """,
+    f"CREATE INDEX IF NOT EXISTS ix_{IDEMPOTENCY_TABLE}_created_at ON {IDEMPOTENCY_TABLE} (created_at)",
+]
+
+# 插入执行中的记录（status_code为NULL）；已有记录过期，或执行中的记录超过锁定时间时改由本请求认领。
+# 影响行数为1表示认领成功
+CLAIM_SQL = text(
+    f"INSERT INTO {IDEMPOTENCY_TABLE} (workspace, key, fingerprint, created_at) "
+    f"VALUES (:workspace, :key, :fingerprint, :now) "
+    f"ON CONFLICT (workspace, key) DO UPDATE SET "
+    f"fingerprint = excluded.fingerprint, status_code = NULL, headers = NULL, body = NULL, "
+    f"created_at = excluded.created_at "
+    f"WHERE {IDEMPOTENCY_TABLE}.created_at < :expired "
+    f"OR ({IDEMPOTENCY_TABLE}.status_code IS NULL AND {IDEMPOTENCY_TABLE}.created_at < :abandoned)"
+)
+SELECT_SQL = text(
+    f"SELECT fingerprint, status_code, headers, body FROM {IDEMPOTENCY_TABLE} "
+    f"WHERE workspace = :workspace AND key = :key"
+)
+COMPLETE_SQL = text(
+    f"UPDATE {IDEMPOTENCY_TABLE} SET status_code = :status_code, headers = :headers, body = :body "
+    f"WHERE workspace = :workspace AND key = :key AND fingerprint = :fingerprint AND status_code IS NULL"
+)
+RELEASE_SQL = text(
+    f"DELETE FROM {IDEMPOTENCY_TABLE} "
+    f"WHERE workspace = :workspace AND key = :key AND fingerprint = :fingerprint AND status_code IS NULL"
+)
+PRUNE_SQL = text(f"DELETE FROM {IDEMPOTENCY_TABLE} WHERE created_at < :expired")
+
+
+def ensure_idempotency(connection: Connection) -> None:
+    """
+    创建幂等键表
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for statement in CREATE_IDEMPOTENCY:
+        connection.execute(text(statement))
+
+
+def drop_idempotency(connection: Connection) -> None:
+    """
+    删除幂等键表
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(text(f"DROP TABLE IF EXISTS {IDEMPOTENCY_TABLE}"))
+
+
+# 随todos表一起创建和删除
+event.listen(
+    Todo.__table__, "after_create",
+    lambda target, connection, **kw: ensure_idempotency(connection)
+)
+event.listen(
+    Todo.__table__, "before_drop",
+    lambda target, connection, **kw: drop_idempotency(connection)
+)
+
+
+class StoredResponse(NamedTuple):
+    """
+    保存的响应
+    """
+    fingerprint: str
+    status_code: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+
+    def replay(self) -> Response:
+        response = Response(content=self.body, status_code=self.status_code)
+        for name, value in self.headers:
+            response.headers.append(name, value)
+        response.headers[REPLAYED_HEADER] = "true"
+        return response
+
+
+class IdempotentReplay(Exception):
+    """
+    重试的请求：由IdempotentRoute直接返回保存的响应，不执行路由
+    """
+
+    def __init__(self, response: Response):
+        self.response = response
+
+
+class Claim(NamedTuple):
+    """
+    本请求认领的键，执行完成后保存响应或释放
+    """
+    store: "IdempotencyStore"
+    session_factory: async_sessionmaker
+    workspace: str
+    key: str
+    fingerprint: str
+
+    async def complete(self, response: Response) -> None:
+        await self.store.complete(self, response)
+
+    async def release(self) -> None:
+        await self.store.release(self)
+
+
+class IdempotencyStore:
+    """
+    幂等键的保存和等待：内存LRU + 数据库表，执行中的键在本进程内以Future通知等待者
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, wait_seconds: float, lock_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.wait_seconds = wait_seconds
+        self.lock_seconds = lock_seconds
+        self.responses = ResponseCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.replays = 0
+        self.waits = 0
+        self._in_flight: Dict[Tuple[str, str], "asyncio.Future[Optional[StoredResponse]]"] = {}
+        self._claims = 0
+
+    async def begin(
+        self, session_factory: async_sessionmaker, workspace: str, key: str, fingerprint: str
+    ) -> Claim:
+        """
+        认领键并返回Claim；已有保存的响应时抛出IdempotentReplay，其他请求执行中时等待它完成
+        """
+        deadline = time.monotonic() + self.wait_seconds
+        scope = (workspace, key)
+        waited = False
+        while True:
+            stored = self.responses.get(scope)
+            if stored is not None:
+                raise self._replay(stored, fingerprint)
+            future = self._in_flight.get(scope)
+            if future is not None:
+                # 本进程中同一个键的请求正在执行
+                self.waits += not waited
+                waited = True
+                try:
+                    await asyncio.wait_for(asyncio.shield(future), max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    raise HTTPException(status_code=409, detail="相同幂等键的请求仍在执行，请稍后重试")
+                continue
+
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[scope] = future
+            try:
+                claimed, stored = await self._claim(session_factory, workspace, key, fingerprint)
+            except BaseException:
+                self._finish(scope, None)
+                raise
+            if claimed:
+                return Claim(self, session_factory, workspace, key, fingerprint)
+            self._finish(scope, None)
+            if stored is not None and stored.fingerprint != fingerprint:
+                raise HTTPException(status_code=422, detail="幂等键已用于其他请求")
+            if stored is not None and stored.status_code is not None:
+                self.responses.set(scope, stored, self.responses.generation)
+                raise self._replay(stored, fingerprint)
+            # 其他进程正在执行，轮询直到完成；记录被删除（执行失败）时下一轮重新认领
+            self.waits += not waited
+            waited = True
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="相同幂等键的请求仍在执行，请稍后重试")
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _claim(
+        self, session_factory: async_sessionmaker, workspace: str, key: str, fingerprint: str
+    ) -> Tuple[bool, Optional[StoredResponse]]:
+        now = time.time()
+        params = {"workspace": workspace, "key": key}
+        async with session_factory() as db:
+            self._claims += 1
+            if self._claims % PRUNE_EVERY == 0:
+                await db.execute(PRUNE_SQL, {"expired": now - self.ttl_seconds})
+            result = await db.execute(CLAIM_SQL, {
+                **params, "fingerprint": fingerprint, "now": now,
+                "expired": now - self.ttl_seconds, "abandoned": now - self.lock_seconds,
+            })
+            if result.rowcount:
+                await db.commit()
+                return True, None
+            row = (await db.execute(SELECT_SQL, params)).first()
+            await db.commit()
+        if row is None:
+            return False, None
+        headers = [tuple(pair) for pair in json.loads(row.headers)] if row.headers else []
+        return False, StoredResponse(row.fingerprint, row.status_code, headers, row.body)
+
+    def _replay(self, stored: StoredResponse, fingerprint: str) -> Exception:
+        if stored.fingerprint != fingerprint:
+            return HTTPException(status_code=422, detail="幂等键已用于其他请求")
+        self.replays += 1
+        return IdempotentReplay(stored.replay())
+
+    def _finish(self, scope: Tuple[str, str], stored: Optional[StoredResponse]) -> None:
+        future = self._in_flight.pop(scope, None)
+        if future is not None and not future.done():
+            future.set_result(stored)
+
+    async def complete(self, claim: Claim, response: Response) -> None:
+        """
+        保存响应并唤醒等待的请求；写入数据库失败时只记录日志，本进程内仍可重放
+        """
+        scope = (claim.workspace, claim.key)
+        headers = [(name, value) for name, value in response.headers.items() if name not in SKIPPED_HEADERS]
+        stored = StoredResponse(claim.fingerprint, response.status_code, headers, bytes(response.body))
+        self.responses.set(scope, stored, self.responses.generation)
+        self._finish(scope, stored)
+        try:
+            async with claim.session_factory() as db:
+                await db.execute(COMPLETE_SQL, {
+                    "workspace": claim.workspace, "key": claim.key, "fingerprint": claim.fingerprint,
+                    "status_code": stored.status_code, "headers": json.dumps(headers), "body": stored.body,
+                })
+                await db.commit()
+        except Exception as e:
+            logger.warning("保存幂等键 %s 的响应失败: %s", claim.key, e)
+
+    async def release(self, claim: Claim) -> None:
+        """
+        执行失败：删除执行中的记录，等待的请求随后重新认领
+        """
+        try:
+            async with claim.session_factory() as db:
+                await db.execute(RELEASE_SQL, {
+                    "workspace": claim.workspace, "key": claim.key, "fingerprint": claim.fingerprint,
+                })
+                await db.commit()
+        except Exception as e:
+            logger.warning("释放幂等键 %s 失败: %s", claim.key, e)
+        finally:
+            self._finish((claim.workspace, claim.key), None)
+
+
+idempotency_store = IdempotencyStore(
+    ttl_seconds=settings.idempotency_ttl_seconds,
+    max_entries=settings.idempotency_max_entries,
+    wait_seconds=settings.idempotency_wait_seconds,
+    lock_seconds=settings.idempotency_lock_seconds,
+)
+
+
+async def request_fingerprint(request: Request) -> str:
+    """
+    方法、路径、查询参数和JSON请求体的摘要；流式的导入请求体不参与
+    """
+    digest = hashlib.sha256()
+    digest.update(request.method.encode("utf-8"))
+    digest.update(request.url.path.encode("utf-8"))
+    digest.update(b"?" + "&".join(sorted(request.url.query.split("&"))).encode("utf-8"))
+    if (request.headers.get("content-type") or "").startswith("application/json"):
+        # 路由解析请求体时已读取并缓存，这里不会重复读取
+        digest.update(b"\0" + await request.body())
+    return digest.hexdigest()
+
+
+async def check_idempotency_key(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, description="幂等键：重试时携带相同的值，返回首次执行的响应"),
+    workspace: str = Depends(get_workspace),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker),
+) -> None:
+    """
+    写接口的依赖：认领幂等键，或对重试的请求抛出IdempotentReplay
+    """
+    if not idempotency_key or not settings.idempotency_enabled:
+        return
+    if len(idempotency_key) > MAX_KEY_LENGTH or not idempotency_key.isprintable():
+        raise HTTPException(status_code=400, detail=f"幂等键无效：最长{MAX_KEY_LENGTH}个可打印字符")
+    fingerprint = await request_fingerprint(request)
+    request.state.idempotency = await idempotency_store.begin(
+        session_factory, workspace, idempotency_key, fingerprint
+    )
+
+
+class IdempotentRoute(APIRoute):
+    """
+    支持幂等键的路由：重试时返回保存的响应；执行完成后保存响应（2xx、4xx），5xx和其他异常释放键
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            try:
+                response = await handler(request)
+            except IdempotentReplay as replay:
+                return replay.response
+            except HTTPException as e:
+                claim: Optional[Claim] = getattr(request.state, "idempotency", None)
+                if claim is None:
+                    raise
+                if e.status_code >= 500:
+                    await claim.release()
+                    raise
+                # 与默认的异常处理器返回相同的响应
+                response = JSONResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+                await claim.complete(response)
+                return response
+            except BaseException:
+                claim = getattr(request.state, "idempotency", None)
+                if claim is not None:
+                    await claim.release()
+                raise
+            claim = getattr(request.state, "idempotency", None)
+            if claim is not None:
+                if response.status_code >= 500 or not hasattr(response, "body"):
+                    await claim.release()
+                else:
+                    await claim.complete(response)
+            return response
+
+        return route_handler
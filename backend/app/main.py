@@ -1,16 +1,34 @@
 """
 FastAPI应用主入口
 """
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-from .database import init_db, engine
-from .models import Base
+from .compression import response_compressor
+from .database import engine
+from .idempotency import idempotency_store
+from .maintenance import ActivityMiddleware
+from .profiling import ProfilingMiddleware, TimedJSONResponse, registry, simple_metric
 from .routers import todos
+from .sharding import ensure_schema, shard_router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    工作进程启动时建表或校验表结构，从变更日志同步版本号和事件缓冲区，开始轮询其他进程的写入，并启动后台数据库维护；
+    开启分片时每个分片各自执行，之后创建的分片随即启动
 
-# 创建数据库表
-Base.metadata.create_all(bind=engine)
+    导入本模块不访问数据库，表结构哈希未变化时建表步骤只需一次读取
+    """
+    # 开启分片时各分片在第一次使用时建表
+    if not shard_router.enabled:
+        ensure_schema(engine)
+    shard_router.start()
+    yield
+    await shard_router.stop()
 
 # 创建FastAPI应用实例
 app = FastAPI(
@@ -18,7 +36,9 @@ app = FastAPI(
     description="一个简单而强大的待办事项管理系统",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=TimedJSONResponse,
+    lifespan=lifespan
 )
 
 # 配置CORS中间件
@@ -30,6 +50,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 请求剖析：Server-Timing响应头、/metrics指标、慢查询与N+1警告、?profile=1采样
+app.add_middleware(ProfilingMiddleware)
+
+# 记录请求活动，后台维护只在空闲时运行
+app.add_middleware(ActivityMiddleware)
+
 # 注册路由
 app.include_router(todos.router)
 
@@ -50,14 +76,50 @@ async def root():
 @app.get("/health")
 async def health_check():
     """
-    健康检查端点
+    健康检查端点，附带数据库文件大小、后台维护进度和读模型状态；开启分片时列出本进程已创建的各分片
     """
-    return JSONResponse(
-        content={
-            "status": "healthy",
-            "message": "服务运行正常"
-        }
+    content = {"status": "healthy", "message": "服务运行正常"}
+    if shard_router.enabled:
+        content["shards"] = [shard.status() for shard in shard_router.shards()]
+    else:
+        status = shard_router.default.status()
+        content["database"] = status["database"]
+        content["maintenance"] = status["maintenance"]
+        content["read_model"] = status["read_model"]
+    return JSONResponse(content=content)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """
+    Prometheus文本格式的指标
+    """
+    shards = shard_router.shards()
+    
+    def total(value) -> int:
+        return sum(value(shard) for shard in shards)
+    
+    body = registry.render()
+    body += simple_metric("response_cache_hits_total", "响应缓存命中次数", total(lambda s: s.cache.hits), "counter")
+    body += simple_metric("response_cache_misses_total", "响应缓存未命中次数", total(lambda s: s.cache.misses), "counter")
+    body += simple_metric("events_subscribers", "SSE订阅者数", total(lambda s: len(s.events.subscribers)))
+    body += simple_metric("write_batches_total", "合并提交的事务数", total(lambda s: s.writer.batches), "counter")
+    body += simple_metric("write_batch_operations_total", "合并提交的写操作数", total(lambda s: s.writer.operations), "counter")
+    body += simple_metric("maintenance_purged_total", "清除的软删除记录数", total(lambda s: s.maintenance.purged), "counter")
+    body += simple_metric(
+        "maintenance_vacuumed_pages_total", "增量VACUUM归还的页数", total(lambda s: s.maintenance.vacuumed_pages), "counter"
+    )
+    body += simple_metric(
+        "compression_responses_total", "压缩后返回的响应数（含复用缓存的压缩结果）",
+        response_compressor.compressed + response_compressor.reused, "counter"
     )
+    body += simple_metric("compression_reused_total", "复用缓存的压缩结果的响应数", response_compressor.reused, "counter")
+    body += simple_metric("compression_bytes_in_total", "压缩前的响应字节数", response_compressor.bytes_in, "counter")
+    body += simple_metric("compression_bytes_out_total", "压缩后的响应字节数", response_compressor.bytes_out, "counter")
+    body += simple_metric("idempotency_replays_total", "按幂等键重放的响应数", idempotency_store.replays, "counter")
+    body += simple_metric("idempotency_waits_total", "等待相同幂等键的请求完成的次数", idempotency_store.waits, "counter")
+    body += simple_metric("read_model_rows", "内存读模型中的记录数", total(lambda s: len(s.store.table)))
+    body += simple_metric("shards_open", "本进程已创建的分片数", len(shards))
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
 
 if __name__ == "__main__":
     import uvicorn
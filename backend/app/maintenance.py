@@ -0,0 +1,307 @@
+"""
+后台数据库维护
+
+删除只写入软删除标记（deleted_at），既不会因为一次大删除长时间持有写锁阻塞其他请求，
+也不会在数据库文件中留下大量碎片。维护任务每隔 MAINTENANCE_INTERVAL_SECONDS 检查一次，
+只在最近 MAINTENANCE_IDLE_MS 内没有新请求时工作；每一步都是很短的独立事务，期间一旦有请求到达就让出：
+
+1. 清除：按 PURGE_BATCH_SIZE 分批硬删除超过 TOMBSTONE_RETENTION_SECONDS 的软删除记录
+   （全文索引由删除触发器同步，统计数据在软删除时已经扣除）
+2. 整理全文索引：FTS5删除记录时只写入删除标记，清除后以增量方式合并索引段，
+   每步处理约 VACUUM_STEP_PAGES 页，真正移除已删除的条目
+3. 增量VACUUM：每次归还 VACUUM_STEP_PAGES 个空闲页，数据库文件随之缩小
+4. ANALYZE：清除的行数累计达到 ANALYZE_THRESHOLD 后更新查询规划器的统计信息；
+   另外每隔 OPTIMIZE_INTERVAL_SECONDS 执行一次 PRAGMA optimize
+
+进度和数据库文件大小由 /health 返回。多个工作进程各自运行维护任务，清除语句可重复执行；
+开启分片时每个分片各有一个维护任务，共用同一个空闲判断。
+增量VACUUM要求数据库为 auto_vacuum=INCREMENTAL：新建的数据库会自动设置，
+已有的数据库需执行一次完整VACUUM转换（期间阻塞所有写入，应在停机维护时执行）：
+
+    python -m app.maintenance --vacuum
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Callable, Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .config import settings
+from .search import FTS_TABLE
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA auto_vacuum 的取值
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+INCREMENTAL = 2
+
+# 不计为业务请求的路径：负载均衡的健康检查不应妨碍维护任务判断空闲
+IGNORED_PATHS = ("/health", "/metrics")
+
+PURGE_SQL = text(
+    "DELETE FROM todos WHERE id IN ("
+    "SELECT id FROM todos WHERE deleted_at IS NOT NULL AND deleted_at <= datetime('now', :retention) "
+    "ORDER BY deleted_at LIMIT :limit)"
+)
+TOMBSTONES_SQL = text("SELECT count(*) FROM todos WHERE deleted_at IS NOT NULL")
+# 负数表示增量optimize：把所有索引段逐步合并为一个，每次最多写入约|pages|页
+MERGE_SQL = text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rank) VALUES ('merge', :pages)")
+CHANGES_SQL = text("SELECT total_changes()")
+
+
+class DatabaseMaintenance:
+    """
+    空闲时执行的数据库维护任务
+    """
+
+    # 最近一次业务请求的时间（time.monotonic），由ActivityMiddleware更新，所有实例共用
+    last_request = 0.0
+
+    def __init__(
+        self,
+        interval: float,
+        idle_ms: float,
+        retention_seconds: float,
+        purge_batch_size: int,
+        vacuum_step_pages: int,
+        analyze_threshold: int,
+        optimize_interval: float,
+    ):
+        self.interval = interval
+        self.idle_seconds = idle_ms / 1000
+        self.retention_seconds = retention_seconds
+        self.purge_batch_size = purge_batch_size
+        self.vacuum_step_pages = vacuum_step_pages
+        self.analyze_threshold = analyze_threshold
+        self.optimize_interval = optimize_interval
+        self.state = "waiting"
+        self.runs = 0
+        self.purged = 0
+        self.vacuumed_pages = 0
+        self.tombstones: Optional[int] = None
+        self.pages: Dict[str, Any] = {}
+        self.last_run_at: Optional[float] = None
+        self.last_analyze_at: Optional[float] = None
+        self.last_optimize_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._unanalyzed = 0
+        self._unmerged = 0
+        self._next_optimize = time.monotonic() + optimize_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def idle(self) -> bool:
+        """
+        最近 MAINTENANCE_IDLE_MS 内是否没有新请求
+        """
+        return time.monotonic() - self.last_request >= self.idle_seconds
+
+    def start(self, session_factory: async_sessionmaker) -> None:
+        """
+        启动后台维护；间隔为0时不运行
+        """
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop(session_factory))
+
+    async def stop(self) -> None:
+        """
+        停止后台维护
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self, session_factory: async_sessionmaker) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self.idle():
+                continue
+            try:
+                await self.run_once(session_factory)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning("数据库维护失败: %s", e)
+            finally:
+                self.state = "waiting"
+
+    async def run_once(self, session_factory: async_sessionmaker, force: bool = False) -> None:
+        """
+        执行一轮维护；force为True时不检查空闲，执行到没有可做的工作为止
+        """
+        busy: Callable[[], bool] = (lambda: False) if force else (lambda: not self.idle())
+        async with session_factory() as db:
+            self.state = "purging"
+            while not busy():
+                if await self._purge(db) < self.purge_batch_size:
+                    break
+            self.tombstones = (await db.execute(TOMBSTONES_SQL)).scalar_one()
+
+            self.state = "compacting"
+            while self._unmerged and not busy():
+                if not await self._merge_step(db):
+                    self._unmerged = 0
+
+            self.state = "vacuuming"
+            await self._read_pages(db)
+            incremental = self.pages["auto_vacuum"] == AUTO_VACUUM_MODES[INCREMENTAL]
+            while incremental and self.pages["freelist_count"] and not busy():
+                if not await self._vacuum_step(db):
+                    break
+
+            self.state = "analyzing"
+            if self._unanalyzed >= self.analyze_threshold and not busy():
+                await db.execute(text("PRAGMA analysis_limit=1000"))
+                await db.execute(text("ANALYZE todos"))
+                await db.commit()
+                self._unanalyzed = 0
+                self.last_analyze_at = time.time()
+            if (force or time.monotonic() >= self._next_optimize) and not busy():
+                await db.execute(text("PRAGMA optimize"))
+                await db.commit()
+                self._next_optimize = time.monotonic() + self.optimize_interval
+                self.last_optimize_at = time.time()
+        self.state = "waiting"
+        self.runs += 1
+        self.last_run_at = time.time()
+        self.last_error = None
+
+    async def _purge(self, db: AsyncSession) -> int:
+        """
+        硬删除一批过期的软删除记录并提交，返回删除行数
+        """
+        result = await db.execute(
+            PURGE_SQL, {"retention": f"-{self.retention_seconds} seconds", "limit": self.purge_batch_size}
+        )
+        await db.commit()
+        self.purged += result.rowcount
+        self._unanalyzed += result.rowcount
+        self._unmerged += result.rowcount
+        return result.rowcount
+
+    async def _merge_step(self, db: AsyncSession) -> bool:
+        """
+        合并一步全文索引段并提交，返回是否还有待合并的内容
+        """
+        # 同一事务内使用同一连接，total_changes的差值即本步写入的行数；小于2说明已无可合并的内容
+        before = (await db.execute(CHANGES_SQL)).scalar_one()
+        await db.execute(MERGE_SQL, {"pages": -self.vacuum_step_pages})
+        changes = (await db.execute(CHANGES_SQL)).scalar_one() - before
+        await db.commit()
+        return changes >= 2
+
+    async def _vacuum_step(self, db: AsyncSession) -> int:
+        """
+        归还一批空闲页，返回归还的页数
+        """
+        before = self.pages["freelist_count"]
+        await db.execute(text(f"PRAGMA incremental_vacuum({self.vacuum_step_pages})"))
+        await db.commit()
+        await self._read_pages(db)
+        freed = max(before - self.pages["freelist_count"], 0)
+        self.vacuumed_pages += freed
+        return freed
+
+    async def _read_pages(self, db: AsyncSession) -> None:
+        values = {}
+        for name in ("page_size", "page_count", "freelist_count", "auto_vacuum"):
+            values[name] = (await db.execute(text(f"PRAGMA {name}"))).scalar_one()
+        values["auto_vacuum"] = AUTO_VACUUM_MODES.get(values["auto_vacuum"], str(values["auto_vacuum"]))
+        self.pages = values
+
+    def status(self) -> Dict[str, Any]:
+        """
+        维护任务的进度
+        """
+        return {
+            "enabled": self._task is not None,
+            "state": self.state,
+            "runs": self.runs,
+            "tombstones": self.tombstones,
+            "purged": self.purged,
+            "vacuumed_pages": self.vacuumed_pages,
+            "last_run_at": self.last_run_at,
+            "last_analyze_at": self.last_analyze_at,
+            "last_optimize_at": self.last_optimize_at,
+            "last_error": self.last_error,
+        }
+
+
+def database_status(path: Optional[str], pages: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    数据库文件大小及最近一次维护时读取的页统计
+    """
+    status: Dict[str, Any] = {"size_bytes": None, "wal_size_bytes": None, **pages}
+    if path and path != ":memory:":
+        for key, name in (("size_bytes", path), ("wal_size_bytes", f"{path}-wal")):
+            try:
+                status[key] = os.path.getsize(name)
+            except OSError:
+                pass
+    return status
+
+
+class ActivityMiddleware:
+    """
+    ASGI中间件：记录最近一次业务请求的时间，维护任务据此判断是否空闲
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] not in IGNORED_PATHS:
+            DatabaseMaintenance.last_request = time.monotonic()
+        await self.app(scope, receive, send)
+
+
+maintenance = DatabaseMaintenance(
+    interval=settings.maintenance_interval_seconds,
+    idle_ms=settings.maintenance_idle_ms,
+    retention_seconds=settings.tombstone_retention_seconds,
+    purge_batch_size=settings.purge_batch_size,
+    vacuum_step_pages=settings.vacuum_step_pages,
+    analyze_threshold=settings.analyze_threshold,
+    optimize_interval=settings.optimize_interval_seconds,
+)
+
+
+def main():
+    """立即执行一轮维护，可选先转换为增量VACUUM模式"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="数据库维护")
+    parser.add_argument(
+        "--vacuum", action="store_true",
+        help="执行一次完整VACUUM并启用auto_vacuum=INCREMENTAL（阻塞所有写入）"
+    )
+    args = parser.parse_args()
+
+    from .database import init_db
+    from .sharding import shard_router
+
+    if not shard_router.enabled:
+        init_db()
+    # 开启分片时依次处理每个分片
+    for shard in shard_router.open_all():
+        label = "" if shard.index is None else f"分片 {shard.index}: "
+        if args.vacuum:
+            print(f"{label}正在执行完整VACUUM...")
+            with shard.engine.connect() as connection:
+                connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                connection.exec_driver_sql("VACUUM")
+        asyncio.run(shard.maintenance.run_once(shard.session_factory, force=True))
+        status = shard.status()["database"]
+        print(
+            f"✓ {label}清除 {shard.maintenance.purged} 条软删除记录，归还 {shard.maintenance.vacuumed_pages} 个空闲页；"
+            f"数据库文件 {status['size_bytes']} 字节，auto_vacuum={status['auto_vacuum']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
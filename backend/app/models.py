@@ -1,9 +1,10 @@
 """
 SQLAlchemy数据模型定义
 """
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime
-from sqlalchemy.sql import func
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Index, and_, case, null
+from sqlalchemy.sql import func, text
 from .database import Base
+from .workspaces import DEFAULT_WORKSPACE
 
 class Todo(Base):
     """
@@ -12,12 +13,57 @@ class Todo(Base):
     __tablename__ = "todos"
 
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    # 所属工作空间，所有查询都限定在请求的工作空间内
+    workspace = Column(String(64), nullable=False, default=DEFAULT_WORKSPACE, server_default=DEFAULT_WORKSPACE)
     title = Column(String(255), nullable=False, index=True)
     description = Column(Text, nullable=True)
     completed = Column(Boolean, default=False, nullable=False, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # 乐观并发控制：每次更新递增，更新时可要求与客户端持有的版本一致
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # 软删除标记：删除时只写入删除时间，由后台维护任务在空闲时分批清除
+    deleted_at = Column(DateTime(timezone=True), nullable=True)
+    # 完成时间：只在completed改变时写入（取消完成时清空），编辑其他字段不影响；统计按此计算完成日期
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # 所有查询都以工作空间为等值条件，排序和筛选索引均以workspace开头
+        # 游标分页的排序键，保证任意深度翻页都走索引
+        Index("ix_todos_ws_created_at_id", "workspace", "created_at", "id"),
+        Index("ix_todos_ws_completed_created_at_id", "workspace", "completed", "created_at", "id"),
+        # 按更新时间筛选/排序、按标题前缀筛选/排序，及按状态筛选后按更新时间或标题排序
+        Index("ix_todos_ws_updated_at_id", "workspace", "updated_at", "id"),
+        Index("ix_todos_ws_completed_updated_at_id", "workspace", "completed", "updated_at", "id"),
+        Index("ix_todos_ws_title_id", "workspace", "title", "id"),
+        Index("ix_todos_ws_completed_title_id", "workspace", "completed", "title", "id"),
+        # 只包含已软删除的行，维护任务据此查找待清除的记录
+        Index("ix_todos_deleted_at", "deleted_at", sqlite_where=text("deleted_at IS NOT NULL")),
+        # 被上面带workspace前缀的索引取代，升级已有数据库时删除
+        {"info": {"retired_indexes": (
+            "ix_todos_created_at_id", "ix_todos_completed_created_at_id", "ix_todos_updated_at_id",
+            "ix_todos_completed_updated_at_id", "ix_todos_completed_title_id",
+        )}},
+    )
 
     def __repr__(self):
         return f"<Todo(id={self.id}, title='{self.title}', completed={self.completed})>"
 
+
+# 未被软删除的记录，所有读写查询都应带上该条件
+NOT_DELETED = Todo.deleted_at.is_(None)
+
+
+def completed_at_for(completed: bool):
+    """
+    更新completed时一并写入的completed_at：状态改变时为当前时间（取消完成时为空），未改变时保持原值
+    """
+    return case((Todo.completed == completed, Todo.completed_at), else_=func.now() if completed else null())
+
+
+def in_workspace(workspace: str):
+    """
+    工作空间内未被软删除的记录
+    """
+    return and_(Todo.workspace == workspace, NOT_DELETED)
+
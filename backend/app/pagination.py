@@ -0,0 +1,48 @@
+"""
+游标分页工具
+
+游标是对当前页最后一行排序键（各排序字段的值，最后是id）的不透明编码，客户端只需原样回传。
+日期保存的是数据库中的原始文本，保证与 ORDER BY 的比较规则一致。
+"""
+import base64
+import json
+from typing import Any, List, Optional, Sequence
+
+# 单页默认与最大条数
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+
+class InvalidCursorError(ValueError):
+    """游标无法解析"""
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """
+    将排序键编码为URL安全的游标字符串
+    """
+    raw = json.dumps(list(values), separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int = 2) -> List[Any]:
+    """
+    解析游标，返回size个排序键的值，最后一个为id
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if not isinstance(values, list) or len(values) != size or not isinstance(values[-1], int):
+            raise ValueError(cursor)
+        return values
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError(f"无效的分页游标: {cursor}") from e
+
+
+def next_cursor(last_row: Optional[Sequence[Any]], has_more: bool) -> Optional[str]:
+    """
+    根据当前页最后一行的排序键生成下一页游标，没有更多数据时返回None
+    """
+    if not has_more or last_row is None:
+        return None
+    return encode_cursor(last_row)
@@ -0,0 +1,330 @@
+"""
+请求级性能剖析与指标
+
+- 每个请求记录SQL语句数、数据库耗时、序列化耗时和总耗时，通过Server-Timing响应头返回
+- 按路由累计为Prometheus文本格式的指标，由 /metrics 暴露
+- 单条SQL超过慢查询阈值、或同一条SQL在一个请求内重复执行过多（疑似N+1）时记录警告日志
+- 开启 PROFILE_ENABLED 后，请求带 ?profile=1 时以固定间隔采样所有线程的调用栈，
+  返回折叠格式（collapsed stacks）的文本，可直接交给 flamegraph.pl / speedscope 生成火焰图
+"""
+import logging
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+# 请求耗时直方图的分桶上限（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    """
+    单个请求的耗时统计
+    """
+
+    __slots__ = ("started", "db_count", "db_time", "serialize_time", "statements")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.statements: Counter = Counter()
+
+    @property
+    def total_time(self) -> float:
+        return time.perf_counter() - self.started
+
+    def server_timing(self) -> str:
+        """
+        生成Server-Timing响应头，耗时单位为毫秒；app为除数据库和序列化外的框架与业务代码耗时
+        """
+        total = self.total_time
+        app = max(total - self.db_time - self.serialize_time, 0.0)
+        return (
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.db_count} queries", '
+            f"ser;dur={self.serialize_time * 1000:.2f}, "
+            f"app;dur={app * 1000:.2f}, "
+            f"total;dur={total * 1000:.2f}"
+        )
+
+
+# 当前请求的统计对象；异步引擎在greenlet中执行SQL时会沿用请求的上下文
+current_metrics: ContextVar[Optional[RequestMetrics]] = ContextVar("current_metrics", default=None)
+
+
+def record_query(statement: str, seconds: float, executemany: bool = False) -> None:
+    """
+    记录一条SQL的执行耗时，由数据库引擎的事件钩子调用；
+    executemany一次写入多行，耗时与行数成正比，不参与慢查询判断
+    """
+    metrics = current_metrics.get()
+    if metrics is not None:
+        metrics.db_count += 1
+        metrics.db_time += seconds
+        metrics.statements[statement] += 1
+    if not executemany and seconds * 1000 >= settings.slow_query_ms:
+        registry.slow_queries += 1
+        logger.warning("慢查询 %.1f ms: %s", seconds * 1000, " ".join(statement.split())[:500])
+
+
+@contextmanager
+def measure_serialization() -> Iterator[None]:
+    """
+    将代码块的耗时计入当前请求的序列化耗时
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += time.perf_counter() - started
+
+
+class TimedJSONResponse(JSONResponse):
+    """
+    JSON响应，编码耗时计入序列化耗时；作为应用的默认响应类
+    """
+
+    def render(self, content) -> bytes:
+        with measure_serialization():
+            return super().render(content)
+
+
+class MetricsRegistry:
+    """
+    按 (方法, 路由) 累计的请求指标，输出Prometheus文本格式
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.requests: Dict[Tuple[str, str, int], int] = defaultdict(int)
+        self.duration_buckets: Dict[Tuple[str, str], List[int]] = {}
+        self.duration_sum: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.duration_count: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.db_queries: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.db_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.serialize_seconds: Dict[Tuple[str, str], float] = defaultdict(float)
+        self.slow_queries = 0
+        self.n_plus_one = 0
+
+    def observe(self, method: str, route: str, status: int, metrics: RequestMetrics, total: float) -> None:
+        key = (method, route)
+        with self.lock:
+            self.requests[(method, route, status)] += 1
+            counts = self.duration_buckets.setdefault(key, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if total <= bound:
+                    counts[index] += 1
+            self.duration_sum[key] += total
+            self.duration_count[key] += 1
+            self.db_queries[key] += metrics.db_count
+            self.db_seconds[key] += metrics.db_time
+            self.serialize_seconds[key] += metrics.serialize_time
+
+    def render(self) -> str:
+        lines: List[str] = []
+
+        def labels(method: str, route: str, **extra) -> str:
+            pairs = {"method": method, "route": route, **extra}
+            return ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs.items())
+
+        with self.lock:
+            lines += ["# HELP http_requests_total 请求总数", "# TYPE http_requests_total counter"]
+            for (method, route, status), value in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{{{labels(method, route, status=status)}}} {value}")
+
+            lines += [
+                "# HELP http_request_duration_seconds 请求耗时",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), counts in sorted(self.duration_buckets.items()):
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(
+                        f"http_request_duration_seconds_bucket{{{labels(method, route, le=bound)}}} {count}"
+                    )
+                total_count = self.duration_count[(method, route)]
+                lines.append(f'http_request_duration_seconds_bucket{{{labels(method, route, le="+Inf")}}} {total_count}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels(method, route)}}} {self.duration_sum[(method, route)]:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels(method, route)}}} {total_count}")
+
+            for name, help_text, values in (
+                ("db_queries_total", "执行的SQL语句数", self.db_queries),
+                ("db_query_seconds_total", "SQL执行耗时", self.db_seconds),
+                ("serialization_seconds_total", "响应序列化耗时", self.serialize_seconds),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (method, route), value in sorted(values.items()):
+                    lines.append(f"{name}{{{labels(method, route)}}} {value:g}")
+
+            lines += [
+                "# HELP db_slow_queries_total 超过慢查询阈值的SQL数",
+                "# TYPE db_slow_queries_total counter",
+                f"db_slow_queries_total {self.slow_queries}",
+                "# HELP db_n_plus_one_total 疑似N+1查询的请求数",
+                "# TYPE db_n_plus_one_total counter",
+                f"db_n_plus_one_total {self.n_plus_one}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def simple_metric(name: str, help_text: str, value: float, kind: str = "gauge") -> str:
+    """
+    输出单个无标签的指标
+    """
+    return f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n{name} {value:g}\n"
+
+
+registry = MetricsRegistry()
+
+
+class StackSampler:
+    """
+    采样分析器：后台线程按固定间隔读取所有线程的调用栈，按折叠格式累计
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """
+        折叠格式：每行为 "根帧;...;叶帧 采样次数"
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _short_path(filename: str) -> str:
+    parts = filename.replace("\\", "/").split("/")
+    return "/".join(parts[-2:])
+
+
+def _profile_requested(scope) -> bool:
+    if not settings.profile_enabled:
+        return False
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile")
+    return bool(values) and values[-1] not in ("0", "false", "")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI中间件：统计请求耗时，添加Server-Timing响应头，汇总到指标，并按需进行采样剖析
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.metrics_enabled:
+            await self.app(scope, receive, send)
+            return
+
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        sampler = StackSampler(settings.profile_interval_ms / 1000).start() if _profile_requested(scope) else None
+        status = 500
+        buffered: List[dict] = []
+
+        async def send_wrapper(message):
+            nonlocal status, sampler
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", metrics.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+                if sampler is not None and any(
+                    name == b"content-type" and value.startswith(b"text/event-stream") for name, value in headers
+                ):
+                    # 长连接不做剖析
+                    sampler.stop()
+                    sampler = None
+            if sampler is not None:
+                buffered.append(message)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_metrics.reset(token)
+            total = metrics.total_time
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            registry.observe(scope["method"], route_path, status, metrics, total)
+            self._warn_n_plus_one(scope, metrics)
+            if sampler is not None:
+                sampler.stop()
+
+        if sampler is not None:
+            await self._send_profile(send, sampler, metrics)
+
+    @staticmethod
+    def _warn_n_plus_one(scope, metrics: RequestMetrics) -> None:
+        if not metrics.statements:
+            return
+        statement, count = metrics.statements.most_common(1)[0]
+        if count >= settings.n_plus_one_threshold:
+            registry.n_plus_one += 1
+            logger.warning(
+                "疑似N+1查询: %s %s 中同一条SQL执行了 %d 次: %s",
+                scope["method"], scope["path"], count, " ".join(statement.split())[:500]
+            )
+
+    @staticmethod
+    async def _send_profile(send, sampler: StackSampler, metrics: RequestMetrics) -> None:
+        body = sampler.collapsed().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"server-timing", metrics.server_timing().encode("latin-1")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
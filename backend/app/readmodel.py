@@ -0,0 +1,409 @@
+"""
+待办事项的内存读模型
+
+开启 READ_MODEL_ENABLED 后，每个工作进程启动时把未删除的待办事项加载到内存（每个分片各一份），
+列表和详情请求直接从内存返回，不再查询SQLite，也不构建ORM对象：
+
+- 行按槽位存放在按列组织的数组中：id和版本号用array，完成状态用bytearray，文本用列表；
+  删除后的槽位放入空闲列表复用，id到槽位的映射为一个字典
+- 二级索引：每个工作空间的每种完成状态一个按 (created_at, id) 排序的槽位数组，
+  支持默认排序（created_at正序或倒序）、完成状态和创建时间区间筛选及游标分页；
+  按其他字段排序、按更新时间或标题前缀筛选仍查询SQLite
+- 日期编码为保持数据库文本顺序的整数存放在array中，排序、筛选和游标与SQLite路径一致，
+  两条路径生成的游标可以互相使用；遇到无法编码的日期文本时不启用读模型
+
+读模型由变更日志驱动（见 changelog.py）：本进程的写操作提交后立即同步（写穿），
+其他进程的写入在下一次轮询时应用。导入、分片迁移等reset事件使读模型失效，
+在下一次同步时从数据库重新加载，期间的请求回退到SQLite。
+"""
+import heapq
+import logging
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .events import CHANGE_EVENT, RESET_EVENT
+from .filters import SORT_FIELDS
+from .models import NOT_DELETED, Todo
+from .pagination import InvalidCursorError
+
+logger = logging.getLogger(__name__)
+
+# 按索引顺序读取，加载时每一行都追加在所属索引的末尾
+LOAD_QUERY = (
+    select(
+        Todo.id, Todo.workspace, Todo.title, Todo.description, Todo.completed,
+        SORT_FIELDS["created_at"], SORT_FIELDS["updated_at"], Todo.version,
+    )
+    .where(NOT_DELETED)
+    .order_by(Todo.workspace, SORT_FIELDS["created_at"], Todo.id)
+)
+LOAD_BATCH_SIZE = 10000
+
+# (title, description, id, completed, created_at, updated_at, version)，与 serialization.TODO_FIELDS 顺序一致
+Row = Tuple[str, Optional[str], int, bool, Optional[datetime], Optional[datetime], int]
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+# NULL排在所有时间之前
+NULL_TIMESTAMP = -(2 ** 63)
+
+
+def encode_timestamp(value: Optional[str]) -> int:
+    """
+    数据库中的时间文本编码为整数：微秒数*2，文本带小数部分时加1，整数顺序与文本顺序一致。
+    只接受CURRENT_TIMESTAMP和SQLAlchemy写入的格式，其他文本抛出ValueError
+    """
+    if value is None:
+        return NULL_TIMESTAMP
+    if len(value) not in (19, 26) or value[10] != " " or value[4] != "-" or value[13] != ":" or (
+        len(value) == 26 and value[19] != "."
+    ):
+        raise ValueError(f"无法识别的时间: {value}")
+    moment = datetime.fromisoformat(value)
+    return (moment - EPOCH) // MICROSECOND * 2 + (len(value) == 26)
+
+
+def decode_timestamp(value: int) -> Optional[datetime]:
+    return None if value == NULL_TIMESTAMP else EPOCH + timedelta(microseconds=value >> 1)
+
+
+def timestamp_text(value: int) -> Optional[str]:
+    """
+    还原数据库中的时间文本，用于生成游标
+    """
+    moment = decode_timestamp(value)
+    if moment is None:
+        return None
+    text = moment.strftime("%Y-%m-%d %H:%M:%S")
+    return f"{text}.{moment.microsecond:06d}" if value & 1 else text
+
+
+def event_timestamp(value: Optional[str]) -> int:
+    """
+    编码变更事件中的ISO时间（写操作取回的数据库默认值，不带小数部分）
+    """
+    return encode_timestamp(value.replace("T", " ", 1) if value else value)
+
+
+class TodoTable:
+    """
+    按列存放的待办事项及 (工作空间, 完成状态) 二级索引
+    """
+
+    def __init__(self):
+        self.slots: Dict[int, int] = {}
+        self.ids = array("q")
+        self.versions = array("q")
+        self.completed = bytearray()
+        self.workspaces: List[Optional[str]] = []
+        self.titles: List[Optional[str]] = []
+        self.descriptions: List[Optional[str]] = []
+        self.created = array("q")
+        self.updated = array("q")
+        self.free: List[int] = []
+        self.indexes: Dict[Tuple[str, bool], array] = {}
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def key(self, slot: int) -> Tuple[int, int]:
+        return self.created[slot], self.ids[slot]
+
+    def position(self, index: array, key: Tuple[Any, ...], right: bool = False) -> int:
+        """
+        二分查找key在索引中的位置；key可以只含编码后的created_at，表示该时间之前的位置
+        """
+        lo, hi = 0, len(index)
+        created, ids = self.created, self.ids
+        while lo < hi:
+            mid = (lo + hi) // 2
+            slot = index[mid]
+            current = (created[slot], ids[slot])
+            if current < key or (right and current == key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def add(
+        self, todo_id: int, workspace: str, title: str, description: Optional[str], completed: bool,
+        created: int, updated: int, version: int, ordered: bool = False
+    ) -> None:
+        """
+        添加一行，日期为编码后的整数；ordered为True表示按索引顺序加载，直接追加到索引末尾
+        """
+        # 同一工作空间的行共用一个名称字符串
+        workspace = sys.intern(workspace)
+        if self.free:
+            slot = self.free.pop()
+            self.ids[slot], self.versions[slot], self.completed[slot] = todo_id, version, completed
+            self.workspaces[slot], self.titles[slot], self.descriptions[slot] = workspace, title, description
+            self.created[slot], self.updated[slot] = created, updated
+        else:
+            slot = len(self.ids)
+            self.ids.append(todo_id)
+            self.versions.append(version)
+            self.completed.append(completed)
+            self.workspaces.append(workspace)
+            self.titles.append(title)
+            self.descriptions.append(description)
+            self.created.append(created)
+            self.updated.append(updated)
+        self.slots[todo_id] = slot
+        self._index_add(slot, ordered)
+
+    def _index_add(self, slot: int, ordered: bool = False) -> None:
+        name = (self.workspaces[slot], bool(self.completed[slot]))
+        index = self.indexes.get(name)
+        if index is None:
+            index = self.indexes[name] = array("q")
+        index.insert(len(index) if ordered else self.position(index, self.key(slot), right=True), slot)
+
+    def _index_remove(self, slot: int) -> None:
+        name = (self.workspaces[slot], bool(self.completed[slot]))
+        index = self.indexes[name]
+        del index[self.position(index, self.key(slot))]
+        if not index:
+            del self.indexes[name]
+
+    def upsert(self, workspace: str, data: Dict[str, Any]) -> None:
+        """
+        按变更事件中的记录新增或更新一行；created_at不会改变，已有的行保留加载时的值
+        """
+        slot = self.slots.get(data["id"])
+        if slot is None:
+            self.add(
+                data["id"], workspace, data["title"], data.get("description"), data["completed"],
+                event_timestamp(data["created_at"]), event_timestamp(data["updated_at"]), data["version"]
+            )
+            return
+        moved = self.workspaces[slot] != workspace or bool(self.completed[slot]) != data["completed"]
+        if moved:
+            self._index_remove(slot)
+            self.workspaces[slot], self.completed[slot] = workspace, data["completed"]
+        self.titles[slot], self.descriptions[slot] = data["title"], data.get("description")
+        self.updated[slot], self.versions[slot] = event_timestamp(data["updated_at"]), data["version"]
+        if moved:
+            self._index_add(slot)
+
+    def remove(self, todo_id: int) -> None:
+        """
+        删除一行，槽位留给之后新增的行
+        """
+        slot = self.slots.get(todo_id)
+        if slot is None:
+            return
+        self._index_remove(slot)
+        self._release(slot)
+
+    def clear(self, workspace: str, scope: str) -> None:
+        """
+        删除工作空间内已完成（completed）或全部（all）的行
+        """
+        statuses = (True,) if scope == "completed" else (True, False)
+        for completed in statuses:
+            for slot in self.indexes.pop((workspace, completed), ()):
+                self._release(slot)
+
+    def _release(self, slot: int) -> None:
+        del self.slots[self.ids[slot]]
+        self.workspaces[slot] = self.titles[slot] = self.descriptions[slot] = None
+        self.free.append(slot)
+
+    def row(self, slot: int) -> Row:
+        return (
+            self.titles[slot], self.descriptions[slot], self.ids[slot], bool(self.completed[slot]),
+            decode_timestamp(self.created[slot]), decode_timestamp(self.updated[slot]), self.versions[slot],
+        )
+
+    def scan(
+        self,
+        workspace: str,
+        completed: Optional[bool],
+        descending: bool,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        cursor: Optional[Tuple[int, int]] = None,
+    ) -> Iterator[int]:
+        """
+        按 (created_at, id) 顺序返回满足条件的槽位；未指定完成状态时合并两个索引
+        """
+        ranges = []
+        for status in ((False, True) if completed is None else (completed,)):
+            index = self.indexes.get((workspace, status))
+            if not index:
+                continue
+            lo = self.position(index, (created_after,)) if created_after is not None else 0
+            hi = self.position(index, (created_before,)) if created_before is not None else len(index)
+            if cursor is not None:
+                if descending:
+                    hi = min(hi, self.position(index, cursor))
+                else:
+                    lo = max(lo, self.position(index, cursor, right=True))
+            positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+            ranges.append(map(index.__getitem__, positions))
+        if len(ranges) == 1:
+            return ranges[0]
+        return heapq.merge(*ranges, key=self.key, reverse=descending)
+
+
+class TodoStore:
+    """
+    一个数据库（分片）的读模型；seq为已应用的变更日志序号，之前的日志不再重复应用
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.table = TodoTable()
+        self.seq = 0
+        self.loaded = False
+        self.stale = False
+        self.loads = 0
+        self.load_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        """
+        是否可以直接从内存返回数据
+        """
+        return self.enabled and self.loaded and not self.stale
+
+    def load(self, connection: Connection, seq: int) -> None:
+        """
+        从数据库加载全部未删除的记录；seq为加载前读取的变更日志序号
+        """
+        if self.enabled:
+            started = time.perf_counter()
+            self._replace(connection.execute(LOAD_QUERY), seq, started)
+
+    async def reload(self, db: AsyncSession, seq: int) -> None:
+        """
+        失效后重新加载；分批读取，期间不阻塞事件循环
+        """
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        rows: List[Any] = []
+        result = await db.stream(LOAD_QUERY.execution_options(yield_per=LOAD_BATCH_SIZE))
+        async for partition in result.partitions():
+            rows.extend(partition)
+        self._replace(rows, seq, started)
+
+    def _replace(self, rows: Iterable[Sequence[Any]], seq: int, started: float) -> None:
+        table = TodoTable()
+        try:
+            for todo_id, workspace, title, description, completed, created, updated, version in rows:
+                table.add(
+                    todo_id, workspace, title, description, completed,
+                    encode_timestamp(created), encode_timestamp(updated), version, ordered=True
+                )
+        except ValueError as e:
+            logger.warning("读模型加载失败，列表和详情请求将查询数据库: %s", e)
+            self.table = TodoTable()
+            self.loaded = False
+            return
+        self.table = table
+        self.seq = seq
+        self.loaded = True
+        self.stale = False
+        self.loads += 1
+        self.load_seconds = time.perf_counter() - started
+
+    def invalidate(self) -> None:
+        """
+        标记为失效，下一次同步时重新加载
+        """
+        self.stale = True
+
+    def apply(self, seq: int, event: str, data: Dict[str, Any]) -> None:
+        """
+        应用一条变更日志；加载时已包含的日志跳过
+        """
+        if not self.ready or seq <= self.seq:
+            return
+        self.seq = seq
+        if event == RESET_EVENT or data.get("workspace") is None:
+            self.invalidate()
+            return
+        if event != CHANGE_EVENT:
+            return
+        workspace = sys.intern(data["workspace"])
+        try:
+            for todo in data.get("upserted") or ():
+                self.table.upsert(workspace, todo)
+        except ValueError:
+            self.invalidate()
+            return
+        for todo_id in data.get("deleted") or ():
+            self.table.remove(todo_id)
+        if data.get("cleared"):
+            self.table.clear(workspace, data["cleared"])
+
+    def page(
+        self,
+        workspace: str,
+        completed: Optional[bool],
+        descending: bool,
+        created_after: Optional[str],
+        created_before: Optional[str],
+        cursor: Optional[Tuple[str, int]],
+        limit: Optional[int],
+    ) -> Tuple[List[Row], Optional[Tuple[Optional[str], int]], bool]:
+        """
+        返回一页记录、最后一行的排序键（日期为数据库原始文本）及是否还有更多数据；limit为空时返回全部
+        """
+        try:
+            after = encode_timestamp(cursor[0]) if cursor is not None else None
+        except ValueError as e:
+            raise InvalidCursorError(f"无效的分页游标: {cursor}") from e
+        table = self.table
+        slots = list(islice(
+            table.scan(
+                workspace,
+                completed,
+                descending,
+                encode_timestamp(created_after) if created_after is not None else None,
+                encode_timestamp(created_before) if created_before is not None else None,
+                (after, cursor[1]) if cursor is not None else None,
+            ),
+            None if limit is None else limit + 1,
+        ))
+        has_more = limit is not None and len(slots) > limit
+        slots = slots[:limit]
+        last_key = (timestamp_text(table.created[slots[-1]]), table.ids[slots[-1]]) if slots else None
+        return [table.row(slot) for slot in slots], last_key, has_more
+
+    def get(self, workspace: str, todo_id: int) -> Optional[Row]:
+        """
+        读取工作空间内的一条记录，不存在返回None
+        """
+        table = self.table
+        slot = table.slots.get(todo_id)
+        if slot is None or table.workspaces[slot] != workspace:
+            return None
+        return table.row(slot)
+
+    def status(self) -> Dict[str, Any]:
+        """
+        读模型的状态
+        """
+        return {
+            "enabled": self.enabled,
+            "ready": self.ready,
+            "rows": len(self.table),
+            "seq": self.seq,
+            "loads": self.loads,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
+
+
+todo_store = TodoStore(enabled=settings.read_model_enabled)
@@ -1,170 +1,839 @@
 """
 待办事项API路由
 """
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import (
+    String, and_, column, func, insert, literal, literal_column, or_, select, table, text,
+    true, update
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional, Union
 
-from ..database import get_db
-from ..models import Todo
+from ..cache import ITEM_NAMESPACE, LIST_NAMESPACE
+from ..compression import VARY_HEADER, Payload, response_compressor
+from ..config import settings
+from ..database import get_async_db, get_async_sessionmaker, get_shard
+from ..events import CHANGE_EVENT, RESET_EVENT, change_payload, parse_event_id, visible_to
+from ..filters import (
+    InvalidQueryError, SortKey, after_cursor, apply_filters, explain_query_plan, format_sort, order_by, parse_sort,
+    to_db_timestamp, validate_cursor_values
+)
+from ..idempotency import IdempotentRoute, check_idempotency_key
+from ..models import NOT_DELETED, Todo, completed_at_for, in_workspace
+from ..pagination import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursorError, decode_cursor, next_cursor
+)
+from ..search import (
+    FTS_TABLE, MARK_END, MARK_START, highlight, like_pattern, match_expression, split_terms
+)
+from ..profiling import measure_serialization
+from ..sharding import Shard
+from ..stats import read_stats
+from ..serialization import TODO_COLUMNS, encode_todo, encode_todos
+from ..transfer import (
+    CSV, MEDIA_TYPES, NDJSON, EXPORT_COLUMNS, InvalidImportError, detect_format, encode_batch,
+    group_by_keys, iter_records, validate_record
+)
+from ..versioning import etag_matches, parse_if_match, row_etag
+from ..workspaces import WORKSPACE_HEADER, get_workspace
+from ..writer import WriteOperation, WriteOutcome
 from ..schemas import (
     TodoCreate, TodoUpdate, TodoResponse, TodosResponse,
     TodoCreateResponse, TodoUpdateResponse, TodoDeleteResponse,
-    BatchDeleteResponse
+    BatchDeleteResponse, TodoBatchRequest, TodoBatchResponse, BatchOperationResult,
+    TodoSearchResponse, TodoSearchResult, TodoStatsResponse, TodoImportResponse
 )
 
-router = APIRouter(prefix="/api/v1", tags=["todos"])
+# 写接口带上幂等键依赖：重试时返回首次执行的响应（见 idempotency.py）
+router = APIRouter(prefix="/api/v1", tags=["todos"], route_class=IdempotentRoute)
+IDEMPOTENT = [Depends(check_idempotency_key)]
+
+# 要求客户端每次使用前都用ETag重新验证
+CACHE_CONTROL = "no-cache"
+# 可压缩的响应按工作空间和Accept-Encoding区分
+COMPRESSED_VARY = f"{WORKSPACE_HEADER}, {VARY_HEADER}"
+
+def _json_response(body: Union[bytes, Payload], etag: str, accept_encoding: Optional[str] = None) -> Response:
+    """
+    返回已序列化的JSON响应；传入Payload时按Accept-Encoding压缩（只用于弱ETag的响应）
+    """
+    if not isinstance(body, Payload):
+        return Response(
+            content=body,
+            media_type="application/json",
+            headers={"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": WORKSPACE_HEADER}
+        )
+    content, encoding = response_compressor.encode(body, accept_encoding)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": COMPRESSED_VARY}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type="application/json", headers=headers)
+
+def _not_modified(etag: str, vary: str = WORKSPACE_HEADER) -> Response:
+    """
+    返回304响应
+    """
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": vary}
+    )
+
+def _soft_delete(condition):
+    """
+    软删除满足条件的待办事项：只写入删除时间，记录由后台维护任务在空闲时分批清除
+    """
+    return (
+        update(Todo)
+        .where(condition, NOT_DELETED)
+        .values(deleted_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+
+def _todo_dict(todo: Todo) -> Dict[str, Any]:
+    """
+    将ORM对象转换为可JSON序列化的字典
+    """
+    return TodoResponse.model_validate(todo).model_dump(mode="json")
+
+async def _after_write(
+    shard: Shard,
+    db: AsyncSession,
+    change: Dict[str, Any],
+    todo_ids: Optional[List[int]] = None,
+    event_type: str = CHANGE_EVENT
+) -> None:
+    """
+    在写操作的事务中追加分片的变更日志并提交：所有进程据此递增表版本、使缓存失效、更新读模型并广播变更事件；
+    todo_ids为空表示影响范围未知，使所有详情缓存失效
+    """
+    await shard.feed.record(db, event_type, change, todo_ids)
+
+async def _execute_write(
+    shard: Shard, db: AsyncSession, session_factory: async_sessionmaker, operation: WriteOperation
+) -> Any:
+    """
+    执行单条写操作并返回结果：开启写合并时排队与同一分片的其他请求一起提交，否则在当前会话中单独提交
+    """
+    if settings.write_coalescing:
+        return await shard.writer.submit(session_factory, operation)
+    try:
+        outcome = await operation(db)
+    except HTTPException:
+        # 与写合并一致：操作被拒绝（如404）时立即回滚，不在响应返回前一直持有写锁
+        await db.rollback()
+        raise
+    await _after_write(shard, db, outcome.change, outcome.todo_ids, outcome.event_type)
+    return outcome.result
+
+def _served_by_store(
+    shard: Shard, sort_keys: List[SortKey], updated_since: Optional[datetime], title_prefix: Optional[str]
+) -> bool:
+    """
+    读模型是否可以回答该列表请求：只按创建时间排序，筛选条件限于完成状态和创建时间区间
+    """
+    return (
+        shard.store.ready
+        and updated_since is None
+        and not title_prefix
+        and [key.field for key in sort_keys] == ["created_at", "id"]
+    )
 
 @router.get("/todos", response_model=TodosResponse)
 async def get_todos(
     completed: Optional[bool] = Query(None, description="筛选完成状态"),
-    db: Session = Depends(get_db)
+    created_after: Optional[datetime] = Query(None, description="创建时间不早于（ISO 8601，不带时区视为UTC）"),
+    created_before: Optional[datetime] = Query(None, description="创建时间早于"),
+    updated_since: Optional[datetime] = Query(None, description="更新时间不早于"),
+    title_prefix: Optional[str] = Query(None, min_length=1, max_length=255, description="标题前缀（区分大小写）"),
+    sort: Optional[str] = Query(
+        None, max_length=100,
+        description="排序字段，逗号分隔，前缀-表示倒序，可选 created_at/updated_at/title/completed，默认 -created_at"
+    ),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="每页条数，不传则返回全部"),
+    cursor: Optional[str] = Query(None, description="上一页返回的next_cursor"),
+    explain: bool = Query(False, description="返回查询计划而不是数据（需开启EXPLAIN_ENABLED）"),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    获取所有待办事项
+    获取待办事项列表
+
+    支持按完成状态、创建时间区间、更新时间和标题前缀筛选，按白名单内的字段多级排序，
+    默认按 (created_at, id) 倒序；传入limit或cursor时使用游标分页，
+    每页只读取 limit+1 行，翻页深度不影响查询开销。
+    响应按工作空间和查询参数缓存，写操作后失效；ETag为分片的表版本号，未变化时直接返回304。
+    较大的响应按Accept-Encoding压缩，压缩结果随缓存条目保存。
+    只查询所需列，行元组直接编码为JSON，不构建ORM对象和Pydantic模型；
+    开启读模型时，按创建时间排序的请求直接从内存返回。
     """
     try:
-        query = db.query(Todo)
+        sort_keys = parse_sort(sort)
+    except InvalidQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if explain and not settings.explain_enabled:
+        raise HTTPException(status_code=403, detail="未开启查询计划调试（EXPLAIN_ENABLED）")
+    
+    # 先取版本号再查询：期间若有写入，ETag只会偏旧，客户端下次请求会拿到新数据
+    etag = shard.version.etag(f"-{workspace}")
+    if not explain and etag_matches(if_none_match, etag):
+        return _not_modified(etag, COMPRESSED_VARY)
+    
+    cache_key = (
+        LIST_NAMESPACE, workspace, completed, created_after, created_before, updated_since, title_prefix,
+        format_sort(sort_keys), limit, cursor
+    )
+    cached = None if explain else shard.cache.get(cache_key)
+    if cached is not None:
+        return _json_response(cached, etag, accept_encoding)
+    generation = shard.cache.generation
+    
+    try:
+        values = None
+        if cursor is not None:
+            values = decode_cursor(cursor, len(sort_keys))
+            validate_cursor_values(sort_keys, values)
+            limit = limit or DEFAULT_PAGE_SIZE
         
-        # 根据完成状态筛选
-        if completed is not None:
-            query = query.filter(Todo.completed == completed)
+        if not explain and _served_by_store(shard, sort_keys, updated_since, title_prefix):
+            rows, last_key, has_more = shard.store.page(
+                workspace,
+                completed,
+                sort_keys[0].descending,
+                to_db_timestamp(created_after) if created_after is not None else None,
+                to_db_timestamp(created_before) if created_before is not None else None,
+                tuple(values) if values is not None else None,
+                limit
+            )
+            payload = Payload(encode_todos(rows, next_cursor(last_key, has_more)))
+            shard.cache.set(cache_key, payload, generation)
+            return _json_response(payload, etag, accept_encoding)
         
-        todos = query.order_by(Todo.created_at.desc()).all()
+        # 额外查询各排序键（日期为数据库原始文本），用于生成下一页游标
+        query = select(
+            *TODO_COLUMNS, *(key.column.label(f"sort_{i}") for i, key in enumerate(sort_keys))
+        ).where(in_workspace(workspace))
+        query = apply_filters(query, completed, created_after, created_before, updated_since, title_prefix)
+        if values is not None:
+            query = query.where(after_cursor(sort_keys, values))
         
-        return TodosResponse(data=todos)
+        query = query.order_by(*order_by(sort_keys))
+        if limit is not None:
+            query = query.limit(limit + 1)
+        if explain:
+            return JSONResponse({"code": 200, "message": "success", "data": await explain_query_plan(db, query)})
+        
+        result = await db.execute(query)
+        if limit is None:
+            payload = Payload(encode_todos(result.all()))
+        else:
+            rows = result.all()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            last_row = tuple(rows[-1][len(TODO_COLUMNS):]) if rows else None
+            payload = Payload(encode_todos(rows, next_cursor(last_row, has_more)))
+        
+        shard.cache.set(cache_key, payload, generation)
+        return _json_response(payload, etag, accept_encoding)
+    except (InvalidCursorError, InvalidQueryError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取待办事项失败: {str(e)}")
 
-@router.post("/todos", response_model=TodoCreateResponse)
+@router.get("/todos/events")
+async def stream_todo_events(
+    request: Request,
+    since: Optional[str] = Query(None, description="从该事件ID之后续传，等同于Last-Event-ID"),
+    last_event_id: Optional[str] = Header(None),
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard)
+):
+    """
+    以Server-Sent Events推送工作空间内的待办事项变更
+
+    每个事件的id为 {epoch}-{seq}，客户端断线重连时通过Last-Event-ID续传；
+    无法续传（缓冲区已覆盖、服务重启或消费过慢）时发送reset事件，客户端应重新加载列表。
+    EventSource无法设置请求头，工作空间通过查询参数workspace指定。
+    """
+    events = shard.events
+    subscriber = events.subscribe(parse_event_id(since or last_event_id, shard.version.epoch))
+    
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                event = await subscriber.next_event(settings.events_keepalive_seconds)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                if not visible_to(event, workspace):
+                    continue
+                yield event.encode(shard.version.epoch)
+                if event.event == RESET_EVENT:
+                    break
+        finally:
+            events.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/todos/search", response_model=TodoSearchResponse)
+async def search_todos(
+    q: str = Query(..., min_length=1, max_length=200, description="搜索关键词，多个关键词以空格分隔"),
+    completed: Optional[bool] = Query(None, description="筛选完成状态"),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="每页条数"),
+    offset: int = Query(0, ge=0, le=10000, description="结果偏移量"),
+    workspace: str = Depends(get_workspace),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    全文搜索待办事项标题和描述
+
+    关键词之间为AND关系。不少于3个字符的关键词通过FTS5索引匹配，按bm25相关度排序（标题权重更高），
+    并返回带<mark>高亮的片段；更短的关键词退化为LIKE匹配。
+    """
+    indexed_terms, short_terms = split_terms(q)
+    if not indexed_terms and not short_terms:
+        raise HTTPException(status_code=400, detail="搜索关键词不能为空")
+    
+    try:
+        if indexed_terms:
+            fts = table(FTS_TABLE, column("rowid"))
+            fts_ref = literal_column(FTS_TABLE)
+            query = select(
+                *TODO_COLUMNS,
+                func.snippet(fts_ref, 0, MARK_START, MARK_END, "…", 16).label("title_snippet"),
+                func.snippet(fts_ref, 1, MARK_START, MARK_END, "…", 16).label("description_snippet"),
+                func.bm25(fts_ref, 10.0, 1.0).label("score")
+            ).select_from(
+                fts.join(Todo.__table__, Todo.id == fts.c.rowid)
+            ).where(
+                text(f"{FTS_TABLE} MATCH :match").bindparams(match=match_expression(indexed_terms))
+            ).order_by(text("score"), Todo.id.desc())
+        else:
+            query = select(
+                *TODO_COLUMNS,
+                literal(None, String).label("title_snippet"),
+                literal(None, String).label("description_snippet"),
+                literal(None).label("score")
+            ).order_by(Todo.created_at.desc(), Todo.id.desc())
+        
+        query = query.where(in_workspace(workspace))
+        for term in short_terms:
+            pattern = like_pattern(term)
+            query = query.where(or_(
+                Todo.title.like(pattern, escape="\\"), Todo.description.like(pattern, escape="\\")
+            ))
+        if completed is not None:
+            query = query.where(Todo.completed == completed)
+        
+        result = await db.execute(query.limit(limit + 1).offset(offset))
+        rows = result.all()
+        has_more = len(rows) > limit
+        
+        data = []
+        for row in rows[:limit]:
+            data.append(TodoSearchResult(
+                title=row.title,
+                description=row.description,
+                id=row.id,
+                completed=row.completed,
+                created_at=row.created_at,
+                updated_at=row.updated_at,
+                version=row.version,
+                title_snippet=highlight(row.title_snippet or row.title, short_terms),
+                description_snippet=highlight(row.description_snippet or row.description, short_terms),
+                score=row.score
+            ))
+        
+        return TodoSearchResponse(data=data, next_offset=offset + limit if has_more else None)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"搜索待办事项失败: {str(e)}")
+
+@router.get("/todos/stats", response_model=TodoStatsResponse)
+async def get_todo_stats(
+    days: int = Query(30, ge=1, le=366, description="直方图覆盖的天数（含今天）"),
+    if_none_match: Optional[str] = Header(None),
+    accept_encoding: Optional[str] = Header(None),
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    获取工作空间的待办事项统计：按状态计数，以及每天的创建数和完成数
+
+    数据来自触发器增量维护的汇总表，开销与待办事项总数无关；ETag为分片的表版本号。
+    """
+    etag = shard.version.etag(f"-{workspace}-stats-{days}")
+    if etag_matches(if_none_match, etag):
+        return _not_modified(etag, COMPRESSED_VARY)
+    
+    try:
+        stats = await read_stats(db, days, workspace)
+        with measure_serialization():
+            body = TodoStatsResponse(data=stats).model_dump_json().encode("utf-8")
+        return _json_response(Payload(body), etag, accept_encoding)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"获取统计数据失败: {str(e)}")
+
+@router.post("/todos", response_model=TodoCreateResponse, dependencies=IDEMPOTENT)
 async def create_todo(
     todo: TodoCreate,
-    db: Session = Depends(get_db)
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker)
 ):
     """
     创建新的待办事项
     """
-    try:
+    async def operation(session: AsyncSession) -> WriteOutcome:
         db_todo = Todo(
+            workspace=workspace,
             title=todo.title,
             description=todo.description,
             completed=False
         )
-        db.add(db_todo)
-        db.commit()
-        db.refresh(db_todo)
+        session.add(db_todo)
+        # INSERT ... RETURNING 已取回id和时间默认值，无需再次查询
+        await session.flush()
+        return WriteOutcome(
+            db_todo, change_payload(upserted=[_todo_dict(db_todo)], workspace=workspace), [db_todo.id]
+        )
+    
+    try:
+        db_todo = await _execute_write(shard, db, session_factory, operation)
         
         return TodoCreateResponse(data=db_todo)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"创建待办事项失败: {str(e)}")
 
-@router.delete("/todos/completed", response_model=BatchDeleteResponse)
-async def delete_completed_todos(db: Session = Depends(get_db)):
+@router.post("/todos:batch", response_model=TodoBatchResponse, dependencies=IDEMPOTENT)
+async def batch_todos(
+    batch: TodoBatchRequest,
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    批量删除已完成的待办事项
+    批量创建/更新/删除待办事项
+
+    所有操作在同一事务中执行：创建使用一条多行INSERT ... RETURNING，
+    每个更新是一条带工作空间、软删除和版本条件的UPDATE ... RETURNING，删除使用一条集合UPDATE写入软删除标记，
+    各项的状态码取决于语句实际影响的行，不依赖事务开始时读取的版本。
+    同一批次内按 创建 -> 更新 -> 删除 的顺序应用，结果按请求顺序逐项返回。
+    更新操作的data中带有version且与当前版本不一致时，该项返回409，其余操作照常执行。
+    同一条记录既被删除又被更新时，按分组顺序执行的结果与请求顺序不符，这些操作都返回409且不执行。
     """
     try:
-        completed_todos = db.query(Todo).filter(Todo.completed == True).all()
-        deleted_count = len(completed_todos)
+        creates = [(i, op) for i, op in enumerate(batch.operations) if op.op == "create"]
+        updates = [(i, op) for i, op in enumerate(batch.operations) if op.op == "update"]
+        deletes = [(i, op) for i, op in enumerate(batch.operations) if op.op == "delete"]
+        results: List[Optional[BatchOperationResult]] = [None] * len(batch.operations)
+        
+        # 同一记录的更新和删除相互冲突
+        ambiguous = {op.id for _, op in updates} & {op.id for _, op in deletes}
+        for i, op in updates + deletes:
+            if op.id in ambiguous:
+                results[i] = BatchOperationResult(
+                    index=i, op=op.op, status=409, id=op.id, error="同一批次中该待办事项既被更新又被删除"
+                )
+        updates = [(i, op) for i, op in updates if op.id not in ambiguous]
+        deletes = [(i, op) for i, op in deletes if op.id not in ambiguous]
         
-        for todo in completed_todos:
-            db.delete(todo)
+        target_ids = {op.id for _, op in updates + deletes}
         
-        db.commit()
+        if creates:
+            # 每行的键保持一致，才能合并为一条多行INSERT
+            created = await db.scalars(
+                insert(Todo).returning(Todo, sort_by_parameter_order=True),
+                [
+                    {
+                        "workspace": workspace, "title": op.data.title,
+                        "description": op.data.description, "completed": False
+                    }
+                    for _, op in creates
+                ]
+            )
+            for (i, _), todo in zip(creates, created.all()):
+                results[i] = BatchOperationResult(
+                    index=i, op="create", status=201, id=todo.id, data=todo
+                )
+        
+        # 按请求顺序逐条执行与单条更新相同的带条件UPDATE ... RETURNING：
+        # 版本检查和写入在同一条语句中完成，读取与写入之间提交的其他写操作不会被覆盖
+        for i, op in updates:
+            values = op.data.model_dump(exclude_unset=True, exclude={"version"})
+            if values.get("completed") is not None:
+                values["completed_at"] = completed_at_for(values["completed"])
+            stmt = (
+                update(Todo)
+                .where(Todo.id == op.id, in_workspace(workspace))
+                .values(**values, version=Todo.version + 1)
+                .returning(Todo)
+                .execution_options(synchronize_session=False, populate_existing=True)
+            )
+            if op.data.version is not None:
+                stmt = stmt.where(Todo.version == op.data.version)
+            todo = (await db.scalars(stmt)).first()
+            if todo is not None:
+                results[i] = BatchOperationResult(index=i, op="update", status=200, id=op.id, data=todo)
+                continue
+            current = await db.scalar(select(Todo.version).where(Todo.id == op.id, in_workspace(workspace)))
+            if current is None:
+                results[i] = BatchOperationResult(
+                    index=i, op="update", status=404, id=op.id, error="待办事项不存在"
+                )
+            else:
+                results[i] = BatchOperationResult(
+                    index=i, op="update", status=409, id=op.id, error=f"待办事项已被修改，当前版本为{current}"
+                )
+        
+        # 删除结果以实际软删除的行为准
+        delete_ids = set()
+        if deletes:
+            delete_ids = set((await db.scalars(
+                _soft_delete(and_(Todo.id.in_({op.id for _, op in deletes}), Todo.workspace == workspace))
+                .returning(Todo.id)
+            )).all())
+        for i, op in deletes:
+            if op.id in delete_ids:
+                results[i] = BatchOperationResult(index=i, op="delete", status=200, id=op.id)
+            else:
+                results[i] = BatchOperationResult(
+                    index=i, op="delete", status=404, id=op.id, error="待办事项不存在"
+                )
+        
+        await _after_write(
+            shard,
+            db,
+            change_payload(
+                upserted=[
+                    r.data.model_dump(mode="json") for r in results
+                    if r.data is not None and r.id not in delete_ids
+                ],
+                deleted=sorted(delete_ids),
+                workspace=workspace
+            ),
+            list(target_ids)
+        )
+        
+        return TodoBatchResponse(data=results)
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"批量操作失败: {str(e)}")
+
+async def _bulk_delete(
+    shard: Shard, db: AsyncSession, workspace: str, condition, scope: str, chunk_size: Optional[int]
+) -> int:
+    """
+    以集合操作软删除工作空间内满足条件的待办事项，返回删除行数
+
+    chunk_size为空时执行单条UPDATE；否则按批删除并逐批提交，
+    每批结束即释放SQLite写锁，避免长时间阻塞其他写请求。
+    scope为变更事件中的删除范围（completed | all）。
+    """
+    condition = and_(Todo.workspace == workspace, condition)
+    change = change_payload(cleared=scope, workspace=workspace)
+    if chunk_size is None:
+        result = await db.execute(_soft_delete(condition))
+        await _after_write(shard, db, change)
+        return result.rowcount
+
+    deleted_count = 0
+    while True:
+        batch_ids = select(Todo.id).where(condition, NOT_DELETED).limit(chunk_size).scalar_subquery()
+        result = await db.execute(_soft_delete(Todo.id.in_(batch_ids)))
+        await _after_write(shard, db, change)
+        deleted_count += result.rowcount
+        if result.rowcount < chunk_size:
+            return deleted_count
+
+@router.delete("/todos/completed", response_model=BatchDeleteResponse, dependencies=IDEMPOTENT)
+async def delete_completed_todos(
+    chunk_size: Optional[int] = Query(None, ge=1, le=100000, description="分批删除的每批行数，不传则一次删除"),
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    批量删除已完成的待办事项
+    """
+    try:
+        deleted_count = await _bulk_delete(shard, db, workspace, Todo.completed == True, "completed", chunk_size)
         
         return BatchDeleteResponse(
             message="已完成的待办事项删除成功",
             data={"deleted_count": deleted_count}
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"批量删除失败: {str(e)}")
 
-@router.delete("/todos/all", response_model=BatchDeleteResponse)
-async def delete_all_todos(db: Session = Depends(get_db)):
+@router.delete("/todos/all", response_model=BatchDeleteResponse, dependencies=IDEMPOTENT)
+async def delete_all_todos(
+    chunk_size: Optional[int] = Query(None, ge=1, le=100000, description="分批删除的每批行数，不传则一次删除"),
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    删除所有待办事项
+    删除工作空间内所有待办事项
     """
     try:
-        all_todos = db.query(Todo).all()
-        deleted_count = len(all_todos)
-        
-        for todo in all_todos:
-            db.delete(todo)
-        
-        db.commit()
+        deleted_count = await _bulk_delete(shard, db, workspace, true(), "all", chunk_size)
         
         return BatchDeleteResponse(
             message="所有待办事项删除成功",
             data={"deleted_count": deleted_count}
         )
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"删除所有待办事项失败: {str(e)}")
 
+@router.get("/todos/export")
+async def export_todos(
+    format: Literal["ndjson", "csv"] = Query(NDJSON, description="导出格式"),
+    completed: Optional[bool] = Query(None, description="筛选完成状态"),
+    workspace: str = Depends(get_workspace),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker)
+):
+    """
+    流式导出待办事项
+
+    按ID升序从服务端游标分批读取，每批编码后立即发送，内存占用与数据总量无关。
+    会话在生成器内部创建，直到最后一批发送完毕才关闭，导出内容是同一个读事务下的一致快照。
+    """
+    query = select(*EXPORT_COLUMNS).where(in_workspace(workspace)).order_by(Todo.id)
+    if completed is not None:
+        query = query.where(Todo.completed == completed)
+    batch_size = settings.transfer_batch_size
+    
+    async def stream():
+        async with session_factory() as db:
+            result = await db.stream(query.execution_options(yield_per=batch_size))
+            header = format == CSV
+            async for rows in result.partitions():
+                yield encode_batch(rows, format, header=header)
+                header = False
+            if header:
+                yield encode_batch([], format, header=True)
+    
+    return StreamingResponse(
+        stream(),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="todos.{format}"'}
+    )
+
+@router.post("/todos/import", response_model=TodoImportResponse, dependencies=IDEMPOTENT)
+async def import_todos(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = Query(None, description="导入格式，不传则按Content-Type判断"),
+    keep_ids: bool = Query(False, description="保留记录中的id（与已有记录冲突时导入失败）"),
+    content_type: Optional[str] = Header(None),
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    流式导入待办事项
+
+    请求体为NDJSON（每行一个对象）或带表头的CSV，字段与导出格式一致，只有title是必填的。
+    边接收边解析，每凑满一批执行一次批量INSERT并单独提交，写锁只在写入一批期间持有，
+    大量导入时不阻塞其他写请求和维护任务，WAL也能在批次之间检查点。
+    某条记录无效或写入失败时，所在批次回滚，之前已提交的批次保留，错误信息中给出已导入的条数，
+    客户端跳过这些记录后重试即可续传。
+    每批与一条变更日志一起提交，表版本号和列表、统计的缓存随每批更新，中途失败时已提交的批次同样可见；
+    导入结束（包括中途失败）后再发布一条reset事件，订阅的客户端和内存读模型据此重新加载。
+    逐批的日志不携带记录内容，开启读模型时导入的记录在reset之后才出现在读模型中。
+    """
+    fmt = detect_format(format, content_type)
+    batch_size = settings.transfer_batch_size
+    imported = 0
+    
+    async def flush(rows: List[Dict[str, Any]]) -> None:
+        nonlocal imported
+        for group in group_by_keys(rows):
+            await db.execute(insert(Todo), group)
+        # 只有新记录，不需要使详情缓存失效
+        await _after_write(
+            shard, db,
+            {**change_payload(workspace=workspace), "reason": "import", "imported": imported + len(rows)}, []
+        )
+        imported += len(rows)
+    
+    error: Optional[HTTPException] = None
+    try:
+        pending: List[Dict[str, Any]] = []
+        async for line, record in iter_records(request.stream(), fmt):
+            pending.append({**validate_record(line, record, keep_ids), "workspace": workspace})
+            if len(pending) >= batch_size:
+                await flush(pending)
+                pending = []
+        if pending:
+            await flush(pending)
+    except InvalidImportError as e:
+        error = HTTPException(status_code=400, detail=str(e))
+    except IntegrityError as e:
+        error = HTTPException(status_code=409, detail=f"导入失败，记录与已有数据冲突: {str(e.orig)}")
+    except Exception as e:
+        error = HTTPException(status_code=500, detail=f"导入待办事项失败: {str(e)}")
+    if error is not None:
+        await db.rollback()
+        if imported:
+            error.detail += f"（前 {imported} 条已导入）"
+    
+    try:
+        if imported:
+            await _after_write(
+                shard, db, {"workspace": workspace, "reason": "import", "imported": imported}, event_type=RESET_EVENT
+            )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"导入待办事项失败: {str(e)}")
+    if error is not None:
+        raise error
+    
+    return TodoImportResponse(message=f"成功导入 {imported} 条待办事项", data={"imported": imported})
+
 @router.get("/todos/{todo_id}", response_model=TodoResponse)
 async def get_todo(
     todo_id: int,
-    db: Session = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     获取单个待办事项
+
+    ETag为行版本号，可直接作为更新时的If-Match提交；开启读模型时直接从内存返回
     """
-    todo = db.query(Todo).filter(Todo.id == todo_id).first()
-    if not todo:
-        raise HTTPException(status_code=404, detail="待办事项不存在")
-    return todo
+    # 同一分片中的id唯一，缓存内容带上所属工作空间，其他工作空间的请求不命中
+    cache_key = (ITEM_NAMESPACE, todo_id)
+    cached = shard.cache.get(cache_key)
+    if cached is not None and cached[0] == workspace:
+        _, etag, body = cached
+        if etag_matches(if_none_match, etag):
+            return _not_modified(etag)
+        return _json_response(body, etag)
+    generation = shard.cache.generation
+    
+    if shard.store.ready:
+        row = shard.store.get(workspace, todo_id)
+        if row is None:
+            raise HTTPException(status_code=404, detail="待办事项不存在")
+        etag = row_etag(row[-1])
+        if etag_matches(if_none_match, etag):
+            return _not_modified(etag)
+        body = encode_todo(row)
+    else:
+        todo = await db.scalar(select(Todo).where(Todo.id == todo_id, in_workspace(workspace)))
+        if not todo:
+            raise HTTPException(status_code=404, detail="待办事项不存在")
+        
+        etag = row_etag(todo.version)
+        if etag_matches(if_none_match, etag):
+            return _not_modified(etag)
+        with measure_serialization():
+            body = TodoResponse.model_validate(todo).model_dump_json().encode("utf-8")
+    shard.cache.set(cache_key, (workspace, etag, body), generation)
+    return _json_response(body, etag)
 
-@router.put("/todos/{todo_id}", response_model=TodoUpdateResponse)
+@router.put("/todos/{todo_id}", response_model=TodoUpdateResponse, dependencies=IDEMPOTENT)
 async def update_todo(
     todo_id: int,
     todo_update: TodoUpdate,
-    db: Session = Depends(get_db)
+    if_match: Optional[str] = Header(None),
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker)
 ):
     """
     更新待办事项
+
+    请求体中的version或If-Match请求头（取值为详情接口返回的ETag）指定期望的当前版本，
+    版本不一致时返回409。更新和版本检查由一条 UPDATE ... WHERE id=? AND version=? RETURNING 完成，
+    成功后版本号加1
     """
+    update_data = todo_update.model_dump(exclude_unset=True, exclude={"version"})
+    if update_data.get("completed") is not None:
+        update_data["completed_at"] = completed_at_for(update_data["completed"])
+    expected = None
+    if todo_update.version is not None:
+        expected = {todo_update.version}
+    if if_match:
+        versions = parse_if_match(if_match)
+        if versions is not None:
+            expected = set(versions) if expected is None else expected & set(versions)
+    
+    async def operation(session: AsyncSession) -> WriteOutcome:
+        stmt = (
+            update(Todo)
+            .where(Todo.id == todo_id, in_workspace(workspace))
+            .values(**update_data, version=Todo.version + 1)
+            .returning(Todo)
+            .execution_options(synchronize_session=False, populate_existing=True)
+        )
+        if expected is not None:
+            stmt = stmt.where(Todo.version.in_(expected))
+        db_todo = (await session.scalars(stmt)).first()
+        if db_todo is None:
+            # 未更新任何行：区分记录不存在和版本冲突
+            current = await session.scalar(
+                select(Todo.version).where(Todo.id == todo_id, in_workspace(workspace))
+            )
+            if current is None:
+                raise HTTPException(status_code=404, detail="待办事项不存在")
+            raise HTTPException(status_code=409, detail=f"待办事项已被修改，当前版本为{current}")
+        return WriteOutcome(
+            db_todo, change_payload(upserted=[_todo_dict(db_todo)], workspace=workspace), [todo_id]
+        )
+    
     try:
-        db_todo = db.query(Todo).filter(Todo.id == todo_id).first()
-        if not db_todo:
-            raise HTTPException(status_code=404, detail="待办事项不存在")
-        
-        # 更新字段
-        update_data = todo_update.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(db_todo, field, value)
-        
-        db.commit()
-        db.refresh(db_todo)
+        db_todo = await _execute_write(shard, db, session_factory, operation)
         
         return TodoUpdateResponse(data=db_todo)
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"更新待办事项失败: {str(e)}")
 
-@router.delete("/todos/{todo_id}", response_model=TodoDeleteResponse)
+@router.delete("/todos/{todo_id}", response_model=TodoDeleteResponse, dependencies=IDEMPOTENT)
 async def delete_todo(
     todo_id: int,
-    db: Session = Depends(get_db)
+    workspace: str = Depends(get_workspace),
+    shard: Shard = Depends(get_shard),
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: async_sessionmaker = Depends(get_async_sessionmaker)
 ):
     """
-    删除单个待办事项
+    删除单个待办事项（软删除）
     """
-    try:
-        db_todo = db.query(Todo).filter(Todo.id == todo_id).first()
-        if not db_todo:
+    async def operation(session: AsyncSession) -> WriteOutcome:
+        deleted = await session.scalar(
+            _soft_delete(and_(Todo.id == todo_id, Todo.workspace == workspace)).returning(Todo.id)
+        )
+        if deleted is None:
             raise HTTPException(status_code=404, detail="待办事项不存在")
-        
-        db.delete(db_todo)
-        db.commit()
+        return WriteOutcome(None, change_payload(deleted=[todo_id], workspace=workspace), [todo_id])
+    
+    try:
+        await _execute_write(shard, db, session_factory, operation)
         
         return TodoDeleteResponse()
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"删除待办事项失败: {str(e)}")
-
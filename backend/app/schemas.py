@@ -2,9 +2,12 @@
 Pydantic数据验证模式
 """
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Annotated, Literal, Optional, Union
 from datetime import datetime
 
+# 单次批量请求允许的最大操作数
+MAX_BATCH_OPERATIONS = 10000
+
 class TodoBase(BaseModel):
     """待办事项基础模式"""
     title: str = Field(..., min_length=1, max_length=255, description="待办事项标题")
@@ -19,6 +22,7 @@ class TodoUpdate(BaseModel):
     title: Optional[str] = Field(None, min_length=1, max_length=255, description="待办事项标题")
     description: Optional[str] = Field(None, max_length=1000, description="详细描述")
     completed: Optional[bool] = Field(None, description="完成状态")
+    version: Optional[int] = Field(None, ge=1, description="期望的当前版本号，与数据库不一致时返回409")
 
 class TodoResponse(TodoBase):
     """待办事项响应模式"""
@@ -26,14 +30,54 @@ class TodoResponse(TodoBase):
     completed: bool
     created_at: datetime
     updated_at: datetime
+    version: int
 
     model_config = {"from_attributes": True}
 
+class TodoSearchResult(TodoResponse):
+    """搜索结果：在待办事项基础上附带高亮片段和相关度"""
+    title_snippet: Optional[str] = None
+    description_snippet: Optional[str] = None
+    score: Optional[float] = Field(None, description="bm25相关度，越小越相关")
+
+class TodoSearchResponse(BaseModel):
+    """搜索响应"""
+    code: int = 200
+    message: str = "success"
+    data: list[TodoSearchResult]
+    next_offset: Optional[int] = Field(None, description="下一页的offset，为空表示没有更多结果")
+
 class TodosResponse(BaseModel):
     """待办事项列表响应"""
     code: int = 200
     message: str = "success"
     data: list[TodoResponse]
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示没有更多数据")
+
+class TodoImportResponse(BaseModel):
+    """导入响应"""
+    code: int = 200
+    message: str = "Todos imported successfully"
+    data: dict = {"imported": 0}
+
+class DailyCount(BaseModel):
+    """单日计数"""
+    date: str = Field(..., description="日期（UTC），格式YYYY-MM-DD")
+    count: int
+
+class TodoStats(BaseModel):
+    """待办事项统计"""
+    total: int
+    active: int
+    completed: int
+    created_per_day: list[DailyCount]
+    completed_per_day: list[DailyCount]
+
+class TodoStatsResponse(BaseModel):
+    """统计响应"""
+    code: int = 200
+    message: str = "success"
+    data: TodoStats
 
 class TodoCreateResponse(BaseModel):
     """创建待办事项响应"""
@@ -58,3 +102,43 @@ class BatchDeleteResponse(BaseModel):
     message: str
     data: dict = {"deleted_count": 0}
 
+
+class BatchCreateOperation(BaseModel):
+    """批量操作：创建"""
+    op: Literal["create"]
+    data: TodoCreate
+
+class BatchUpdateOperation(BaseModel):
+    """批量操作：更新"""
+    op: Literal["update"]
+    id: int
+    data: TodoUpdate
+
+class BatchDeleteOperation(BaseModel):
+    """批量操作：删除"""
+    op: Literal["delete"]
+    id: int
+
+BatchOperation = Annotated[
+    Union[BatchCreateOperation, BatchUpdateOperation, BatchDeleteOperation],
+    Field(discriminator="op")
+]
+
+class TodoBatchRequest(BaseModel):
+    """批量写入请求"""
+    operations: list[BatchOperation] = Field(..., min_length=1, max_length=MAX_BATCH_OPERATIONS)
+
+class BatchOperationResult(BaseModel):
+    """单个批量操作的结果"""
+    index: int
+    op: str
+    status: int
+    id: Optional[int] = None
+    data: Optional[TodoResponse] = None
+    error: Optional[str] = None
+
+class TodoBatchResponse(BaseModel):
+    """批量写入响应"""
+    code: int = 200
+    message: str = "Batch applied successfully"
+    data: list[BatchOperationResult]
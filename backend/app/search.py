@@ -0,0 +1,133 @@
+"""
+基于SQLite FTS5的全文搜索
+
+todos_fts 是以 todos 为外部内容表的FTS5虚拟表，由触发器与 todos 保持同步。
+使用trigram分词器，支持中文等无空格语言的子串匹配；
+长度不足3个字符的关键词无法走trigram索引，退化为LIKE匹配。
+返回的片段是转义后的HTML，只有高亮标记 <mark> 是标签，标题和描述中的HTML原样显示为文本。
+"""
+import html
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+
+from .models import Todo
+
+FTS_TABLE = "todos_fts"
+# trigram分词器可索引的最短关键词长度
+MIN_INDEXED_LENGTH = 3
+# 高亮标记
+HIGHLIGHT_OPEN = "<mark>"
+HIGHLIGHT_CLOSE = "</mark>"
+# snippet函数在原文中插入的占位符，HTML转义之后再替换为高亮标记
+MARK_START = "\x02"
+MARK_END = "\x03"
+
+CREATE_FTS_TABLE = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    title, description, content='todos', content_rowid='id', tokenize='trigram'
+)
+"""
+
+CREATE_FTS_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_fts_ai AFTER INSERT ON todos BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_fts_ad AFTER DELETE ON todos BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todos_fts_au AFTER UPDATE OF title, description ON todos BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+
+def ensure_search_index(connection: Connection) -> None:
+    """
+    创建全文索引及同步触发器；索引表是新建的则从todos重建索引（用于已有数据的数据库）
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+    ).first()
+    connection.execute(text(CREATE_FTS_TABLE))
+    for statement in CREATE_FTS_TRIGGERS:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+FTS_TRIGGER_NAMES = ("todos_fts_ai", "todos_fts_ad", "todos_fts_au")
+
+
+def drop_search_index(connection: Connection) -> None:
+    """
+    删除全文索引及同步触发器；批量导入前调用，导入后由ensure_search_index一次性重建
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for name in FTS_TRIGGER_NAMES:
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+# 随todos表一起创建和删除
+event.listen(
+    Todo.__table__, "after_create",
+    lambda target, connection, **kw: ensure_search_index(connection)
+)
+event.listen(
+    Todo.__table__, "before_drop",
+    lambda target, connection, **kw: drop_search_index(connection)
+)
+
+
+def split_terms(query: str) -> Tuple[List[str], List[str]]:
+    """
+    将搜索词按空白拆分，返回 (可走trigram索引的关键词, 过短的关键词)
+    """
+    terms = [term for term in re.split(r"\s+", query.strip()) if term]
+    indexed = [term for term in terms if len(term) >= MIN_INDEXED_LENGTH]
+    short = [term for term in terms if len(term) < MIN_INDEXED_LENGTH]
+    return indexed, short
+
+
+def match_expression(terms: List[str]) -> str:
+    """
+    将关键词转换为FTS5 MATCH表达式：每个关键词作为短语加引号，多个关键词为AND关系
+    """
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+def like_pattern(term: str) -> str:
+    """
+    转义LIKE通配符
+    """
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def highlight(value: Optional[str], terms: List[str]) -> Optional[str]:
+    """
+    生成高亮片段：在Python侧为关键词加占位符（用于snippet函数无法覆盖的过短关键词，已有的高亮片段保持不变），
+    再对文本做HTML转义，最后把占位符替换为高亮标记
+    """
+    if not value:
+        return value
+    if terms:
+        alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+        pattern = re.compile(f"({MARK_START}.*?{MARK_END})|({alternatives})", flags=re.IGNORECASE | re.DOTALL)
+        value = pattern.sub(lambda m: m.group(1) or f"{MARK_START}{m.group(2)}{MARK_END}", value)
+    return html.escape(value).replace(MARK_START, HIGHLIGHT_OPEN).replace(MARK_END, HIGHLIGHT_CLOSE)
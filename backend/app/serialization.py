@@ -0,0 +1,58 @@
+"""
+列表响应的快速序列化
+
+直接将查询得到的列元组编码为JSON字节，不再逐行构建Pydantic模型。
+输出与 TodosResponse.model_dump_json() 保持一致（字段顺序、日期格式）。
+安装了orjson时使用orjson编码，否则回退到标准库json。
+"""
+import json
+from datetime import datetime
+from typing import Any, Iterable, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖
+    orjson = None
+
+from .models import Todo
+from .profiling import measure_serialization
+
+# 与 TodoResponse 的字段顺序一致
+TODO_FIELDS = ("title", "description", "id", "completed", "created_at", "updated_at", "version")
+TODO_COLUMNS = tuple(getattr(Todo, field) for field in TODO_FIELDS)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    编码为紧凑的UTF-8 JSON字节
+    """
+    with measure_serialization():
+        if orjson is not None:
+            return orjson.dumps(value)
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def encode_todos(
+    rows: Iterable[Sequence[Any]],
+    next_cursor: Optional[str] = None,
+    code: int = 200,
+    message: str = "success",
+) -> bytes:
+    """
+    将按TODO_FIELDS顺序排列的行编码为列表响应
+    """
+    data = [dict(zip(TODO_FIELDS, row)) for row in rows]
+    return dumps({"code": code, "message": message, "data": data, "next_cursor": next_cursor})
+
+
+def encode_todo(row: Sequence[Any]) -> bytes:
+    """
+    将按TODO_FIELDS顺序排列的一行编码为详情响应，与 TodoResponse.model_dump_json() 一致
+    """
+    return dumps(dict(zip(TODO_FIELDS, row)))
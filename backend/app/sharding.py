@@ -0,0 +1,493 @@
+"""
+按工作空间分片
+
+SQLite同一时间只允许一个写事务，所有工作空间共用一个数据库时写吞吐受限于单个写入者。
+设置 SHARD_COUNT 后，工作空间按名称的哈希（crc32 % SHARD_COUNT）分布到多个数据库文件
+（SHARD_URL，{shard}替换为分片序号），不同分片的写事务互不阻塞。
+每个分片在本进程中拥有独立的引擎和连接池、变更日志、表版本号、响应缓存、事件广播、
+写合并队列和后台维护任务，在第一次收到路由到该分片的请求时创建（建表并加载变更日志）。
+未设置 SHARD_COUNT 时只有一个默认分片，即 DATABASE_URL 指向的数据库。
+
+调整分片数时先停止服务，用管理工具迁移数据，再以新的 SHARD_COUNT 启动：
+
+    python -m app.sharding status                 # 各分片的文件大小和工作空间分布
+    python -m app.sharding split                  # 分片数翻倍，每个分片约一半的工作空间迁到新分片
+    python -m app.sharding rebalance --shards 8   # 按任意分片数重新分布
+    python -m app.sharding rebalance --shards 4 --source sqlite:///./todos.db   # 迁入未分片的数据库
+
+迁移的记录在目标分片中分配新的id（各分片的id独立递增），迁移后向涉及的分片追加reset事件，
+订阅的客户端会重新加载列表。
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from .cache import ResponseCache
+from .changelog import APPEND_SQL, ChangeFeed, change_feed
+from .config import settings
+from .database import (
+    AsyncSessionLocal, async_engine, build_async_engine, build_engine, engine, init_db, to_async_url
+)
+from .events import RESET_EVENT, EventHub
+from .maintenance import DatabaseMaintenance, database_status, maintenance
+from .readmodel import TodoStore
+from .versioning import TableVersion
+from .workspaces import shard_for
+from .writer import GroupCommitWriter, todo_writer
+
+# 多个工作进程同时首次打开同一个分片时建表可能冲突，稍后重试
+INIT_ATTEMPTS = 5
+
+# 迁移时复制的列；id在目标分片中重新分配，已软删除的记录不迁移
+MOVED_COLUMNS = (
+    "workspace", "title", "description", "completed", "created_at", "updated_at", "completed_at", "version",
+)
+# 以原始文本读写，日期保持数据库中的格式（与游标和筛选的比较规则一致）
+SELECT_MOVED_SQL = text(
+    f"SELECT {', '.join(MOVED_COLUMNS)} FROM todos "
+    f"WHERE workspace = :workspace AND deleted_at IS NULL ORDER BY id"
+)
+INSERT_MOVED_SQL = text(
+    f"INSERT INTO todos ({', '.join(MOVED_COLUMNS)}) VALUES ({', '.join(':' + name for name in MOVED_COLUMNS)})"
+)
+DELETE_WORKSPACE_SQL = text("DELETE FROM todos WHERE workspace = :workspace")
+WORKSPACE_ROWS_SQL = text(
+    "SELECT workspace, count(*) - count(deleted_at) AS live, count(deleted_at) AS deleted "
+    "FROM todos GROUP BY workspace ORDER BY workspace"
+)
+
+
+class Shard:
+    """
+    一个分片数据库及其在本进程中的状态
+    """
+
+    def __init__(
+        self,
+        index: Optional[int],
+        engine: Engine,
+        async_engine: AsyncEngine,
+        session_factory: async_sessionmaker,
+        feed: ChangeFeed,
+        writer: GroupCommitWriter,
+        maintenance: DatabaseMaintenance,
+    ):
+        self.index = index
+        self.engine = engine
+        self.async_engine = async_engine
+        self.session_factory = session_factory
+        self.feed = feed
+        self.version = feed.version
+        self.cache = feed.cache
+        self.events = feed.events
+        self.store = feed.store
+        self.writer = writer
+        self.maintenance = maintenance
+
+    @classmethod
+    def open(cls, index: int, url: str) -> "Shard":
+        """
+        创建分片的引擎、连接池和各组件，建表并加载变更日志
+        """
+        shard_engine = open_database(url)
+        shard_async_engine = build_async_engine(to_async_url(url))
+        feed = ChangeFeed(
+            poll_interval=settings.changes_poll_interval_ms / 1000,
+            retention=settings.changes_retention,
+            version=TableVersion(),
+            cache=ResponseCache(
+                max_entries=settings.cache_max_entries,
+                ttl_seconds=settings.cache_ttl_seconds,
+                enabled=settings.cache_enabled,
+            ),
+            events=EventHub(
+                history_size=settings.events_history_size,
+                queue_size=settings.events_queue_size,
+            ),
+            store=TodoStore(enabled=settings.read_model_enabled),
+        )
+        shard = cls(
+            index,
+            shard_engine,
+            shard_async_engine,
+            async_sessionmaker(
+                bind=shard_async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+            ),
+            feed,
+            GroupCommitWriter(
+                window_ms=settings.write_batch_window_ms,
+                max_batch=settings.write_batch_max_size,
+                feed=feed,
+            ),
+            DatabaseMaintenance(
+                interval=settings.maintenance_interval_seconds,
+                idle_ms=settings.maintenance_idle_ms,
+                retention_seconds=settings.tombstone_retention_seconds,
+                purge_batch_size=settings.purge_batch_size,
+                vacuum_step_pages=settings.vacuum_step_pages,
+                analyze_threshold=settings.analyze_threshold,
+                optimize_interval=settings.optimize_interval_seconds,
+            ),
+        )
+        shard.load()
+        return shard
+
+    def load(self) -> None:
+        """
+        从变更日志同步版本号和事件缓冲区，加载读模型
+        """
+        with self.engine.connect() as connection:
+            self.feed.load(connection)
+
+    def start(self) -> None:
+        """
+        开始轮询其他进程的写入并启动后台维护；重复调用无副作用
+        """
+        self.feed.start(self.session_factory)
+        self.maintenance.start(self.session_factory)
+
+    async def stop(self) -> None:
+        """
+        停止后台任务
+        """
+        await self.maintenance.stop()
+        await self.writer.stop()
+        await self.feed.stop()
+
+    def status(self) -> Dict[str, Any]:
+        """
+        数据库文件大小和后台维护进度
+        """
+        return {
+            "shard": self.index,
+            "database": database_status(self.engine.url.database, self.maintenance.pages),
+            "maintenance": self.maintenance.status(),
+            "read_model": self.store.status(),
+        }
+
+
+def open_database(url: str) -> Engine:
+    """
+    创建同步引擎并建表；SQLite数据库文件所在的目录不存在时先创建
+    """
+    path = make_url(url).database
+    if url.startswith("sqlite") and path and path != ":memory:":
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    sync_engine = build_engine(url)
+    ensure_schema(sync_engine)
+    return sync_engine
+
+
+def ensure_schema(sync_engine: Engine) -> None:
+    """
+    建表或校验表结构（表结构哈希未变化时只读取一次）；多个工作进程同时首次启动时建表可能冲突，稍后重试
+    """
+    for attempt in range(INIT_ATTEMPTS):
+        try:
+            init_db(sync_engine)
+            return
+        except OperationalError:
+            if attempt == INIT_ATTEMPTS - 1:
+                raise
+            time.sleep(0.1 * (attempt + 1))
+
+
+class ShardRouter:
+    """
+    把工作空间路由到分片，分片在第一次使用时创建
+    """
+
+    def __init__(self, shard_count: int, url_template: str, default: Shard):
+        self.shard_count = shard_count
+        self.url_template = url_template
+        self.default = default
+        self._shards: Dict[int, Shard] = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.shard_count > 0
+
+    def url(self, index: int) -> str:
+        return self.url_template.format(shard=index)
+
+    async def route(self, workspace: str) -> Shard:
+        """
+        返回工作空间所在的分片
+        """
+        if not self.enabled:
+            return self.default
+        index = shard_for(workspace, self.shard_count)
+        shard = self._shards.get(index)
+        if shard is None:
+            # 建表和加载变更日志是同步IO，放到线程中执行，不阻塞事件循环
+            shard = await asyncio.to_thread(self.open, index)
+            if self._started:
+                shard.start()
+        return shard
+
+    def open(self, index: int) -> Shard:
+        """
+        返回已创建的分片，不存在则创建
+        """
+        with self._lock:
+            shard = self._shards.get(index)
+            if shard is None:
+                shard = self._shards[index] = Shard.open(index, self.url(index))
+            return shard
+
+    def open_all(self) -> List[Shard]:
+        """
+        创建并返回所有分片，供命令行工具使用
+        """
+        if not self.enabled:
+            return [self.default]
+        return [self.open(index) for index in range(self.shard_count)]
+
+    def shards(self) -> List[Shard]:
+        """
+        本进程中已创建的分片
+        """
+        if not self.enabled:
+            return [self.default]
+        return [self._shards[index] for index in sorted(self._shards)]
+
+    def start(self) -> None:
+        """
+        进程启动时调用：默认数据库从变更日志同步，已创建的分片启动后台任务，之后创建的分片随即启动
+        """
+        self._started = True
+        if not self.enabled:
+            self.default.load()
+        for shard in self.shards():
+            shard.start()
+
+    async def stop(self) -> None:
+        """
+        停止所有分片的后台任务并关闭分片的连接池
+        """
+        self._started = False
+        for shard in self.shards():
+            await shard.stop()
+        for shard in list(self._shards.values()):
+            await shard.async_engine.dispose()
+            shard.engine.dispose()
+        self._shards.clear()
+
+
+shard_router = ShardRouter(
+    shard_count=settings.shard_count,
+    url_template=settings.shard_url,
+    default=Shard(None, engine, async_engine, AsyncSessionLocal, change_feed, todo_writer, maintenance),
+)
+
+
+# ---------------------------------------------------------------- 管理工具
+
+class Move(NamedTuple):
+    """
+    一个工作空间的迁移计划
+    """
+    workspace: str
+    rows: int
+    source: str
+    target: int
+
+
+def existing_shards(url_template: str) -> List[int]:
+    """
+    已存在的分片序号（按SQLite数据库文件查找）
+    """
+    import glob
+
+    path = make_url(url_template).database or ""
+    if "{shard}" not in path:
+        return []
+    prefix, suffix = path.split("{shard}", 1)
+    indices = []
+    for name in glob.glob(glob.escape(prefix) + "*" + glob.escape(suffix)):
+        middle = name[len(prefix):len(name) - len(suffix)]
+        if middle.isdigit():
+            indices.append(int(middle))
+    return sorted(indices)
+
+
+def workspace_rows(connection) -> List[Any]:
+    """
+    各工作空间的记录数与已软删除的记录数
+    """
+    return connection.execute(WORKSPACE_ROWS_SQL).all()
+
+
+def move_workspace(source: Engine, target: Engine, workspace: str, batch_size: int, replace: bool) -> int:
+    """
+    把工作空间的记录复制到目标分片并提交，再从源分片删除，返回迁移的行数。
+    replace为True时先删除目标分片中该工作空间已有的记录（上次迁移中断留下的副本）
+    """
+    moved = 0
+    with source.connect() as reader, target.begin() as writer:
+        if replace:
+            writer.execute(DELETE_WORKSPACE_SQL, {"workspace": workspace})
+        result = reader.execution_options(yield_per=batch_size).execute(
+            SELECT_MOVED_SQL, {"workspace": workspace}
+        )
+        for rows in result.partitions():
+            writer.execute(INSERT_MOVED_SQL, [dict(row._mapping) for row in rows])
+            moved += len(rows)
+    with source.begin() as connection:
+        connection.execute(DELETE_WORKSPACE_SQL, {"workspace": workspace})
+    return moved
+
+
+def announce_reset(target: Engine) -> None:
+    """
+    追加reset事件：仍在运行的进程清空缓存，订阅的客户端重新加载
+    """
+    with target.begin() as connection:
+        connection.execute(
+            APPEND_SQL,
+            {"event": RESET_EVENT, "data": json.dumps({"reason": "rebalance"}), "todo_ids": None},
+        )
+
+
+def rebalance(shard_count: int, source: Optional[str], batch_size: int, dry_run: bool, replace: bool) -> None:
+    """
+    把各工作空间迁移到按shard_count计算的分片
+    """
+    if shard_count < 1:
+        raise SystemExit("分片数必须大于0")
+    template = settings.shard_url
+    sources = {template.format(shard=index): index for index in existing_shards(template)}
+    if source:
+        sources[source] = None
+    engines: Dict[str, Engine] = {}
+
+    def connect(url: str) -> Engine:
+        if url not in engines:
+            engines[url] = open_database(url)
+        return engines[url]
+
+    try:
+        plan: List[Move] = []
+        for url, index in sources.items():
+            with connect(url).connect() as connection:
+                for row in workspace_rows(connection):
+                    target = shard_for(row.workspace, shard_count)
+                    if target != index:
+                        plan.append(Move(row.workspace, row.live, url, target))
+
+        conflicts = []
+        for move in plan:
+            target_url = template.format(shard=move.target)
+            if target_url in sources:
+                with connect(target_url).connect() as connection:
+                    exists = connection.execute(
+                        text("SELECT 1 FROM todos WHERE workspace = :workspace LIMIT 1"),
+                        {"workspace": move.workspace},
+                    ).first()
+                if exists:
+                    conflicts.append(move)
+
+        for move in plan:
+            print(f"{move.workspace}: {move.rows} 条  {move.source} -> 分片 {move.target}")
+        if not plan:
+            print(f"所有工作空间已位于 SHARD_COUNT={shard_count} 对应的分片，无需迁移")
+            return
+        if conflicts and not replace:
+            names = ", ".join(move.workspace for move in conflicts)
+            raise SystemExit(
+                f"目标分片中已有以下工作空间的记录（可能是上次迁移中断留下的副本）: {names}\n"
+                f"确认以源分片为准后加 --replace 重新执行"
+            )
+        if dry_run:
+            print(f"共 {len(plan)} 个工作空间待迁移（--dry-run，未执行）")
+            return
+
+        started = time.perf_counter()
+        moved = 0
+        touched = set()
+        for move in plan:
+            target_url = template.format(shard=move.target)
+            moved += move_workspace(
+                connect(move.source), connect(target_url), move.workspace, batch_size,
+                replace and move in conflicts
+            )
+            touched.update((move.source, target_url))
+        for url in touched:
+            announce_reset(connect(url))
+        print(
+            f"✓ 迁移 {len(plan)} 个工作空间共 {moved} 条记录，耗时 {time.perf_counter() - started:.1f} 秒；"
+            f"请以 SHARD_COUNT={shard_count} 重新启动服务"
+        )
+    finally:
+        for sync_engine in engines.values():
+            sync_engine.dispose()
+
+
+def print_status(shard_count: int) -> None:
+    """
+    打印各分片的文件大小和工作空间分布，标出不在应在分片中的工作空间
+    """
+    template = settings.shard_url
+    indices = existing_shards(template)
+    if not indices:
+        print(f"没有找到分片数据库（SHARD_URL={template}）")
+        return
+    for index in indices:
+        url = template.format(shard=index)
+        sync_engine = build_engine(url)
+        try:
+            with sync_engine.connect() as connection:
+                rows = workspace_rows(connection)
+        finally:
+            sync_engine.dispose()
+        size = os.path.getsize(make_url(url).database) / 1024 / 1024
+        live = sum(row.live for row in rows)
+        print(f"分片 {index}: {url}  {size:.1f} MB  {len(rows)} 个工作空间  {live} 条记录")
+        for row in rows:
+            note = ""
+            if shard_count and shard_for(row.workspace, shard_count) != index:
+                note = f"  (SHARD_COUNT={shard_count} 时应位于分片 {shard_for(row.workspace, shard_count)})"
+            print(f"    {row.workspace}: {row.live} 条，待清除 {row.deleted} 条{note}")
+
+
+def main():
+    """分片管理工具"""
+    # 只有命令行工具用到，不在服务进程启动时导入
+    import argparse
+
+    parser = argparse.ArgumentParser(description="分片管理（迁移数据前请先停止服务）")
+    commands = parser.add_subparsers(dest="command", required=True)
+    status_parser = commands.add_parser("status", help="查看各分片的文件大小和工作空间分布")
+    status_parser.add_argument("--shards", type=int, default=settings.shard_count, help="按该分片数检查工作空间位置")
+    for name, help_text in (("rebalance", "按指定分片数重新分布工作空间"), ("split", "分片数翻倍")):
+        command = commands.add_parser(name, help=help_text)
+        if name == "rebalance":
+            command.add_argument("--shards", type=int, required=True, help="新的分片数")
+        command.add_argument("--source", help="额外的源数据库（例如未分片时的DATABASE_URL）")
+        command.add_argument("--batch-size", type=int, default=settings.transfer_batch_size, help="每批复制的行数")
+        command.add_argument("--dry-run", action="store_true", help="只打印迁移计划")
+        command.add_argument("--replace", action="store_true", help="目标分片已有同名工作空间时以源分片为准覆盖")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        print_status(args.shards)
+        return
+    if args.command == "split":
+        if not settings.shard_count:
+            raise SystemExit("未设置SHARD_COUNT，请使用 rebalance --shards N")
+        args.shards = settings.shard_count * 2
+    rebalance(args.shards, args.source, args.batch_size, args.dry_run, args.replace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+待办事项统计
+
+统计数据按工作空间保存在汇总表中，由todos表上的触发器在同一事务内增量维护，读取时无需扫描todos：
+- todo_stats: 总数与已完成数
+- todo_daily_stats: 按天统计的创建数与完成数
+
+完成日期取 completed_at 所在日期（按UTC），completed_at只在完成状态改变时写入，编辑标题等字段不会移动完成日期；
+直接以已完成状态写入且未提供completed_at的记录按创建日期计。已软删除（deleted_at非空）的记录不计入统计，
+软删除时由更新触发器扣除，之后清除记录时删除触发器不再重复扣除。
+汇总数据与重新全量计算的结果一致，可随时通过 reconcile_stats 校正：
+
+    python -m app.stats
+"""
+from typing import Any, Dict, List
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Todo
+
+STATS_TABLE = "todo_stats"
+DAILY_STATS_TABLE = "todo_daily_stats"
+# 完成日期：completed_at，未记录时取创建时间；两者都不随普通编辑改变
+COMPLETED_DAY = "date(coalesce({row}.completed_at, {row}.created_at))"
+# 计入统计的记录：未被软删除
+COUNTED = "{row}.deleted_at IS NULL"
+
+CREATE_STATS_TABLES = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {STATS_TABLE} (
+        workspace TEXT PRIMARY KEY,
+        total INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TABLE IF NOT EXISTS {DAILY_STATS_TABLE} (
+        workspace TEXT NOT NULL,
+        day TEXT NOT NULL,
+        created INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (workspace, day)
+    )
+    """,
+]
+
+
+def _bump_total(workspace: str, total: str, completed: str, condition: str = "1") -> str:
+    return (
+        f"INSERT INTO {STATS_TABLE}(workspace, total, completed) "
+        f"SELECT {workspace}, {total}, {completed} WHERE {condition} "
+        f"ON CONFLICT(workspace) DO UPDATE SET total = total + excluded.total, "
+        f"completed = completed + excluded.completed;"
+    )
+
+
+def _bump_daily(workspace: str, day: str, created: int, completed: int, condition: str = "1") -> str:
+    return (
+        f"INSERT INTO {DAILY_STATS_TABLE}(workspace, day, created, completed) "
+        f"SELECT {workspace}, {day}, {created}, {completed} WHERE {condition} "
+        f"ON CONFLICT(workspace, day) DO UPDATE SET created = created + excluded.created, "
+        f"completed = completed + excluded.completed;"
+    )
+
+
+OLD_COUNTED = COUNTED.format(row="old")
+NEW_COUNTED = COUNTED.format(row="new")
+# 更新前后的创建记录是否落在同一个 (工作空间, 日期)
+SAME_CREATED = "old.workspace IS new.workspace AND old.created_at IS new.created_at"
+
+CREATE_STATS_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todo_stats_ai AFTER INSERT ON todos WHEN {NEW_COUNTED} BEGIN
+        {_bump_total("new.workspace", "1", "new.completed")}
+        {_bump_daily("new.workspace", "date(new.created_at)", 1, 0)}
+        {_bump_daily("new.workspace", COMPLETED_DAY.format(row="new"), 0, 1, "new.completed")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todo_stats_ad AFTER DELETE ON todos WHEN {OLD_COUNTED} BEGIN
+        {_bump_total("old.workspace", "-1", "-old.completed")}
+        {_bump_daily("old.workspace", "date(old.created_at)", -1, 0)}
+        {_bump_daily("old.workspace", COMPLETED_DAY.format(row="old"), 0, -1, "old.completed")}
+    END
+    """,
+    # 只在影响统计的字段更新时执行：完成状态或完成时间改变时，已完成记录从旧的完成日期移到新的完成日期；
+    # 软删除时只扣除旧值。工作空间不变（通常情况）时总数只需一条语句
+    f"""
+    CREATE TRIGGER IF NOT EXISTS todo_stats_au
+    AFTER UPDATE OF workspace, completed, completed_at, created_at, deleted_at ON todos BEGIN
+        {_bump_total("new.workspace", f"({NEW_COUNTED}) - ({OLD_COUNTED})",
+                     f"(new.completed AND {NEW_COUNTED}) - (old.completed AND {OLD_COUNTED})",
+                     "old.workspace IS new.workspace")}
+        {_bump_total("old.workspace", f"-({OLD_COUNTED})", f"-(old.completed AND {OLD_COUNTED})",
+                     "old.workspace IS NOT new.workspace")}
+        {_bump_total("new.workspace", f"{NEW_COUNTED}", f"new.completed AND {NEW_COUNTED}",
+                     "old.workspace IS NOT new.workspace")}
+        {_bump_daily("old.workspace", "date(old.created_at)", -1, 0,
+                     f"{OLD_COUNTED} AND (NOT ({SAME_CREATED}) OR NOT ({NEW_COUNTED}))")}
+        {_bump_daily("new.workspace", "date(new.created_at)", 1, 0,
+                     f"{NEW_COUNTED} AND (NOT ({SAME_CREATED}) OR NOT ({OLD_COUNTED}))")}
+        {_bump_daily("old.workspace", COMPLETED_DAY.format(row="old"), 0, -1, f"old.completed AND {OLD_COUNTED}")}
+        {_bump_daily("new.workspace", COMPLETED_DAY.format(row="new"), 0, 1, f"new.completed AND {NEW_COUNTED}")}
+    END
+    """,
+]
+
+STATS_TRIGGER_NAMES = ("todo_stats_ai", "todo_stats_ad", "todo_stats_au")
+
+
+def reconcile_stats(connection: Connection) -> Dict[str, int]:
+    """
+    从todos表全量重新计算汇总数据，返回校正后所有工作空间的总数与已完成数
+    """
+    connection.execute(text(f"DELETE FROM {STATS_TABLE}"))
+    connection.execute(text(f"DELETE FROM {DAILY_STATS_TABLE}"))
+    connection.execute(text(
+        f"INSERT INTO {STATS_TABLE}(workspace, total, completed) "
+        f"SELECT workspace, count(*), coalesce(sum(completed), 0) FROM todos WHERE deleted_at IS NULL "
+        f"GROUP BY workspace"
+    ))
+    connection.execute(text(
+        f"""
+        INSERT INTO {DAILY_STATS_TABLE}(workspace, day, created, completed)
+        SELECT workspace, day, sum(created), sum(completed) FROM (
+            SELECT workspace, date(created_at) AS day, 1 AS created, 0 AS completed
+            FROM todos WHERE deleted_at IS NULL
+            UNION ALL
+            SELECT workspace, {COMPLETED_DAY.format(row="todos")}, 0, 1
+            FROM todos WHERE completed AND deleted_at IS NULL
+        ) GROUP BY workspace, day
+        """
+    ))
+    row = connection.execute(
+        text(f"SELECT coalesce(sum(total), 0) AS total, coalesce(sum(completed), 0) AS completed FROM {STATS_TABLE}")
+    ).one()
+    return {"total": row.total, "completed": row.completed}
+
+
+def _normalize_sql(statement: str) -> str:
+    return " ".join(statement.replace("IF NOT EXISTS ", "").split())
+
+
+def replace_outdated_triggers(connection: Connection, statements: List[str]) -> None:
+    """
+    定义与代码不一致的触发器（旧版本创建的数据库）先删除，再按当前定义创建
+    """
+    existing = {
+        row.name: _normalize_sql(row.sql)
+        for row in connection.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"))
+    }
+    for statement in statements:
+        normalized = _normalize_sql(statement)
+        name = normalized.split()[2]
+        if name in existing and existing[name] != normalized:
+            connection.execute(text(f"DROP TRIGGER {name}"))
+        connection.execute(text(statement))
+
+
+def backfill_completed_at(connection: Connection) -> None:
+    """
+    旧版本创建的已完成记录没有completed_at：取原来用作完成日期的更新时间，汇总数据因此不变
+    """
+    connection.execute(text(
+        "UPDATE todos SET completed_at = coalesce(updated_at, created_at) WHERE completed AND completed_at IS NULL"
+    ))
+
+
+def ensure_stats(connection: Connection) -> None:
+    """
+    创建汇总表及维护触发器；汇总表是新建的则从todos全量计算（用于已有数据的数据库）
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    columns = {row[1] for row in connection.execute(text(f"PRAGMA table_info({STATS_TABLE})"))}
+    exists = bool(columns)
+    if exists and "workspace" not in columns:
+        # 旧版本不区分工作空间的汇总表，删除后全量重新计算
+        drop_stats(connection)
+        exists = False
+    for statement in CREATE_STATS_TABLES:
+        connection.execute(text(statement))
+    backfill_completed_at(connection)
+    replace_outdated_triggers(connection, CREATE_STATS_TRIGGERS)
+    if not exists:
+        reconcile_stats(connection)
+
+
+def drop_stats(connection: Connection) -> None:
+    """
+    删除汇总表及维护触发器；批量导入前调用，导入后由ensure_stats全量重新计算
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    for name in STATS_TRIGGER_NAMES:
+        connection.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    connection.execute(text(f"DROP TABLE IF EXISTS {DAILY_STATS_TABLE}"))
+    connection.execute(text(f"DROP TABLE IF EXISTS {STATS_TABLE}"))
+
+
+# 随todos表一起创建和删除
+event.listen(
+    Todo.__table__, "after_create",
+    lambda target, connection, **kw: ensure_stats(connection)
+)
+event.listen(
+    Todo.__table__, "before_drop",
+    lambda target, connection, **kw: drop_stats(connection)
+)
+
+
+async def read_stats(db: AsyncSession, days: int, workspace: str) -> Dict[str, Any]:
+    """
+    读取工作空间的汇总数据：计数为单行读取，直方图按主键读取最近days天有数据的日期
+    """
+    counts = (await db.execute(
+        text(f"SELECT total, completed FROM {STATS_TABLE} WHERE workspace = :workspace"),
+        {"workspace": workspace},
+    )).first()
+    total, completed = (counts.total, counts.completed) if counts else (0, 0)
+    result = await db.execute(
+        text(
+            f"SELECT day, created, completed FROM {DAILY_STATS_TABLE} "
+            f"WHERE workspace = :workspace AND day >= date('now', :offset) "
+            f"AND (created > 0 OR completed > 0) ORDER BY day"
+        ),
+        {"workspace": workspace, "offset": f"-{days - 1} days"},
+    )
+    created_per_day: List[Dict[str, Any]] = []
+    completed_per_day: List[Dict[str, Any]] = []
+    for row in result:
+        if row.created:
+            created_per_day.append({"date": row.day, "count": row.created})
+        if row.completed:
+            completed_per_day.append({"date": row.day, "count": row.completed})
+    return {
+        "total": total,
+        "active": total - completed,
+        "completed": completed,
+        "created_per_day": created_per_day,
+        "completed_per_day": completed_per_day,
+    }
+
+
+def main():
+    """校正统计数据；开启分片时依次校正每个分片"""
+    from .sharding import shard_router
+
+    for shard in shard_router.open_all():
+        label = "" if shard.index is None else f"分片 {shard.index} "
+        with shard.engine.begin() as connection:
+            ensure_stats(connection)
+            counts = reconcile_stats(connection)
+        print(f"✓ {label}统计数据已校正: 共 {counts['total']} 条，已完成 {counts['completed']} 条")
+
+
+if __name__ == "__main__":
+    main()
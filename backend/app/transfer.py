@@ -0,0 +1,207 @@
+"""
+待办事项导出与导入
+
+导出按固定大小的批次从服务端游标读取行，逐批编码为NDJSON或CSV；
+导入按数据块增量解析上传内容，凑满一批后批量写入。两者的内存占用与数据总量无关。
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import Field, ValidationError
+
+from .filters import to_utc
+from .models import Todo
+from .schemas import TodoBase
+from .serialization import dumps
+
+NDJSON = "ndjson"
+CSV = "csv"
+MEDIA_TYPES = {NDJSON: "application/x-ndjson", CSV: "text/csv"}
+
+# 导出字段顺序，同时也是CSV的表头
+EXPORT_FIELDS = ("id", "title", "description", "completed", "created_at", "updated_at", "completed_at")
+EXPORT_COLUMNS = tuple(getattr(Todo, field) for field in EXPORT_FIELDS)
+
+# 单条记录的最大字节数，防止缺少换行的上传内容无限占用内存
+MAX_RECORD_BYTES = 1024 * 1024
+
+
+class InvalidImportError(ValueError):
+    """
+    导入内容无效，line为出错的记录序号（从1开始，CSV不计表头）
+    """
+
+    def __init__(self, line: int, message: str):
+        super().__init__(f"第{line}条记录: {message}")
+        self.line = line
+
+
+class TodoImportRecord(TodoBase):
+    """导入的单条记录；不含id或时间时由数据库生成"""
+    id: Optional[int] = Field(None, ge=1)
+    completed: bool = False
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+
+def detect_format(fmt: Optional[str], content_type: Optional[str]) -> str:
+    """
+    确定导入格式：优先使用显式指定的格式，其次根据Content-Type判断，默认NDJSON
+    """
+    if fmt:
+        return fmt
+    if content_type and content_type.split(";")[0].strip() in ("text/csv", "application/csv"):
+        return CSV
+    return NDJSON
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def encode_batch(rows: Sequence[Sequence[Any]], fmt: str, header: bool = False) -> bytes:
+    """
+    将按EXPORT_FIELDS顺序排列的一批行编码为NDJSON或CSV字节
+    """
+    if fmt == NDJSON:
+        return b"".join(dumps(dict(zip(EXPORT_FIELDS, row))) + b"\n" for row in rows)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    if header:
+        writer.writerow(EXPORT_FIELDS)
+    writer.writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def _split_ndjson(buffer: bytearray) -> Tuple[List[bytes], int]:
+    """
+    拆出缓冲区中完整的行，返回 (行列表, 已消费的字节数)
+    """
+    end = buffer.rfind(b"\n")
+    if end < 0:
+        return [], 0
+    return bytes(buffer[:end]).split(b"\n"), end + 1
+
+
+def _split_csv(buffer: bytearray, state: Dict[str, int]) -> Tuple[List[bytes], int]:
+    """
+    按记录边界拆分CSV：引号外的换行才是记录结束，带引号的字段中可以包含换行
+    """
+    records = []
+    start = 0
+    quoted = state.get("quoted", 0)
+    position = state.get("position", 0)
+    while True:
+        quote = buffer.find(b'"', position)
+        newline = buffer.find(b"\n", position)
+        if newline < 0 and quote < 0:
+            break
+        if quote >= 0 and (newline < 0 or quote < newline):
+            quoted ^= 1
+            position = quote + 1
+            continue
+        if not quoted:
+            records.append(bytes(buffer[start:newline]))
+            start = newline + 1
+        position = newline + 1
+    state["quoted"] = quoted
+    state["position"] = len(buffer) - start
+    return records, start
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    从上传的数据块中增量解析记录，逐条返回 (记录序号, 字段字典)
+    """
+    buffer = bytearray()
+    csv_state: Dict[str, int] = {}
+    header: Optional[List[str]] = None
+    line = 0
+
+    def parse(raw: bytes) -> Optional[Dict[str, Any]]:
+        nonlocal header
+        text = raw.decode("utf-8-sig" if line == 0 and header is None else "utf-8").rstrip("\r")
+        if not text.strip():
+            return None
+        if fmt == NDJSON:
+            value = json.loads(text)
+            if not isinstance(value, dict):
+                raise ValueError("每行必须是一个JSON对象")
+            return value
+        fields = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip() for name in fields]
+            return None
+        if len(fields) != len(header):
+            raise ValueError(f"列数为{len(fields)}，与表头的{len(header)}列不一致")
+        return {name: (value if value != "" else None) for name, value in zip(header, fields)}
+
+    def drain(records: Iterable[bytes]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        nonlocal line
+        for raw in records:
+            try:
+                record = parse(raw)
+            except (ValueError, UnicodeDecodeError, csv.Error) as e:
+                raise InvalidImportError(line + 1, str(e))
+            if record is not None:
+                line += 1
+                yield line, record
+
+    async for chunk in chunks:
+        buffer += chunk
+        if fmt == NDJSON:
+            records, consumed = _split_ndjson(buffer)
+        else:
+            records, consumed = _split_csv(buffer, csv_state)
+        del buffer[:consumed]
+        if len(buffer) > MAX_RECORD_BYTES:
+            raise InvalidImportError(line + 1, "单条记录过大")
+        for item in drain(records):
+            yield item
+    if buffer:
+        for item in drain([bytes(buffer)]):
+            yield item
+
+
+def validate_record(line: int, record: Dict[str, Any], keep_ids: bool) -> Dict[str, Any]:
+    """
+    校验一条记录并转换为插入参数；未提供的时间字段不出现在参数中，由数据库默认值填充
+    """
+    try:
+        todo = TodoImportRecord.model_validate(record)
+    except ValidationError as e:
+        error = e.errors()[0]
+        field = ".".join(str(part) for part in error["loc"])
+        raise InvalidImportError(line, f"{field} {error['msg']}")
+    values = todo.model_dump(exclude_none=True, exclude={"description", "completed_at"})
+    values["description"] = todo.description
+    # 带时区的时间换算为UTC保存，与数据库默认值和筛选条件一致
+    for field in ("created_at", "updated_at"):
+        if field in values:
+            values[field] = to_utc(values[field])
+    # 未提供完成时间的已完成记录（旧版本的导出）取更新时间；未完成的记录不保留完成时间
+    if todo.completed and (todo.completed_at or todo.updated_at):
+        values["completed_at"] = to_utc(todo.completed_at or todo.updated_at)
+    if not keep_ids:
+        values.pop("id", None)
+    return values
+
+
+def group_by_keys(rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    按参数键集合分组，同一组的参数才能合并为一次executemany
+    """
+    groups: Dict[frozenset, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    return list(groups.values())
@@ -0,0 +1,74 @@
+"""
+todos表的变更版本号
+
+版本号为变更日志的序号（见 changelog.py），每次写操作后递增，所有工作进程一致，用作列表等聚合响应的ETag；
+单条记录的ETag取行版本号（row_etag）。
+版本号前缀为数据库的epoch，替换数据库文件后旧ETag不会被误判为有效。
+"""
+import threading
+import time
+from typing import List, Optional
+
+
+class TableVersion:
+    """
+    单调递增的表版本号
+    """
+
+    def __init__(self):
+        self.epoch = format(time.time_ns(), "x")
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def set(self, epoch: str, value: int) -> None:
+        """
+        更新为变更日志中的epoch和序号
+        """
+        with self._lock:
+            self.epoch = epoch
+            self.value = value
+
+    def etag(self, suffix: str = "") -> str:
+        """
+        生成当前版本的弱ETag
+        """
+        return f'W/"{self.epoch}-{self.value}{suffix}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    按弱比较规则判断If-None-Match是否命中
+    """
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
+def row_etag(version: int) -> str:
+    """
+    单条记录的强ETag，取值为行版本号，可在更新时通过If-Match提交
+    """
+    return f'"{version}"'
+
+
+def parse_if_match(if_match: str) -> Optional[List[int]]:
+    """
+    解析If-Match中的行版本号；为 * 时返回None，表示只要求记录存在。
+    If-Match按强比较规则匹配，弱ETag及无法识别的值被忽略
+    """
+    versions = []
+    for candidate in if_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return None
+        if len(candidate) > 2 and candidate[0] == candidate[-1] == '"' and candidate[1:-1].isdigit():
+            versions.append(int(candidate[1:-1]))
+    return versions
+
+
+todos_version = TableVersion()
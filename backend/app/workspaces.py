@@ -0,0 +1,46 @@
+"""
+工作空间
+
+每个待办事项属于一个工作空间，请求通过 X-Workspace 请求头指定（EventSource等无法设置请求头时
+也可以用查询参数 workspace），未指定时为 default。
+所有查询和写入都限定在请求的工作空间内；开启分片（SHARD_COUNT）时，
+工作空间按名称的哈希路由到其中一个分片数据库（见 sharding.py）。
+"""
+import re
+import zlib
+from typing import Optional
+
+from fastapi import Header, HTTPException, Query
+
+WORKSPACE_HEADER = "X-Workspace"
+DEFAULT_WORKSPACE = "default"
+# 字母或数字开头，最长64个字符；用fullmatch匹配，末尾的换行不会被接受
+WORKSPACE_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]{0,63}")
+
+
+def get_workspace(
+    x_workspace: Optional[str] = Header(None, description="工作空间，不传则为default"),
+    workspace: Optional[str] = Query(None, description="工作空间，未设置X-Workspace请求头时使用"),
+) -> str:
+    """
+    读取请求的工作空间，名称无效时返回400
+    """
+    name = x_workspace or workspace
+    if not name:
+        return DEFAULT_WORKSPACE
+    if not WORKSPACE_PATTERN.fullmatch(name):
+        raise HTTPException(
+            status_code=400,
+            detail="工作空间名称无效：只能包含字母、数字、下划线、点和连字符，以字母或数字开头，最长64个字符"
+        )
+    return name
+
+
+def shard_for(workspace: str, shard_count: int) -> int:
+    """
+    工作空间所在的分片序号
+
+    使用crc32而不是受PYTHONHASHSEED影响的hash()，各进程的结果一致；
+    分片数翻倍时，分片k中的工作空间只会留在k或移到k+原分片数
+    """
+    return zlib.crc32(workspace.encode("utf-8")) % shard_count
@@ -0,0 +1,165 @@
+"""
+写操作合并提交（group commit）
+
+SQLite同一时间只允许一个写事务，每次提交都要等待日志落盘。开启 WRITE_COALESCING 后，
+单条写请求不再各自开启事务，而是把写操作放入队列，由唯一的写入任务按批执行：
+取到第一个操作后最多再等待 WRITE_BATCH_WINDOW_MS 毫秒或凑满 WRITE_BATCH_MAX_SIZE 个操作，
+在同一个事务中依次执行并追加变更日志，一次提交后分别唤醒各个请求。
+上一批提交期间到达的操作会在下一批中一起执行，因此负载越高每批越大。
+
+写操作必须在产生任何写入之前完成校验（例如记录不存在时抛出HTTPException），
+这样抛出的HTTPException只影响该操作本身；其他异常会回滚整批，再逐个单独提交以确定出错的操作。
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from .changelog import ChangeFeed, change_feed
+from .config import settings
+from .events import CHANGE_EVENT
+from .profiling import current_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WriteOutcome(NamedTuple):
+    """
+    写操作的结果：result返回给请求，其余字段追加到变更日志
+    """
+    result: Any
+    change: Dict[str, Any]
+    todo_ids: Optional[List[int]] = None
+    event_type: str = CHANGE_EVENT
+
+
+# 在给定会话中执行写操作（不提交），返回WriteOutcome
+WriteOperation = Callable[[AsyncSession], Awaitable[WriteOutcome]]
+
+PendingWrite = Tuple[WriteOperation, "asyncio.Future[Any]"]
+
+
+class GroupCommitWriter:
+    """
+    单写入任务的合并提交队列；每个数据库（分片）各有一个，变更日志追加到feed
+    """
+
+    def __init__(self, window_ms: float, max_batch: int, feed: ChangeFeed = change_feed):
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.feed = feed
+        self.batches = 0
+        self.operations = 0
+        self._queue: Optional["asyncio.Queue[PendingWrite]"] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session_factory: Optional[async_sessionmaker] = None
+
+    async def submit(self, session_factory: async_sessionmaker, operation: WriteOperation) -> Any:
+        """
+        提交写操作并等待所在批次提交，返回操作的result或抛出其异常
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._start(loop)
+        self._session_factory = session_factory
+        future = loop.create_future()
+        self._queue.put_nowait((operation, future))
+        return await future
+
+    def _start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._task = loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        停止写入任务；队列中尚未执行的操作以异常结束
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("写入队列已停止"))
+        self._task = None
+
+    async def _run(self) -> None:
+        # 写入任务创建时复制了触发它的请求的上下文，批量执行的SQL不应计入该请求
+        current_metrics.set(None)
+        while True:
+            batch = [await self._queue.get()]
+            await self._fill(batch)
+            await self._commit(batch)
+
+    async def _fill(self, batch: List[PendingWrite]) -> None:
+        """
+        取出已排队的操作，不足一批时在窗口内继续等待
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                return
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                return
+
+    async def _commit(self, batch: List[PendingWrite]) -> None:
+        """
+        在一个事务中执行一批操作；提交失败时逐个单独重试
+        """
+        batch = [(operation, future) for operation, future in batch if not future.cancelled()]
+        if not batch:
+            return
+        outcomes: List[Tuple["asyncio.Future[Any]", Optional[BaseException], Any]] = []
+        try:
+            async with self._session_factory() as db:
+                for operation, future in batch:
+                    try:
+                        outcome = await operation(db)
+                    except HTTPException as e:
+                        outcomes.append((future, e, None))
+                        continue
+                    await self.feed.append(db, outcome.event_type, outcome.change, outcome.todo_ids)
+                    outcomes.append((future, None, outcome.result))
+                await db.commit()
+                try:
+                    await self.feed.sync(db)
+                except Exception as e:
+                    # 已经提交，由后台轮询补上本进程的同步
+                    logger.warning("同步变更日志失败: %s", e)
+        except Exception as e:
+            if len(batch) > 1:
+                for item in batch:
+                    await self._commit([item])
+                return
+            outcomes = [(batch[0][1], e, None)]
+
+        self.batches += 1
+        self.operations += len(batch)
+        for future, error, result in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+todo_writer = GroupCommitWriter(
+    window_ms=settings.write_batch_window_ms,
+    max_batch=settings.write_batch_max_size,
+)
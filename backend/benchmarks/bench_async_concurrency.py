@@ -0,0 +1,167 @@
+"""
+同步会话与异步会话的并发基准测试
+
+在同一个事件循环中并发执行查询，对比：
+- blocking: 在协程里直接调用同步Session（改造前路由的做法）
+- async:    使用AsyncSession + aiosqlite
+
+同时运行一个1ms心跳任务记录事件循环的最大延迟，并以固定间隔发起按主键查询的轻量请求，
+记录其延迟，用于观察慢查询是否阻塞其他请求。多核机器上异步模式的吞吐提升更明显。
+--query scan 执行以SQLite计算为主的全表扫描（期间释放GIL），最能体现异步会话的吞吐提升；
+--query list 读取一页ORM对象，耗时主要在Python侧的对象构建。
+
+用法:
+    python -m benchmarks.bench_async_concurrency --rows 200000 --concurrency 8 --requests 64 --query scan
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.database import Base
+from app.models import Todo
+
+
+def seed(url: str, rows: int) -> None:
+    """写入测试数据"""
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Todo),
+            [
+                {"title": f"任务{i}", "description": "基准测试数据" * 5, "completed": i % 3 == 0}
+                for i in range(rows)
+            ],
+        )
+    engine.dispose()
+
+
+def percentile(values: list, q: float) -> float:
+    """已排序列表的分位数"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def heartbeat(stop: asyncio.Event, lags: list) -> None:
+    """每1ms唤醒一次，记录事件循环被阻塞的时长"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + 0.001
+        await asyncio.sleep(0.001)
+        lags.append(max(0.0, loop.time() - expected))
+
+
+def build_query(kind: str, page: int):
+    """构造被测查询"""
+    if kind == "scan":
+        return select(func.count()).select_from(Todo).where(Todo.description.like("%不存在%"))
+    return select(Todo).order_by(Todo.created_at.desc(), Todo.id.desc()).limit(page)
+
+
+async def run(mode: str, url: str, concurrency: int, requests: int, query) -> dict:
+    """以给定模式并发执行查询"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    if mode == "blocking":
+        engine = create_engine(url, pool_size=concurrency, connect_args={"check_same_thread": False})
+        factory = sessionmaker(bind=engine)
+
+        async def one():
+            async with semaphore:
+                with factory() as db:
+                    db.execute(query).all()
+    else:
+        engine = create_async_engine(
+            url.replace("sqlite://", "sqlite+aiosqlite://", 1),
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=concurrency,
+        )
+        factory = async_sessionmaker(bind=engine)
+
+        async def one():
+            async with semaphore:
+                async with factory() as db:
+                    (await db.execute(query)).all()
+
+    async def probe(stop: asyncio.Event, latencies: list):
+        # 每5ms计划一次轻量请求，延迟从计划时间算起，包含被阻塞等待的时间
+        while not stop.is_set():
+            scheduled = time.perf_counter() + 0.005
+            await asyncio.sleep(0.005)
+            if mode == "blocking":
+                with factory() as db:
+                    db.get(Todo, 1)
+            else:
+                async with factory() as db:
+                    await db.get(Todo, 1)
+            latencies.append(time.perf_counter() - scheduled)
+
+    stop = asyncio.Event()
+    lags: list = []
+    latencies: list = []
+    background = [
+        asyncio.create_task(heartbeat(stop, lags)),
+        asyncio.create_task(probe(stop, latencies)),
+    ]
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.gather(*background)
+    latencies.sort()
+
+    if mode == "blocking":
+        engine.dispose()
+    else:
+        await engine.dispose()
+
+    return {
+        "mode": mode,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "req_per_sec": round(requests / elapsed, 1),
+        "max_loop_lag_ms": round(max(lags, default=0.0) * 1000, 2),
+        "probe_p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "probe_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步/异步数据库会话并发基准")
+    parser.add_argument("--rows", type=int, default=200000, help="测试数据行数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发请求数")
+    parser.add_argument("--requests", type=int, default=64, help="总请求数")
+    parser.add_argument("--page", type=int, default=500, help="list查询每次读取的行数")
+    parser.add_argument("--query", choices=("scan", "list"), default="scan", help="被测查询类型")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    url = f"sqlite:///{path}"
+    try:
+        seed(url, args.rows)
+        for mode in ("blocking", "async"):
+            query = build_query(args.query, args.page)
+            result = asyncio.run(run(mode, url, args.concurrency, args.requests, query))
+            print(
+                f"{result['mode']:>8}: {result['req_per_sec']:>8} req/s  "
+                f"耗时 {result['seconds']}s  事件循环最大延迟 {result['max_loop_lag_ms']}ms  "
+                f"轻量请求 p50 {result['probe_p50_ms']}ms / p99 {result['probe_p99_ms']}ms"
+            )
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+响应压缩基准测试
+
+用 init_db.py 的模拟数据生成器构造列表响应（encode_todos，与接口返回的字节一致），
+对每种可用算法的多个压缩级别报告压缩后字节数、压缩比、单次压缩耗时和每毫秒CPU节省的字节数，
+用于选择 COMPRESSION_*_LEVEL；最后对比缓存命中时复用压缩结果与每次重新压缩的单次开销。
+
+用法:
+    python -m benchmarks.bench_compression --page-sizes 50,500 --description-length 300
+    python -m benchmarks.bench_compression --levels gzip=1,6,9 br=1,5,11 zstd=1,3,19
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.compression import ENCODERS, Payload, ResponseCompressor, response_compressor
+from app.serialization import encode_todos
+from init_db import generate_rows
+
+DEFAULT_LEVELS = {"gzip": [1, 6, 9], "br": [1, 4, 5, 9, 11], "zstd": [1, 3, 9, 19]}
+
+
+def build_page(size: int, title_length: int, description_length: int, seed: int) -> bytes:
+    """
+    一页列表响应：行按 TODO_FIELDS 顺序排列（title, description, id, completed, created_at, updated_at, version）
+    """
+    rows = [
+        (title, description, i + 1, completed, created_at.replace(" ", "T"), updated_at.replace(" ", "T"), 1)
+        for i, (title, description, completed, created_at, updated_at) in enumerate(
+            generate_rows(size, 0.3, title_length, description_length, 90, seed)
+        )
+    ]
+    return encode_todos(rows)
+
+
+def timed(function: Callable[[], object], iterations: int) -> float:
+    """执行iterations次，返回单次耗时的中位数（秒）"""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def parse_levels(values: List[str]) -> Dict[str, List[int]]:
+    levels = {}
+    for value in values:
+        name, _, numbers = value.partition("=")
+        levels[name] = [int(number) for number in numbers.split(",") if number]
+    return levels
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应压缩基准")
+    parser.add_argument("--page-sizes", default="50,500", help="每页条数，逗号分隔")
+    parser.add_argument("--title-length", type=int, default=20, help="标题平均长度")
+    parser.add_argument("--description-length", type=int, default=300, help="描述平均长度（上限1000）")
+    parser.add_argument("--levels", nargs="*", default=[], help="各算法测试的级别，如 gzip=1,6,9")
+    parser.add_argument("--iterations", type=int, default=50, help="每个级别的压缩次数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    levels = dict(DEFAULT_LEVELS, **parse_levels(args.levels))
+    missing = [name for name in levels if name not in ENCODERS]
+    if missing:
+        print(f"未安装的可选依赖，跳过: {', '.join(missing)}")
+    results = []
+    for size in (int(value) for value in args.page_sizes.split(",")):
+        body = build_page(size, args.title_length, args.description_length, args.seed)
+        print(f"\n每页 {size} 条，未压缩 {len(body):,} 字节")
+        print(f"  {'算法':<6}{'级别':>4}{'压缩后字节':>12}{'压缩比':>8}{'耗时 ms':>10}{'MB/s':>9}{'节省KB/CPU ms':>15}")
+        for name, encoder in ENCODERS.items():
+            for level in levels.get(name, []):
+                compressed = encoder(body, level)
+                seconds = timed(lambda: encoder(body, level), args.iterations)
+                saved_kb_per_ms = (len(body) - len(compressed)) / 1024 / (seconds * 1000)
+                marker = "*" if response_compressor.levels.get(name) == level else " "
+                print(
+                    f"  {name:<6}{level:>4}{marker}{len(compressed):>11,}{len(body) / len(compressed):>8.1f}"
+                    f"{seconds * 1000:>10.3f}{len(body) / seconds / 1e6:>9.1f}{saved_kb_per_ms:>15.0f}"
+                )
+                results.append({
+                    "page_size": size, "encoding": name, "level": level, "bytes": len(body),
+                    "compressed_bytes": len(compressed), "compress_ms": seconds * 1000,
+                })
+
+        # 缓存命中：压缩结果随Payload保存，之后的请求只需协商和查表
+        compressor = ResponseCompressor(True, 0, response_compressor.levels)
+        encoding = compressor.encodings[0]
+        fresh = timed(lambda: compressor.encode(Payload(body), encoding), args.iterations)
+        payload = Payload(body)
+        compressor.encode(payload, encoding)
+        reused = timed(lambda: compressor.encode(payload, encoding), args.iterations)
+        print(
+            f"  {encoding} 默认级别：每次重新压缩 {fresh * 1000:.3f} ms，复用缓存的压缩结果 {reused * 1e6:.1f} µs"
+        )
+    print("\n* 当前配置的默认级别")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,460 @@
+"""
+待办事项API负载测试
+
+按指定数据量生成SQLite数据库，在子进程中启动uvicorn，以固定并发依次压测各个路由，
+以JSON输出每个场景的吞吐、延迟分位数和每个请求执行的SQL语句数；
+compare模式对比两次运行结果，超过阈值的退化会被标出，并以退出码1结束。
+
+SQL语句数由服务进程在引擎的 before_cursor_execute 事件中计数，通过仅在压测时注册的
+/__bench__/queries 端点读取。SSE推送(/todos/events)为长连接，不参与请求/响应压测；
+delete_completed、delete_all 会删除大量数据，默认不运行，需通过 --scenarios 显式指定。
+
+用法:
+    python -m benchmarks.bench_load run --rows 100000 --concurrency 16 --requests 2000 --output base.json
+    python -m benchmarks.bench_load run --rows 100000 --env CACHE_ENABLED=false --output nocache.json
+    python -m benchmarks.bench_load compare base.json nocache.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx
+from sqlalchemy import create_engine, text
+
+from app.database import Base
+from app.pagination import encode_cursor
+from app.search import FTS_TABLE, ensure_search_index
+from app.stats import DAILY_STATS_TABLE, STATS_TABLE, ensure_stats
+
+API = "/api/v1"
+WORDS = [f"{prefix}{suffix}" for prefix in ("学习", "项目", "会议", "部署", "测试", "文档") for suffix in range(50)]
+DEFAULT_SCENARIOS = [
+    "list_page", "list_completed", "list_cursor", "get_item", "search", "stats",
+    "create", "update", "batch", "delete",
+]
+ALL_SCENARIOS = DEFAULT_SCENARIOS + ["list_full", "delete_completed", "delete_all"]
+INSERT_TODO = text(
+    "INSERT INTO todos (title, description, completed, created_at, updated_at) "
+    "VALUES (:title, :description, :completed, :created_at, :updated_at)"
+)
+# compare模式检查的指标: (指标, 数值变大是否为退化)
+COMPARED_METRICS = [("rps", False), ("p50_ms", True), ("p99_ms", True), ("queries_per_request", True)]
+
+
+# ---------------------------------------------------------------- 数据准备
+
+def seed(path: str, rows: int, batch: int = 50000) -> None:
+    """
+    写入测试数据：先移除todos上的触发器和辅助表直接批量写入，完成后一次性重建全文索引和统计
+    """
+    rng = random.Random(42)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            triggers = conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'todos'")
+            ).scalars().all()
+            for name in triggers:
+                conn.execute(text(f"DROP TRIGGER {name}"))
+            for name in (FTS_TABLE, STATS_TABLE, DAILY_STATS_TABLE):
+                conn.execute(text(f"DROP TABLE IF EXISTS {name}"))
+
+        # 创建时间分布在最近90天内，使统计直方图和游标分页接近真实数据
+        now = datetime.utcnow()
+        for start in range(0, rows, batch):
+            values = []
+            for i in range(start, min(start + batch, rows)):
+                created = now - timedelta(seconds=rng.randint(0, 90 * 86400))
+                stamp = created.strftime("%Y-%m-%d %H:%M:%S")
+                values.append({
+                    "title": f"任务{i} {rng.choice(WORDS)}",
+                    "description": f"{rng.choice(WORDS)} {rng.choice(WORDS)} 负载测试数据",
+                    "completed": rng.random() < 0.3,
+                    "created_at": stamp,
+                    "updated_at": stamp,
+                })
+            # 以文本写入时间戳，格式与数据库默认值 CURRENT_TIMESTAMP 一致
+            with engine.begin() as conn:
+                conn.execute(INSERT_TODO, values)
+
+        with engine.begin() as conn:
+            ensure_search_index(conn)
+            ensure_stats(conn)
+    finally:
+        engine.dispose()
+
+
+def sample_keys(path: str, count: int) -> Tuple[List[int], List[str]]:
+    """
+    随机抽取已有记录的ID，以及对应位置的分页游标
+    """
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT id, created_at FROM todos ORDER BY random() LIMIT :count"), {"count": count}
+            ).all()
+    finally:
+        engine.dispose()
+    return [row.id for row in rows], [encode_cursor([row.created_at, row.id]) for row in rows]
+
+
+# ---------------------------------------------------------------- 服务进程
+
+def serve(port: int) -> None:
+    """
+    在当前进程启动API服务，并统计引擎执行的SQL语句数
+    """
+    import uvicorn
+    from sqlalchemy import event
+
+    from app.database import async_engine, engine
+    from app.main import app
+
+    counter = {"queries": 0}
+
+    def count_query(*args, **kwargs):
+        counter["queries"] += 1
+
+    event.listen(engine, "before_cursor_execute", count_query)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+
+    @app.get("/__bench__/queries", include_in_schema=False)
+    async def bench_queries():
+        return counter
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(db_path: str, env_overrides: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    """
+    以子进程启动服务，等待健康检查通过
+    """
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", **env_overrides)
+    env.pop("ASYNC_DATABASE_URL", None)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_load", "serve", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"服务进程已退出，退出码 {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("等待服务启动超时")
+
+
+# ---------------------------------------------------------------- 压测场景
+
+class Context:
+    """
+    场景共享的数据：已有记录ID、游标、待删除ID
+    """
+
+    def __init__(self, ids: List[int], cursors: List[str], rng: random.Random):
+        self.ids = ids
+        self.cursors = cursors
+        self.rng = rng
+        # 删除场景逐个消费，避免重复删除同一条记录
+        self.delete_ids = list(ids)
+        rng.shuffle(self.delete_ids)
+
+
+Request = Tuple[str, str, Optional[Dict[str, Any]], Optional[Any]]
+
+
+def build_request(name: str, ctx: Context) -> Request:
+    """
+    生成场景的一次请求: (方法, 路径, 查询参数, JSON请求体)
+    """
+    rng = ctx.rng
+    if name == "list_page":
+        return "GET", f"{API}/todos", {"limit": 50}, None
+    if name == "list_completed":
+        return "GET", f"{API}/todos", {"completed": "true", "limit": 50}, None
+    if name == "list_cursor":
+        return "GET", f"{API}/todos", {"limit": 50, "cursor": rng.choice(ctx.cursors)}, None
+    if name == "list_full":
+        return "GET", f"{API}/todos", None, None
+    if name == "get_item":
+        return "GET", f"{API}/todos/{rng.choice(ctx.ids)}", None, None
+    if name == "search":
+        return "GET", f"{API}/todos/search", {"q": rng.choice(WORDS), "limit": 20}, None
+    if name == "stats":
+        return "GET", f"{API}/todos/stats", None, None
+    if name == "create":
+        return "POST", f"{API}/todos", None, {"title": f"压测 {rng.choice(WORDS)}", "description": "负载测试"}
+    if name == "update":
+        return "PUT", f"{API}/todos/{rng.choice(ctx.ids)}", None, {"completed": rng.random() < 0.5}
+    if name == "batch":
+        operations = [{"op": "create", "data": {"title": f"批量 {rng.choice(WORDS)}"}} for _ in range(5)]
+        operations += [
+            {"op": "update", "id": rng.choice(ctx.ids), "data": {"completed": rng.random() < 0.5}}
+            for _ in range(5)
+        ]
+        return "POST", f"{API}/todos:batch", None, {"operations": operations}
+    if name == "delete":
+        todo_id = ctx.delete_ids.pop() if ctx.delete_ids else 0
+        return "DELETE", f"{API}/todos/{todo_id}", None, None
+    if name == "delete_completed":
+        return "DELETE", f"{API}/todos/completed", None, None
+    if name == "delete_all":
+        return "DELETE", f"{API}/todos/all", None, None
+    raise ValueError(f"未知的场景: {name}")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """已排序列表的分位数"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+async def query_count(client: httpx.AsyncClient) -> int:
+    response = await client.get("/__bench__/queries")
+    return response.json()["queries"]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, name: str, ctx: Context, requests: int, concurrency: int, warmup: int
+) -> Dict[str, Any]:
+    """
+    以固定并发发送requests个请求，返回吞吐、延迟分位数和平均SQL语句数
+    """
+    for _ in range(warmup if not name.startswith("delete") else 0):
+        method, url, params, body = build_request(name, ctx)
+        await client.request(method, url, params=params, json=body)
+
+    latencies: List[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, url, params, body = build_request(name, ctx)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, params=params, json=body)
+                await response.aread()
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    queries_before = await query_count(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    queries = await query_count(client) - queries_before
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "queries_per_request": round(queries / len(latencies), 3) if latencies else 0.0,
+    }
+
+
+async def drive(base_url: str, scenarios: List[str], ctx: Context, args) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        results = {}
+        for name in scenarios:
+            results[name] = await run_scenario(
+                client, name, ctx, args.requests, args.concurrency, args.warmup
+            )
+            print(
+                f"{name:>16}: {results[name]['rps']:9.1f} req/s  p50 {results[name]['p50_ms']:8.2f} ms  "
+                f"p99 {results[name]['p99_ms']:8.2f} ms  SQL/请求 {results[name]['queries_per_request']:.2f}  "
+                f"错误 {results[name]['errors']}",
+                file=sys.stderr,
+            )
+        return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> int:
+    scenarios = args.scenarios.split(",") if args.scenarios else DEFAULT_SCENARIOS
+    unknown = [name for name in scenarios if name not in ALL_SCENARIOS]
+    if unknown:
+        print(f"未知的场景: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+
+    temporary = args.db is None
+    if temporary:
+        fd, db_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        os.remove(db_path)
+    else:
+        db_path = args.db
+
+    process = None
+    try:
+        if not os.path.exists(db_path):
+            started = time.perf_counter()
+            seed(db_path, args.rows)
+            print(f"写入 {args.rows} 行耗时 {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        rng = random.Random(args.seed)
+        ids, cursors = sample_keys(db_path, max(args.requests * 2, 1000))
+        ctx = Context(ids, cursors, rng)
+
+        process, base_url = start_server(db_path, env_overrides)
+        results = asyncio.run(drive(base_url, scenarios, ctx, args))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if temporary:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+    report = {
+        "meta": {
+            "rows": args.rows,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "env": env_overrides,
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    print(output)
+    return 0
+
+
+# ---------------------------------------------------------------- 对比
+
+def compare_reports(
+    base: Dict[str, Any], current: Dict[str, Any], threshold: float
+) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    对比两次运行结果，返回各指标的相对变化及退化列表；
+    吞吐下降或延迟/SQL语句数上升超过threshold（相对值）视为退化，错误数增加也视为退化
+    """
+    changes: Dict[str, Any] = {}
+    regressions: List[str] = []
+    for name, current_result in current["scenarios"].items():
+        base_result = base["scenarios"].get(name)
+        if base_result is None:
+            continue
+        scenario_changes = {}
+        for metric, higher_is_worse in COMPARED_METRICS:
+            before, after = base_result[metric], current_result[metric]
+            change = (after - before) / before if before else (0.0 if after == before else float("inf"))
+            scenario_changes[metric] = {"base": before, "current": after, "change": round(change, 4)}
+            worse = change > threshold if higher_is_worse else change < -threshold
+            if worse:
+                regressions.append(f"{name}.{metric}: {before} -> {after} ({change:+.1%})")
+        if current_result["errors"] > base_result["errors"]:
+            regressions.append(f"{name}.errors: {base_result['errors']} -> {current_result['errors']}")
+        changes[name] = scenario_changes
+    return changes, regressions
+
+
+def compare(args) -> int:
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    changes, regressions = compare_reports(base, current, args.threshold)
+    print(json.dumps(
+        {"threshold": args.threshold, "changes": changes, "regressions": regressions},
+        ensure_ascii=False, indent=2,
+    ))
+    for line in regressions:
+        print(f"退化: {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="待办事项API负载测试")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="生成数据并压测")
+    run_parser.add_argument("--rows", type=int, default=10000, help="数据行数（1000 ~ 1000000）")
+    run_parser.add_argument("--concurrency", type=int, default=16, help="并发请求数")
+    run_parser.add_argument("--requests", type=int, default=2000, help="每个场景的请求数")
+    run_parser.add_argument("--warmup", type=int, default=50, help="每个场景的预热请求数")
+    run_parser.add_argument("--timeout", type=float, default=60.0, help="单个请求超时（秒）")
+    run_parser.add_argument("--scenarios", help=f"逗号分隔的场景，可选: {', '.join(ALL_SCENARIOS)}")
+    run_parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="服务进程的环境变量")
+    run_parser.add_argument("--db", help="数据库文件路径；不存在时生成，存在时直接复用（压测会修改其中数据）")
+    run_parser.add_argument("--seed", type=int, default=1, help="请求随机数种子")
+    run_parser.add_argument("--output", help="结果JSON文件路径")
+
+    compare_parser = commands.add_parser("compare", help="对比两次运行结果")
+    compare_parser.add_argument("base", help="基准结果JSON")
+    compare_parser.add_argument("current", help="当前结果JSON")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="判定退化的相对变化阈值")
+
+    serve_parser = commands.add_parser("serve", help=argparse.SUPPRESS)
+    serve_parser.add_argument("--port", type=int, required=True)
+
+    args = parser.parse_args()
+    if args.command == "serve":
+        serve(args.port)
+    elif args.command == "run":
+        sys.exit(run(args))
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
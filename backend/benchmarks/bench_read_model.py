@@ -0,0 +1,157 @@
+"""
+内存读模型基准测试
+
+按指定数据量生成SQLite数据库，报告：
+- 读模型加载耗时及内存占用（tracemalloc统计，换算为每百万行）
+- 列表首页、按状态筛选、任意位置游标翻页、单条详情四种读取分别走读模型和SQLite路径的延迟分位数
+
+两条路径都直接调用路由函数（不经过HTTP），并关闭响应缓存，只比较数据读取和序列化的开销。
+
+用法:
+    python -m benchmarks.bench_read_model --rows 100000 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.cache import ResponseCache
+from app.changelog import ChangeFeed
+from app.database import build_async_engine, build_engine, to_async_url
+from app.events import EventHub
+from app.maintenance import maintenance
+from app.readmodel import TodoStore
+from app.routers.todos import get_todo, get_todos
+from app.sharding import Shard
+from app.versioning import TableVersion
+from app.workspaces import DEFAULT_WORKSPACE
+from app.writer import GroupCommitWriter
+from benchmarks.bench_load import percentile, sample_keys, seed
+
+
+def build_shard(engine, async_engine, session_factory, read_model: bool) -> Shard:
+    """
+    关闭响应缓存的分片，按需开启读模型
+    """
+    feed = ChangeFeed(
+        poll_interval=0,
+        retention=1000,
+        version=TableVersion(),
+        cache=ResponseCache(max_entries=1, ttl_seconds=0, enabled=False),
+        events=EventHub(history_size=1, queue_size=1),
+        store=TodoStore(enabled=read_model),
+    )
+    shard = Shard(
+        None, engine, async_engine, session_factory, feed, GroupCommitWriter(0, 1, feed=feed), maintenance
+    )
+    shard.load()
+    return shard
+
+
+def list_request(shard: Shard, **params) -> Callable[[AsyncSession], Awaitable[Any]]:
+    arguments: Dict[str, Any] = dict(
+        completed=None, created_after=None, created_before=None, updated_since=None, title_prefix=None,
+        sort=None, limit=50, cursor=None, explain=False, if_none_match=None, accept_encoding=None,
+        workspace=DEFAULT_WORKSPACE,
+    )
+    arguments.update(params)
+    return lambda db: get_todos(**arguments, shard=shard, db=db)
+
+
+async def measure(session_factory: async_sessionmaker, requests: List[Callable[[AsyncSession], Awaitable[Any]]]) -> Dict[str, float]:
+    """
+    依次执行请求，返回延迟分位数（毫秒）
+    """
+    for request in requests[:50]:
+        async with session_factory() as db:
+            await request(db)
+    latencies = []
+    for request in requests:
+        started = time.perf_counter()
+        async with session_factory() as db:
+            await request(db)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "mean": sum(latencies) / len(latencies) * 1000,
+    }
+
+
+async def compare(args, path: str) -> None:
+    engine = build_engine(f"sqlite:///{path}")
+    async_engine = build_async_engine(to_async_url(f"sqlite:///{path}"))
+    session_factory = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+    try:
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        cached = build_shard(engine, async_engine, session_factory, read_model=True)
+        used = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        # 加载耗时不含tracemalloc的开销
+        cached = build_shard(engine, async_engine, session_factory, read_model=True)
+        status = cached.store.status()
+        print(
+            f"读模型: {status['rows']} 行，加载 {status['load_seconds']:.2f} s，"
+            f"内存 {used / 1024 / 1024:.1f} MB（每百万行约 {used / max(status['rows'], 1) * 1e6 / 1024 / 1024:.0f} MB）"
+        )
+        direct = build_shard(engine, async_engine, session_factory, read_model=False)
+
+        rng = random.Random(args.seed)
+        ids, cursors = sample_keys(path, args.requests)
+        scenarios = {
+            "list_page": lambda shard: [list_request(shard)] * args.requests,
+            "list_completed": lambda shard: [list_request(shard, completed=True)] * args.requests,
+            "list_cursor": lambda shard: [list_request(shard, cursor=cursor) for cursor in cursors],
+            "get_item": lambda shard: [
+                (lambda db, todo_id=todo_id: get_todo(todo_id, None, DEFAULT_WORKSPACE, shard, db)) for todo_id in ids
+            ],
+        }
+        for name, build in scenarios.items():
+            rng.shuffle(cursors)
+            results = {}
+            for label, shard in (("SQLite", direct), ("读模型", cached)):
+                results[label] = await measure(session_factory, build(shard))
+            print(
+                f"{name:>15}: SQLite p50 {results['SQLite']['p50']:.3f} ms / p99 {results['SQLite']['p99']:.3f} ms  "
+                f"读模型 p50 {results['读模型']['p50']:.3f} ms / p99 {results['读模型']['p99']:.3f} ms  "
+                f"({results['SQLite']['mean'] / results['读模型']['mean']:.1f}x)"
+            )
+    finally:
+        await async_engine.dispose()
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内存读模型基准")
+    parser.add_argument("--rows", type=int, default=100000, help="数据行数")
+    parser.add_argument("--requests", type=int, default=2000, help="每个场景的请求数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    try:
+        started = time.perf_counter()
+        seed(path, args.rows)
+        print(f"写入 {args.rows} 行耗时 {time.perf_counter() - started:.1f}s")
+        asyncio.run(compare(args, path))
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+列表序列化基准测试
+
+对比两条列表响应路径的耗时（含查询）：
+- pydantic: 查询ORM实体 -> TodosResponse(from_attributes) -> model_dump_json
+- fast:     查询列元组 -> encode_todos 直接编码
+
+用法:
+    python -m benchmarks.bench_serialization --rows 10000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.database import Base
+from app.models import Todo
+from app.schemas import TodosResponse
+from app.serialization import TODO_COLUMNS, encode_todos, orjson
+
+
+def main():
+    parser = argparse.ArgumentParser(description="列表序列化基准")
+    parser.add_argument("--rows", type=int, default=10000, help="列表行数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最佳值")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as conn:
+            conn.execute(
+                insert(Todo),
+                [
+                    {"title": f"任务{i}", "description": "详细描述" * 20, "completed": i % 2 == 0}
+                    for i in range(args.rows)
+                ],
+            )
+        order = (Todo.created_at.desc(), Todo.id.desc())
+
+        def pydantic_path() -> bytes:
+            with Session(engine) as db:
+                todos = db.scalars(select(Todo).order_by(*order)).all()
+                return TodosResponse(data=todos).model_dump_json().encode("utf-8")
+
+        def fast_path() -> bytes:
+            with Session(engine) as db:
+                return encode_todos(db.execute(select(*TODO_COLUMNS).order_by(*order)).all())
+
+        assert pydantic_path() == fast_path()
+        print(f"编码器: {'orjson' if orjson is not None else 'json'}，{args.rows} 行")
+        for name, func in (("pydantic", pydantic_path), ("fast", fast_path)):
+            best = float("inf")
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                func()
+                best = min(best, time.perf_counter() - started)
+            print(f"{name:>8}: {best * 1000:8.1f} ms")
+    finally:
+        engine.dispose()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
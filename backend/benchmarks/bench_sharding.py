@@ -0,0 +1,131 @@
+"""
+分片基准测试
+
+分别以单个数据库（SHARD_COUNT=0）和 --shards 个分片启动服务，多个并发连接分属 --workspaces 个工作空间，
+各自在自己的工作空间内持续发送单条写请求（创建、更新、删除交替），报告写吞吐、延迟分位数和失败数。
+单个SQLite数据库同一时刻只有一个写事务，分片后不同分片的写入可以并行提交；
+--synchronous FULL 时每次提交都要fsync，最能体现分片的收益。
+
+用法:
+    python -m benchmarks.bench_sharding --shards 4 --workspaces 64 --concurrency 64 --duration 10
+    python -m benchmarks.bench_sharding --synchronous FULL
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_load import percentile, start_server
+from benchmarks.bench_write_coalescing import request
+
+
+async def worker(host: str, port: int, workspace: str, deadline: float, rng: random.Random,
+                 latencies: List[float], errors: Dict[str, int]) -> None:
+    """在一个工作空间内循环发送写请求直到截止时间"""
+    headers = {"X-Workspace": workspace}
+    ids: List[int] = []
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            kind = rng.choice(("create", "update", "delete"))
+            started = time.perf_counter()
+            try:
+                if kind == "create" or not ids:
+                    status, body = await request(
+                        reader, writer, "POST", "/api/v1/todos", {"title": f"写入{rng.random()}"}, headers
+                    )
+                    if status == 200:
+                        ids.append(json.loads(body)["data"]["id"])
+                elif kind == "update":
+                    status, _ = await request(
+                        reader, writer, "PUT", f"/api/v1/todos/{rng.choice(ids)}",
+                        {"completed": rng.random() < 0.5}, headers,
+                    )
+                else:
+                    todo_id = ids.pop(rng.randrange(len(ids)))
+                    status, _ = await request(reader, writer, "DELETE", f"/api/v1/todos/{todo_id}", None, headers)
+            except (OSError, asyncio.IncompleteReadError) as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                return
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+async def drive(base_url: str, workspaces: int, concurrency: int, duration: float) -> Dict[str, object]:
+    """并发压测写接口，连接按序号轮流分配到各工作空间"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    host, port = urlsplit(base_url).hostname, urlsplit(base_url).port
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker(host, port, f"ws{i % workspaces}", deadline, random.Random(i), latencies, errors)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "ops": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+    }
+
+
+def run_mode(args, shard_count: int) -> Dict[str, object]:
+    """以指定分片数启动服务并压测"""
+    workdir = tempfile.mkdtemp()
+    env = {
+        "SHARD_COUNT": str(shard_count),
+        "SHARD_URL": f"sqlite:///{workdir}/shards/todos-{{shard}}.db",
+        "SQLITE_SYNCHRONOUS": args.synchronous,
+        "WRITE_COALESCING": "false",
+        "METRICS_ENABLED": "false",
+        "CACHE_ENABLED": "false",
+    }
+    process, base_url = start_server(os.path.join(workdir, "todos.db"), env)
+    try:
+        return asyncio.run(drive(base_url, args.workspaces, args.concurrency, args.duration))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="分片基准")
+    parser.add_argument("--shards", type=int, default=4, help="分片数")
+    parser.add_argument("--workspaces", type=int, default=64, help="工作空间数")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发连接数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种模式压测秒数")
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"], help="SQLite同步级别")
+    args = parser.parse_args()
+
+    results = {}
+    for name, shard_count in (("单个数据库", 0), (f"{args.shards} 个分片", args.shards)):
+        results[name] = result = run_mode(args, shard_count)
+        print(
+            f"{name}: {result['rps']:,.0f} 次写/秒, p50 {result['p50']:.1f} ms, p99 {result['p99']:.1f} ms, "
+            f"失败 {sum(result['errors'].values())} {result['errors'] or ''}"
+        )
+    baseline, sharded = results["单个数据库"]["rps"], results[f"{args.shards} 个分片"]["rps"]
+    if baseline:
+        print(f"写吞吐提升: {sharded / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+启动耗时基准测试
+
+多次启动全新的Python进程，报告：
+- 导入耗时：import app.main 的耗时，以及进程从启动到导入完成的总耗时
+- 首个请求耗时：从启动uvicorn子进程到 /health 和列表接口第一次返回200的耗时，
+  分别在新数据库（需要建表）和已有数据库（表结构哈希一致，跳过建表）上测量
+
+--importtime 按顶层包汇总 python -X importtime 的自身耗时，便于定位新增的重量级导入；
+--output 以JSON保存结果，便于在不同版本之间对比。
+
+用法:
+    python -m benchmarks.bench_startup --runs 10
+    python -m benchmarks.bench_startup --rows 100000 --importtime --output startup.json
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_load import BACKEND_DIR, free_port, seed
+
+IMPORT_SCRIPT = (
+    "import time; started = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def child_env(db_path: str) -> Dict[str, str]:
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}")
+    env.pop("ASYNC_DATABASE_URL", None)
+    return env
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """中位数和最小值（毫秒）"""
+    return {"median": statistics.median(samples) * 1000, "min": min(samples) * 1000}
+
+
+def measure_import(db_path: str, runs: int) -> Dict[str, Dict[str, float]]:
+    """
+    每次新建进程导入应用，返回导入耗时和进程总耗时
+    """
+    imports, processes = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SCRIPT], cwd=BACKEND_DIR, env=child_env(db_path),
+            capture_output=True, text=True, check=True,
+        ).stdout
+        processes.append(time.perf_counter() - started)
+        imports.append(float(output.strip().splitlines()[-1]))
+    return {"import": summarize(imports), "process": summarize(processes)}
+
+
+def get_status(port: int, path: str) -> Optional[int]:
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        connection.request("GET", path)
+        return connection.getresponse().status
+    except OSError:
+        return None
+    finally:
+        connection.close()
+
+
+def first_request(db_path: str) -> Dict[str, float]:
+    """
+    启动uvicorn子进程，返回到健康检查和列表接口第一次成功的耗时（秒）
+    """
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=child_env(db_path),
+    )
+    try:
+        deadline = started + 60
+        while get_status(port, "/health") != 200:
+            if process.poll() is not None:
+                raise RuntimeError(f"服务进程已退出，退出码 {process.returncode}")
+            if time.perf_counter() > deadline:
+                raise RuntimeError("等待服务启动超时")
+            time.sleep(0.005)
+        health = time.perf_counter() - started
+        if get_status(port, "/api/v1/todos?limit=1") != 200:
+            raise RuntimeError("列表接口请求失败")
+        return {"health": health, "list": time.perf_counter() - started}
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def measure_first_request(db_path: str, runs: int) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """
+    新数据库只能测一次（之后表已存在），因此每次都换一个新文件；已有数据库重复启动同一个文件
+    """
+    fresh: Dict[str, List[float]] = defaultdict(list)
+    for run in range(runs):
+        path = f"{db_path}.fresh{run}"
+        try:
+            for key, value in first_request(path).items():
+                fresh[key].append(value)
+        finally:
+            remove_database(path)
+    existing: Dict[str, List[float]] = defaultdict(list)
+    first_request(db_path)  # 确保已有数据库的表结构哈希已写入
+    for _ in range(runs):
+        for key, value in first_request(db_path).items():
+            existing[key].append(value)
+    return {
+        "fresh": {key: summarize(values) for key, values in fresh.items()},
+        "existing": {key: summarize(values) for key, values in existing.items()},
+    }
+
+
+def import_breakdown(db_path: str, top: int) -> List[List]:
+    """
+    按顶层包汇总 -X importtime 的自身耗时（毫秒）
+    """
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=BACKEND_DIR, env=child_env(db_path),
+        capture_output=True, text=True, check=True,
+    ).stderr
+    totals: Dict[str, float] = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        package = ".".join(name.split(".")[:2]) if name.startswith("app.") else name.split(".")[0]
+        totals[package] += int(self_us) / 1000
+    return [[name, round(ms, 1)] for name, ms in sorted(totals.items(), key=lambda item: -item[1])[:top]]
+
+
+def remove_database(path: str) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=10, help="每项测量的启动次数")
+    parser.add_argument("--rows", type=int, default=0, help="已有数据库中的数据行数")
+    parser.add_argument("--importtime", action="store_true", help="按顶层包列出导入耗时")
+    parser.add_argument("--top", type=int, default=15, help="--importtime 列出的包数")
+    parser.add_argument("--output", help="结果JSON文件")
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    os.remove(path)
+    try:
+        if args.rows:
+            seed(path, args.rows)
+        results = {"python": sys.version.split()[0], "rows": args.rows}
+        results.update(measure_import(path, args.runs))
+        results.update(measure_first_request(path, args.runs))
+        if args.importtime:
+            results["importtime"] = import_breakdown(path, args.top)
+    finally:
+        remove_database(path)
+
+    print(f"导入 app.main: 中位数 {results['import']['median']:.0f} ms（进程总耗时 {results['process']['median']:.0f} ms）")
+    for name, label in (("fresh", "新数据库"), ("existing", "已有数据库")):
+        timings = results[name]
+        print(
+            f"{label}: 健康检查 {timings['health']['median']:.0f} ms，"
+            f"首个列表请求 {timings['list']['median']:.0f} ms（中位数）"
+        )
+    for name, ms in results.get("importtime", []):
+        print(f"    {name:<30} {ms:>8.1f} ms")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
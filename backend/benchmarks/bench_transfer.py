@@ -0,0 +1,98 @@
+"""
+导出/导入基准测试
+
+在子进程中启动服务，先流式导出全部数据，再将导出内容流式导入到同一个库中，
+报告吞吐以及服务进程在每个阶段的内存峰值，用于确认内存占用不随数据量增长。
+
+用法:
+    python -m benchmarks.bench_transfer --rows 1000000 --format ndjson
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from benchmarks.bench_load import seed, start_server
+
+
+def rss_mb(pid: int) -> float:
+    """进程当前常驻内存（Linux）"""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式导出/导入基准")
+    parser.add_argument("--rows", type=int, default=1000000, help="数据行数")
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson", help="导出格式")
+    parser.add_argument("--chunk", type=int, default=64 * 1024, help="上传数据块大小")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "todos.db")
+    dump_path = os.path.join(workdir, f"todos.{args.format}")
+    started = time.perf_counter()
+    seed(db_path, args.rows)
+    print(f"写入 {args.rows} 行耗时 {time.perf_counter() - started:.1f}s")
+
+    process, base_url = start_server(db_path, {"METRICS_ENABLED": "false"})
+    try:
+        baseline = rss_mb(process.pid)
+        print(f"服务进程初始内存 {baseline:.0f} MB")
+
+        peak = baseline
+        started = time.perf_counter()
+        size = 0
+        with httpx.stream(
+            "GET", f"{base_url}/api/v1/todos/export", params={"format": args.format}, timeout=None
+        ) as response, open(dump_path, "wb") as f:
+            for chunk in response.iter_bytes():
+                f.write(chunk)
+                size += len(chunk)
+                peak = max(peak, rss_mb(process.pid))
+        elapsed = time.perf_counter() - started
+        print(
+            f"导出: {elapsed:.1f}s, {args.rows / elapsed:,.0f} 行/秒, {size / 1024 / 1024:.0f} MB, "
+            f"内存峰值 {peak:.0f} MB"
+        )
+
+        peak = rss_mb(process.pid)
+
+        def upload():
+            nonlocal peak
+            with open(dump_path, "rb") as f:
+                while True:
+                    chunk = f.read(args.chunk)
+                    if not chunk:
+                        break
+                    peak = max(peak, rss_mb(process.pid))
+                    yield chunk
+
+        started = time.perf_counter()
+        response = httpx.post(
+            f"{base_url}/api/v1/todos/import",
+            params={"format": args.format},
+            content=upload(),
+            timeout=None,
+        )
+        elapsed = time.perf_counter() - started
+        imported = response.json()["data"]["imported"]
+        print(f"导入: {elapsed:.1f}s, {imported / elapsed:,.0f} 行/秒, 内存峰值 {peak:.0f} MB")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+
+if __name__ == "__main__":
+    main()
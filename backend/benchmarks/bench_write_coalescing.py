@@ -0,0 +1,150 @@
+"""
+写合并基准测试
+
+分别以关闭/开启 WRITE_COALESCING 启动服务，用多个并发连接持续发送单条写请求
+（创建、更新、删除交替），报告写吞吐、延迟分位数和失败数。
+--synchronous FULL 时每次提交都要fsync，最能体现合并提交的收益。
+
+用法:
+    python -m benchmarks.bench_write_coalescing --concurrency 64 --duration 10
+    python -m benchmarks.bench_write_coalescing --synchronous FULL --window-ms 2 --max-batch 256
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_load import percentile, seed, start_server
+
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                  payload: Optional[dict] = None, headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+    """
+    在keep-alive连接上发送一个HTTP/1.1请求；单核机器上httpx客户端本身就会成为瓶颈，这里直接读写套接字
+    """
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    extra = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n{extra}"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    head = await reader.readuntil(b"\r\n\r\n")
+    length = 0
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    return int(head[9:12]), await reader.readexactly(length)
+
+
+async def worker(host: str, port: int, ids: List[int], deadline: float, rng: random.Random,
+                 latencies: List[float], errors: Dict[str, int]) -> None:
+    """循环发送写请求直到截止时间"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            kind = rng.choice(("create", "update", "delete"))
+            started = time.perf_counter()
+            try:
+                if kind == "create" or not ids:
+                    status, body = await request(reader, writer, "POST", "/api/v1/todos", {"title": f"写入{rng.random()}"})
+                    if status == 200:
+                        ids.append(json.loads(body)["data"]["id"])
+                elif kind == "update":
+                    todo_id = rng.choice(ids)
+                    status, _ = await request(
+                        reader, writer, "PUT", f"/api/v1/todos/{todo_id}", {"completed": rng.random() < 0.5}
+                    )
+                else:
+                    todo_id = ids.pop(rng.randrange(len(ids)))
+                    status, _ = await request(reader, writer, "DELETE", f"/api/v1/todos/{todo_id}")
+            except (OSError, asyncio.IncompleteReadError) as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+                return
+            # 并发删除可能使更新目标已不存在，404不计为失败
+            if status not in (200, 404):
+                errors[str(status)] = errors.get(str(status), 0) + 1
+                continue
+            latencies.append(time.perf_counter() - started)
+    finally:
+        writer.close()
+
+
+async def drive(base_url: str, ids: List[int], concurrency: int, duration: float) -> Dict[str, object]:
+    """并发压测写接口"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    host, port = urlsplit(base_url).hostname, urlsplit(base_url).port
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker(host, port, ids, deadline, random.Random(i), latencies, errors) for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "ops": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+    }
+
+
+def run_mode(args, coalescing: bool) -> Dict[str, object]:
+    """以指定模式启动服务并压测"""
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, "todos.db")
+    seed(db_path, args.rows)
+    env = {
+        "WRITE_COALESCING": "true" if coalescing else "false",
+        "WRITE_BATCH_WINDOW_MS": str(args.window_ms),
+        "WRITE_BATCH_MAX_SIZE": str(args.max_batch),
+        "SQLITE_SYNCHRONOUS": args.synchronous,
+        "METRICS_ENABLED": "false",
+        "CACHE_ENABLED": "false",
+    }
+    process, base_url = start_server(db_path, env)
+    try:
+        ids = list(range(1, args.rows + 1))
+        return asyncio.run(drive(base_url, ids, args.concurrency, args.duration))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="写合并基准")
+    parser.add_argument("--rows", type=int, default=10000, help="初始数据行数")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发连接数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种模式压测秒数")
+    parser.add_argument("--window-ms", type=float, default=2.0, help="WRITE_BATCH_WINDOW_MS")
+    parser.add_argument("--max-batch", type=int, default=256, help="WRITE_BATCH_MAX_SIZE")
+    parser.add_argument("--synchronous", default="NORMAL", choices=["OFF", "NORMAL", "FULL"], help="SQLite同步级别")
+    args = parser.parse_args()
+
+    results = {}
+    for name, coalescing in (("逐条提交", False), ("合并提交", True)):
+        results[name] = result = run_mode(args, coalescing)
+        print(
+            f"{name}: {result['rps']:,.0f} 次写/秒, p50 {result['p50']:.1f} ms, p99 {result['p99']:.1f} ms, "
+            f"失败 {sum(result['errors'].values())} {result['errors'] or ''}"
+        )
+    baseline, coalesced = results["逐条提交"]["rps"], results["合并提交"]["rps"]
+    if baseline:
+        print(f"写吞吐提升: {coalesced / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
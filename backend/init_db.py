@@ -1,13 +1,44 @@
 """
 数据库初始化脚本
+
+    python init_db.py                                  # 创建数据库表和示例数据
+    python init_db.py --generate 1000000               # 生成100万条模拟数据
+    python init_db.py --generate 100000 --completed-ratio 0.6 --title-length 30 \
+        --description-length 200 --days 730            # 指定完成比例、文本长度和时间跨度
 """
-from app.database import engine, SessionLocal
-from app.models import Base, Todo
+import argparse
+import random
+import time
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import insert
+
+from app.config import settings
+from app.database import engine, SessionLocal, init_db, schema_info
+from app.models import Todo
+from app.search import drop_search_index, ensure_search_index
+from app.stats import drop_stats, ensure_stats
+
+# 生成文本使用的词库
+WORDS = [
+    "学习", "项目", "文档", "会议", "部署", "测试", "审查", "优化", "数据库", "接口", "发布", "预算",
+    "整理", "需求", "设计", "评审", "客户", "报告", "周会", "迭代", "修复", "缺陷", "上线", "监控",
+    "FastAPI", "React", "SQLite", "API", "Docker", "CI", "review", "deploy", "refactor", "cache",
+]
+
+# 已完成记录的完成时间取更新时间
+INSERT_SQL = (
+    "INSERT INTO todos (title, description, completed, created_at, updated_at, completed_at) "
+    "VALUES (?1, ?2, ?3, ?4, ?5, CASE WHEN ?3 THEN ?5 END)"
+)
+
+# 批量写入期间放宽的PRAGMA：不等待fsync、加大页缓存；写入中途断电可能损坏数据库，只用于生成测试数据
+LOAD_PRAGMAS = ["synchronous=OFF", "cache_size=-262144", "temp_store=MEMORY"]
 
 def create_tables():
     """创建数据库表"""
     print("正在创建数据库表...")
-    Base.metadata.create_all(bind=engine)
+    init_db()
     print("✓ 数据库表创建成功")
 
 def create_sample_data():
@@ -15,59 +46,201 @@ def create_sample_data():
     db = SessionLocal()
     try:
         print("正在创建示例数据...")
-        
+
         # 检查是否已有数据
         existing_todos = db.query(Todo).count()
         if existing_todos > 0:
             print(f"数据库中已有 {existing_todos} 条记录，跳过示例数据创建")
             return
-        
+
         # 创建示例待办事项
         sample_todos = [
-            Todo(
-                title="学习FastAPI框架",
-                description="完成FastAPI官方文档的学习，掌握基本用法",
-                completed=False
-            ),
-            Todo(
-                title="完成项目文档编写",
-                description="编写技术架构文档和API接口文档",
-                completed=True
-            ),
-            Todo(
-                title="进行代码审查",
-                description="审查待办事项应用的后端代码质量",
-                completed=False
-            ),
-            Todo(
-                title="部署到生产环境",
-                description="将应用部署到服务器并进行测试",
-                completed=False
-            )
+            {
+                "title": "学习FastAPI框架",
+                "description": "完成FastAPI官方文档的学习，掌握基本用法",
+                "completed": False
+            },
+            {
+                "title": "完成项目文档编写",
+                "description": "编写技术架构文档和API接口文档",
+                "completed": True
+            },
+            {
+                "title": "进行代码审查",
+                "description": "审查待办事项应用的后端代码质量",
+                "completed": False
+            },
+            {
+                "title": "部署到生产环境",
+                "description": "将应用部署到服务器并进行测试",
+                "completed": False
+            }
         ]
-        
-        for todo in sample_todos:
-            db.add(todo)
-        
+
+        # 一条多行INSERT写入
+        db.execute(insert(Todo), sample_todos)
         db.commit()
         print(f"✓ 成功创建 {len(sample_todos)} 条示例数据")
-        
+
     except Exception as e:
         print(f"✗ 创建示例数据失败: {e}")
         db.rollback()
     finally:
         db.close()
 
+def build_corpus(rng: random.Random, size: int = 1 << 20) -> str:
+    """由词库随机拼接的长文本，生成文本时从中随机截取片段，避免逐词拼接"""
+    parts: List[str] = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)
+
+def random_text(rng: random.Random, corpus: str, length: int, limit: int) -> str:
+    """截取长度在 length 的 50% ~ 150% 之间（不超过limit）的随机文本"""
+    target = min(rng.randint(max(1, length // 2), max(1, length * 3 // 2)), limit)
+    start = rng.randrange(len(corpus) - target)
+    return corpus[start:start + target].strip() or corpus[:target]
+
+def generate_rows(
+    count: int,
+    completed_ratio: float,
+    title_length: int,
+    description_length: int,
+    days: int,
+    seed: int
+) -> Iterator[Tuple[str, object, bool, str, str]]:
+    """
+    逐行生成模拟数据: (title, description, completed, created_at, updated_at)
+
+    创建时间均匀分布在最近days天内，更新时间在创建时间之后；
+    时间格式与数据库默认值 CURRENT_TIMESTAMP 一致
+    """
+    rng = random.Random(seed)
+    corpus = build_corpus(rng)
+    now = int(time.time())
+    span = max(days, 0) * 86400
+    for _ in range(count):
+        created = now - rng.randint(0, span)
+        updated = created + rng.randint(0, now - created)
+        description = random_text(rng, corpus, description_length, 1000) if description_length > 0 else None
+        yield (
+            random_text(rng, corpus, title_length, 255),
+            description,
+            rng.random() < completed_ratio,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(created)),
+            time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(updated)),
+        )
+
+def generate_data(
+    count: int,
+    completed_ratio: float = 0.3,
+    title_length: int = 20,
+    description_length: int = 80,
+    days: int = 365,
+    batch_size: int = 100000,
+    seed: int = 42
+) -> float:
+    """
+    批量生成模拟数据，返回写入速度（行/秒）
+
+    写入前移除全文索引和统计触发器，每batch_size行一个事务通过executemany写入，
+    完成后一次性重建全文索引并重新计算统计数据。移除时一并清除表结构哈希，
+    写入中途失败或中断时，下次启动的 init_db 会重建缺少的全文索引和统计表
+    """
+    rows = generate_rows(count, completed_ratio, title_length, description_length, days, seed)
+
+    with engine.connect() as connection:
+        for pragma in LOAD_PRAGMAS:
+            connection.exec_driver_sql(f"PRAGMA {pragma}")
+        connection.commit()
+
+        with connection.begin():
+            drop_search_index(connection)
+            drop_stats(connection)
+            connection.execute(schema_info.delete())
+
+        started = time.perf_counter()
+        written = 0
+        while written < count:
+            batch = [next(rows) for _ in range(min(batch_size, count - written))]
+            with connection.begin():
+                connection.exec_driver_sql(INSERT_SQL, batch)
+            written += len(batch)
+            elapsed = time.perf_counter() - started
+            print(f"  已写入 {written}/{count} 行，{written / elapsed:,.0f} 行/秒", end="\r", flush=True)
+        load_seconds = time.perf_counter() - started
+        print()
+
+        print("正在重建全文索引和统计数据...")
+        rebuild_started = time.perf_counter()
+        with connection.begin():
+            ensure_search_index(connection)
+            ensure_stats(connection)
+        rebuild_seconds = time.perf_counter() - rebuild_started
+        connection.exec_driver_sql("PRAGMA optimize")
+        # 连接归还连接池前关闭，避免放宽的PRAGMA被后续请求复用
+        connection.invalidate()
+    # 重新写入表结构哈希
+    init_db()
+
+    rate = count / load_seconds if load_seconds > 0 else 0.0
+    total_seconds = load_seconds + rebuild_seconds
+    print(f"✓ 写入 {count} 行耗时 {load_seconds:.1f}s（{rate:,.0f} 行/秒），重建索引耗时 {rebuild_seconds:.1f}s")
+    print(f"  含索引重建的整体速度: {count / total_seconds:,.0f} 行/秒")
+    return rate
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="初始化数据库或生成模拟数据")
+    parser.add_argument("--generate", type=int, metavar="N", help="生成N条模拟数据（不创建示例数据）")
+    parser.add_argument("--completed-ratio", type=float, default=0.3, help="已完成的比例，默认0.3")
+    parser.add_argument("--title-length", type=int, default=20, help="标题平均长度（字符），默认20")
+    parser.add_argument("--description-length", type=int, default=80, help="描述平均长度（字符），0表示不生成描述，默认80")
+    parser.add_argument("--days", type=int, default=365, help="创建时间分布在最近多少天内，默认365")
+    parser.add_argument("--batch-size", type=int, default=100000, help="每个事务写入的行数，默认100000")
+    parser.add_argument("--seed", type=int, default=42, help="随机数种子")
+    args = parser.parse_args()
+    if args.generate is not None and args.generate <= 0:
+        parser.error("--generate 必须为正整数")
+    if not 0 <= args.completed_ratio <= 1:
+        parser.error("--completed-ratio 必须在0到1之间")
+    if not 1 <= args.title_length <= 255:
+        parser.error("--title-length 必须在1到255之间")
+    if not 0 <= args.description_length <= 1000:
+        parser.error("--description-length 必须在0到1000之间")
+    return args
+
 def main():
     """主函数"""
+    args = parse_args()
+    if args.generate and settings.shard_count > 0:
+        # 模拟数据写入默认数据库，开启分片时应用不会读取
+        raise SystemExit((
+            "开启分片（SHARD_COUNT>0）时不支持 --generate：请在 SHARD_COUNT=0 时生成，"
+            "再用 python -m app.sharding rebalance --shards N --source <数据库地址> 迁入分片"
+        ))
     print("开始初始化数据库...")
-    
+
     create_tables()
-    create_sample_data()
-    
+    if args.generate:
+        print(f"正在生成 {args.generate} 条模拟数据...")
+        generate_data(
+            args.generate,
+            completed_ratio=args.completed_ratio,
+            title_length=args.title_length,
+            description_length=args.description_length,
+            days=args.days,
+            batch_size=args.batch_size,
+            seed=args.seed
+        )
+    else:
+        create_sample_data()
+
     print("\n数据库初始化完成！")
     print("可以运行 'python run_server.py' 启动服务器")
 
 if __name__ == "__main__":
     main()
-
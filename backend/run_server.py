@@ -1,22 +1,162 @@
 """
-启动开发服务器脚本
+启动服务器脚本
+
+    python run_server.py                         # 开发模式：单进程，代码修改后自动重载
+    python run_server.py --prod                  # 生产模式：每个CPU核心一个工作进程
+    python run_server.py --prod --workers 4 --port 8080
+
+生产模式优先使用gunicorn管理uvicorn工作进程：主进程预先导入应用并建表（工作进程启动时
+表结构哈希一致，只需一次读取；工作进程共享只读内存页），工作进程异常退出后自动拉起，并支持信号控制的平滑重启：
+
+    kill -HUP  <主进程PID>    # 逐个启动新工作进程并平滑关闭旧进程（重新加载配置）
+    kill -USR2 <主进程PID>    # 启动运行新代码的主进程，确认正常后向旧主进程发送 -TERM
+
+gunicorn不可用（如Windows）时退回uvicorn自带的多进程模式，不支持预加载和平滑重启。
+各工作进程的缓存、版本号和事件推送通过数据库中的变更日志保持一致（见 app/changelog.py）。
 """
-import uvicorn
-import sys
+import argparse
 import os
+import sys
+
+import uvicorn
+
+APP = "app.main:app"
+
+
+def default_workers() -> int:
+    """默认工作进程数：WEB_CONCURRENCY环境变量，未设置时为CPU核心数"""
+    value = os.getenv("WEB_CONCURRENCY")
+    return int(value) if value else (os.cpu_count() or 1)
+
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="启动待办事项API服务")
+    parser.add_argument("--prod", action="store_true", help="生产模式：多工作进程，不自动重载")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址，默认0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口，默认8000")
+    parser.add_argument("--workers", type=int, default=None, help="工作进程数，默认为CPU核心数")
+    parser.add_argument("--backlog", type=int, default=2048, help="等待accept的连接队列长度，默认2048")
+    parser.add_argument(
+        "--keep-alive", type=int, default=75,
+        help="空闲keep-alive连接保持的秒数，默认75（应大于前置负载均衡的空闲超时）"
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=30,
+        help="重启或停止时等待进行中请求完成的秒数，默认30"
+    )
+    parser.add_argument(
+        "--max-requests", type=int, default=0,
+        help="工作进程处理多少个请求后自动轮换重启（带随机抖动），0表示不轮换"
+    )
+    args = parser.parse_args()
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers 必须为正整数")
+    return args
+
+
+def prepare_schema() -> None:
+    """
+    在主进程建表，避免多个工作进程同时执行DDL（分片在工作进程中首次使用时创建）
+    """
+    from app.config import settings
+    from app.database import engine, init_db
+
+    if not settings.shard_count:
+        init_db()
+    engine.dispose()
+
+
+def post_fork(server, worker):
+    """
+    工作进程fork后丢弃从主进程继承的数据库连接，SQLite连接不能跨进程使用
+    """
+    from app.database import async_engine, engine
+
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+
+def run_gunicorn(args, workers: int) -> None:
+    """使用gunicorn管理uvicorn工作进程"""
+    from gunicorn.app.base import BaseApplication
+
+    options = {
+        "bind": f"{args.host}:{args.port}",
+        "workers": workers,
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": True,
+        "backlog": args.backlog,
+        "keepalive": args.keep_alive,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.graceful_timeout + 30,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10,
+        "post_fork": post_fork,
+        "accesslog": "-",
+    }
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app.main import app
+            prepare_schema()
+            return app
+
+    Application().run()
+
+
+def run_uvicorn_workers(args, workers: int) -> None:
+    """使用uvicorn自带的多进程模式"""
+    prepare_schema()
+    uvicorn.run(
+        APP,
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        limit_max_requests=args.max_requests or None,
+        log_level="info"
+    )
+
+
+def run_production(args) -> None:
+    """启动生产模式"""
+    workers = args.workers or default_workers()
+    print(f"正在以生产模式启动 {workers} 个工作进程: http://{args.host}:{args.port}")
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+    if gunicorn is not None and sys.platform != "win32":
+        run_gunicorn(args, workers)
+    else:
+        print("未安装gunicorn，使用uvicorn多进程模式（不支持预加载和平滑重启）")
+        run_uvicorn_workers(args, workers)
+
 
 def main():
-    """启动FastAPI开发服务器"""
+    """启动FastAPI服务器"""
+    args = parse_args()
     try:
+        if args.prod:
+            run_production(args)
+            return
+
         print("正在启动FastAPI开发服务器...")
-        print("API文档地址: http://localhost:8000/docs")
-        print("ReDoc文档地址: http://localhost:8000/redoc")
+        print(f"API文档地址: http://localhost:{args.port}/docs")
+        print(f"ReDoc文档地址: http://localhost:{args.port}/redoc")
         print("按 Ctrl+C 停止服务器")
-        
+
         uvicorn.run(
-            "app.main:app",
-            host="0.0.0.0",
-            port=8000,
+            APP,
+            host=args.host,
+            port=args.port,
             reload=True,
             reload_dirs=["app"],
             log_level="info"
@@ -29,4 +169,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
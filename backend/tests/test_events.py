@@ -0,0 +1,56 @@
+"""
+变更事件广播测试
+"""
+import asyncio
+
+from app.events import CHANGE_EVENT, RESET_EVENT, EventHub, change_payload
+
+
+def test_publish_and_resume():
+    """测试发布、订阅及按序号续传"""
+    async def scenario():
+        hub = EventHub(history_size=10, queue_size=10)
+        live = hub.subscribe()
+        for seq in range(1, 4):
+            hub.publish(seq, change_payload(deleted=[seq]))
+        
+        first = await live.next_event(timeout=0.1)
+        assert first.event == CHANGE_EVENT
+        assert first.data["deleted"] == [1]
+        
+        # 断线重连后只补发序号之后的事件
+        resumed = hub.subscribe(since=2)
+        event = await resumed.next_event(timeout=0.1)
+        assert event.seq == 3
+        assert await resumed.next_event(timeout=0.01) is None
+    
+    asyncio.run(scenario())
+
+
+def test_slow_subscriber_gets_reset():
+    """测试队列写满的订阅者收到reset事件"""
+    async def scenario():
+        hub = EventHub(history_size=10, queue_size=2)
+        slow = hub.subscribe()
+        for seq in range(1, 5):
+            hub.publish(seq, change_payload(deleted=[seq]))
+        
+        assert slow.overflowed
+        seqs = [(await slow.next_event(timeout=0.1)).seq for _ in range(2)]
+        assert seqs == [1, 2]
+        assert (await slow.next_event(timeout=0.1)).event == RESET_EVENT
+    
+    asyncio.run(scenario())
+
+
+def test_expired_history_gets_reset():
+    """测试续传位置已超出缓冲区时收到reset事件"""
+    async def scenario():
+        hub = EventHub(history_size=2, queue_size=10)
+        for seq in range(1, 6):
+            hub.publish(seq, change_payload(deleted=[seq]))
+        
+        subscriber = hub.subscribe(since=1)
+        assert (await subscriber.next_event(timeout=0.1)).event == RESET_EVENT
+    
+    asyncio.run(scenario())
@@ -0,0 +1,57 @@
+"""
+请求剖析测试
+"""
+import logging
+
+from app import profiling
+from app.config import settings
+from app.profiling import MetricsRegistry, ProfilingMiddleware, RequestMetrics, current_metrics, record_query
+
+
+def test_record_query_and_slow_query(monkeypatch, caplog):
+    """测试SQL计入当前请求，超过阈值时记录慢查询"""
+    monkeypatch.setattr(settings, "slow_query_ms", 50.0)
+    monkeypatch.setattr(profiling, "registry", MetricsRegistry())
+    metrics = RequestMetrics()
+    token = current_metrics.set(metrics)
+    try:
+        with caplog.at_level(logging.WARNING, logger="app.profiling"):
+            record_query("SELECT 1", 0.001)
+            record_query("SELECT 2", 0.2)
+    finally:
+        current_metrics.reset(token)
+
+    assert metrics.db_count == 2
+    assert abs(metrics.db_time - 0.201) < 1e-9
+    assert profiling.registry.slow_queries == 1
+    assert "慢查询" in caplog.text and "SELECT 2" in caplog.text
+
+
+def test_n_plus_one_warning(monkeypatch, caplog):
+    """测试同一条SQL重复执行达到阈值时警告"""
+    monkeypatch.setattr(settings, "n_plus_one_threshold", 3)
+    monkeypatch.setattr(profiling, "registry", MetricsRegistry())
+    scope = {"method": "GET", "path": "/api/v1/todos"}
+
+    metrics = RequestMetrics()
+    metrics.statements.update({"SELECT * FROM todos WHERE id = ?": 2})
+    ProfilingMiddleware._warn_n_plus_one(scope, metrics)
+    assert profiling.registry.n_plus_one == 0
+
+    metrics.statements.update({"SELECT * FROM todos WHERE id = ?": 1})
+    with caplog.at_level(logging.WARNING, logger="app.profiling"):
+        ProfilingMiddleware._warn_n_plus_one(scope, metrics)
+    assert profiling.registry.n_plus_one == 1
+    assert "N+1" in caplog.text
+
+
+def test_registry_histogram_is_cumulative():
+    """测试耗时直方图按Prometheus约定累计"""
+    registry = MetricsRegistry(buckets=(0.1, 1.0))
+    registry.observe("GET", "/todos", 200, RequestMetrics(), 0.05)
+    registry.observe("GET", "/todos", 200, RequestMetrics(), 0.5)
+    text = registry.render()
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/todos",le="0.1"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/todos",le="1.0"} 2' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/todos",le="+Inf"} 2' in text
+    assert 'http_requests_total{method="GET",route="/todos",status="200"} 2' in text
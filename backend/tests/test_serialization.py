@@ -0,0 +1,31 @@
+"""
+快速序列化测试
+"""
+from datetime import datetime
+
+from app import serialization
+from app.schemas import TodosResponse
+from app.serialization import TODO_FIELDS, encode_todos
+
+ROWS = [
+    ("标题一", None, 1, False, datetime(2024, 1, 1, 10, 0, 0), datetime(2024, 1, 1, 10, 0, 0), 1),
+    ("标题二", "描述\n\"引号\"", 2, True, datetime(2024, 1, 2, 8, 30, 5, 123456), datetime(2024, 1, 3, 9, 0, 0), 3),
+]
+
+
+def expected_body(next_cursor=None) -> bytes:
+    """使用Pydantic模型生成的响应"""
+    data = [dict(zip(TODO_FIELDS, row)) for row in ROWS]
+    return TodosResponse(data=data, next_cursor=next_cursor).model_dump_json().encode("utf-8")
+
+
+def test_encode_todos_matches_pydantic():
+    """测试快速路径与Pydantic输出一致"""
+    assert encode_todos(ROWS) == expected_body()
+    assert encode_todos(ROWS, "abc") == expected_body("abc")
+
+
+def test_encode_todos_without_orjson(monkeypatch):
+    """测试未安装orjson时回退到标准库json"""
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert encode_todos(ROWS) == expected_body()
@@ -2,15 +2,34 @@
 待办事项API简化测试
 """
 import pytest
+from fastapi import HTTPException, Response
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+import asyncio
+import json
 import tempfile
 import os
 
 from app.main import app
-from app.database import get_db, Base
+from app.cache import response_cache
+from app.changelog import change_feed
+from app.compression import ResponseCompressor, response_compressor
+from app.events import RESET_EVENT, change_payload, event_hub, visible_to
+from app.maintenance import DatabaseMaintenance
+from app.config import settings
+from app.database import (
+    get_async_db, get_async_sessionmaker, Base, applied_schema_hash, build_engine, init_db, instrument_engine,
+    schema_hash,
+)
+from app.idempotency import REPLAYED_HEADER, IdempotentReplay, idempotency_store
 from app.models import Todo
+from app.readmodel import todo_store
+from app.sharding import ShardRouter, move_workspace, workspace_rows
+from app.stats import read_stats, reconcile_stats
+from app.workspaces import shard_for
+from app.writer import GroupCommitWriter, WriteOutcome
 
 # 使用临时文件数据库
 def get_test_db_url():
@@ -20,23 +39,28 @@ def get_test_db_url():
 
 DATABASE_URL, DB_PATH = get_test_db_url()
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# TestClient每次请求使用新的事件循环，异步连接不能跨循环复用
+async_engine = create_async_engine(
+    DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1), poolclass=NullPool
+)
+instrument_engine(async_engine.sync_engine)
+TestingSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
 
-def override_get_db():
+async def override_get_db():
     """覆盖数据库依赖"""
-    try:
-        db = TestingSessionLocal()
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_db
+app.dependency_overrides[get_async_sessionmaker] = lambda: TestingSessionLocal
 client = TestClient(app)
 
 @pytest.fixture(scope="function", autouse=True)
 def setup_test_db():
     """每个测试前设置数据库"""
     Base.metadata.create_all(bind=engine)
+    with engine.connect() as connection:
+        change_feed.load(connection)
     yield
     Base.metadata.drop_all(bind=engine)
 
@@ -53,6 +77,8 @@ def test_health_check():
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "healthy"
+    assert "size_bytes" in data["database"]
+    assert data["maintenance"]["state"] == "waiting"
 
 def test_create_todo():
     """测试创建待办事项"""
@@ -95,6 +121,39 @@ def test_update_todo():
     assert data["data"]["title"] == "更新后标题"
     assert data["data"]["completed"] == True
 
+def test_update_todo_version():
+    """测试乐观并发控制：版本一致才更新，否则返回409"""
+    todo = client.post("/api/v1/todos", json={"title": "版本"}).json()["data"]
+    assert todo["version"] == 1
+    
+    response = client.put(f"/api/v1/todos/{todo['id']}", json={"title": "版本2", "version": 1})
+    assert response.status_code == 200
+    assert response.json()["data"]["version"] == 2
+    
+    # 持有旧版本的客户端更新失败，数据保持不变
+    response = client.put(f"/api/v1/todos/{todo['id']}", json={"title": "过期写入", "version": 1})
+    assert response.status_code == 409
+    assert client.get(f"/api/v1/todos/{todo['id']}").json()["title"] == "版本2"
+    
+    # 详情接口的ETag可作为If-Match提交
+    etag = client.get(f"/api/v1/todos/{todo['id']}").headers["etag"]
+    assert etag == '"2"'
+    response = client.put(f"/api/v1/todos/{todo['id']}", json={"completed": True}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["data"]["version"] == 3
+    response = client.put(f"/api/v1/todos/{todo['id']}", json={"completed": False}, headers={"If-Match": etag})
+    assert response.status_code == 409
+    
+    assert client.put("/api/v1/todos/9999", json={"title": "不存在", "version": 1}).status_code == 404
+    
+    response = client.post("/api/v1/todos:batch", json={"operations": [
+        {"op": "update", "id": todo["id"], "data": {"title": "批量", "version": 3}},
+        {"op": "update", "id": todo["id"], "data": {"title": "批量过期", "version": 3}},
+    ]})
+    assert [r["status"] for r in response.json()["data"]] == [200, 409]
+    current = client.get(f"/api/v1/todos/{todo['id']}").json()
+    assert (current["title"], current["version"]) == ("批量", 4)
+
 def test_delete_todo():
     """测试删除待办事项"""
     # 创建待办事项
@@ -147,6 +206,419 @@ def test_delete_all_todos():
     response = client.get("/api/v1/todos")
     assert len(response.json()["data"]) == 0
 
+def test_delete_all_todos_chunked():
+    """测试分批删除所有待办事项"""
+    for i in range(5):
+        client.post("/api/v1/todos", json={"title": f"待办事项{i+1}"})
+    
+    response = client.delete("/api/v1/todos/all", params={"chunk_size": 2})
+    assert response.status_code == 200
+    assert response.json()["data"]["deleted_count"] == 5
+    
+    response = client.get("/api/v1/todos")
+    assert len(response.json()["data"]) == 0
+
+def test_batch_todos():
+    """测试批量创建/更新/删除"""
+    first_id = client.post("/api/v1/todos", json={"title": "已存在1"}).json()["data"]["id"]
+    second_id = client.post("/api/v1/todos", json={"title": "已存在2"}).json()["data"]["id"]
+    
+    response = client.post("/api/v1/todos:batch", json={"operations": [
+        {"op": "create", "data": {"title": "批量1"}},
+        {"op": "create", "data": {"title": "批量2", "description": "描述"}},
+        {"op": "update", "id": first_id, "data": {"completed": True}},
+        {"op": "delete", "id": second_id},
+        {"op": "delete", "id": 9999},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["data"]
+    assert [r["status"] for r in results] == [201, 201, 200, 200, 404]
+    assert results[1]["data"]["description"] == "描述"
+    assert results[2]["data"]["completed"] == True
+    
+    titles = {todo["title"] for todo in client.get("/api/v1/todos").json()["data"]}
+    assert titles == {"已存在1", "批量1", "批量2"}
+    
+    # 同一记录既被更新又被删除：相关操作都返回409且不执行
+    response = client.post("/api/v1/todos:batch", json={"operations": [
+        {"op": "update", "id": first_id, "data": {"title": "a"}},
+        {"op": "delete", "id": first_id},
+        {"op": "update", "id": first_id, "data": {"title": "x"}},
+        {"op": "create", "data": {"title": "批量3"}},
+    ]})
+    assert [r["status"] for r in response.json()["data"]] == [409, 409, 409, 201]
+    assert client.get(f"/api/v1/todos/{first_id}").json()["title"] == "已存在1"
+
+def test_batch_concurrent_write():
+    """测试批量更新不覆盖读取之后、写入之前提交的其他写操作"""
+    for concurrent, status in (("title = '并发', version = version + 1", 409), ("deleted_at = CURRENT_TIMESTAMP", 404)):
+        todo_id = client.post("/api/v1/todos", json={"title": "原始"}).json()["data"]["id"]
+        fired = []
+        
+        def interleave(conn, cursor, statement, parameters, context, executemany):
+            # 批量接口执行第一条UPDATE之前，另一个连接提交修改
+            if statement.startswith("UPDATE todos") and not fired:
+                fired.append(True)
+                with engine.begin() as other:
+                    other.execute(text(f"UPDATE todos SET {concurrent} WHERE id = :id"), {"id": todo_id})
+        
+        event.listen(async_engine.sync_engine, "before_cursor_execute", interleave)
+        try:
+            response = client.post("/api/v1/todos:batch", json={"operations": [
+                {"op": "update", "id": todo_id, "data": {"title": "批量", "version": 1}}
+            ]})
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", interleave)
+        assert fired and response.json()["data"][0]["status"] == status
+    assert [todo["title"] for todo in client.get("/api/v1/todos").json()["data"]] == ["并发"]
+
+def test_todos_cache_invalidation():
+    """测试列表缓存命中与写后失效"""
+    todo_id = client.post("/api/v1/todos", json={"title": "缓存"}).json()["data"]["id"]
+    
+    client.get("/api/v1/todos")
+    hits = response_cache.hits
+    assert len(client.get("/api/v1/todos").json()["data"]) == 1
+    assert response_cache.hits == hits + 1
+    
+    client.get(f"/api/v1/todos/{todo_id}")
+    client.put(f"/api/v1/todos/{todo_id}", json={"title": "缓存已更新"})
+    assert client.get(f"/api/v1/todos/{todo_id}").json()["title"] == "缓存已更新"
+    assert client.get("/api/v1/todos").json()["data"][0]["title"] == "缓存已更新"
+
+def test_response_compression():
+    """测试列表响应按Accept-Encoding压缩，缓存的压缩结果被复用"""
+    client.post("/api/v1/todos", json={"title": "短"})
+    response = client.get("/api/v1/todos", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+    
+    for i in range(5):
+        client.post("/api/v1/todos", json={"title": f"长描述{i}", "description": "描述" * 200})
+    response = client.get("/api/v1/todos", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert int(response.headers["content-length"]) < len(response.content) / 5
+    assert len(response.json()["data"]) == 6
+    
+    reused = response_compressor.reused
+    response = client.get("/api/v1/todos", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response_compressor.reused == reused + 1
+    
+    response = client.get("/api/v1/todos", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert len(response.json()["data"]) == 6
+    
+    compressor = ResponseCompressor(True, 0, {"gzip": 6}, encodings=["gzip"])
+    assert compressor.negotiate("br, gzip;q=0.5") == "gzip"
+    assert compressor.negotiate("*") == "gzip"
+    assert compressor.negotiate("gzip;q=0, *") is None
+    assert compressor.negotiate(None) is None
+
+def test_todos_etag():
+    """测试ETag条件请求"""
+    todo_id = client.post("/api/v1/todos", json={"title": "ETag"}).json()["data"]["id"]
+    
+    etag = client.get("/api/v1/todos").headers["etag"]
+    response = client.get("/api/v1/todos", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    
+    item_etag = client.get(f"/api/v1/todos/{todo_id}").headers["etag"]
+    assert client.get(f"/api/v1/todos/{todo_id}", headers={"If-None-Match": item_etag}).status_code == 304
+    
+    # 写操作后版本号变化，旧ETag失效
+    client.put(f"/api/v1/todos/{todo_id}", json={"completed": True})
+    response = client.get("/api/v1/todos", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert client.get(f"/api/v1/todos/{todo_id}", headers={"If-None-Match": item_etag}).status_code == 200
+
+def test_write_publishes_change_event():
+    """测试写操作广播变更事件"""
+    subscriber = event_hub.subscribe()
+    try:
+        todo_id = client.post("/api/v1/todos", json={"title": "事件"}).json()["data"]["id"]
+        client.delete(f"/api/v1/todos/{todo_id}")
+        
+        created = subscriber.queue.get_nowait()
+        assert created.data["upserted"][0]["title"] == "事件"
+        deleted = subscriber.queue.get_nowait()
+        assert deleted.data["deleted"] == [todo_id]
+        assert deleted.seq == created.seq + 1
+    finally:
+        event_hub.unsubscribe(subscriber)
+
+def sync_change_feed():
+    """模拟后台轮询，同步一次变更日志"""
+    async def sync():
+        async with TestingSessionLocal() as db:
+            await change_feed.sync(db)
+    asyncio.run(sync())
+
+def test_change_log_from_other_worker():
+    """测试同步其他工作进程写入的变更日志：缓存失效、ETag变化并广播事件"""
+    todo_id = client.post("/api/v1/todos", json={"title": "多进程"}).json()["data"]["id"]
+    etag = client.get("/api/v1/todos").headers["etag"]
+    subscriber = event_hub.subscribe()
+    try:
+        # 另一个进程修改数据并追加变更日志
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE todos SET title = '其他进程' WHERE id = :id"), {"id": todo_id})
+            connection.execute(
+                text("INSERT INTO todo_changes (event, data, todo_ids) VALUES ('change', :data, :ids)"),
+                {"data": json.dumps({"upserted": [], "deleted": [], "cleared": None}), "ids": f"[{todo_id}]"}
+            )
+        assert client.get("/api/v1/todos").json()["data"][0]["title"] == "多进程"
+        
+        sync_change_feed()
+        response = client.get("/api/v1/todos", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.json()["data"][0]["title"] == "其他进程"
+        assert subscriber.queue.get_nowait().seq == change_feed.applied
+        
+        # 数据库被替换后epoch变化，订阅者收到reset事件
+        with engine.begin() as connection:
+            connection.execute(text("UPDATE todo_changes_epoch SET epoch = 'replaced'"))
+        sync_change_feed()
+        assert subscriber.queue.get_nowait().event == RESET_EVENT
+        assert client.get("/api/v1/todos").headers["etag"].startswith('W/"replaced-')
+    finally:
+        event_hub.unsubscribe(subscriber)
+
+def test_write_coalescing(monkeypatch):
+    """测试写合并：并发写操作在一个事务中提交，单个操作的404不影响同批其他操作"""
+    monkeypatch.setattr(settings, "write_coalescing", True)
+    todo_id = client.post("/api/v1/todos", json={"title": "合并"}).json()["data"]["id"]
+    assert client.put(f"/api/v1/todos/{todo_id}", json={"completed": True}).json()["data"]["completed"]
+    assert client.delete("/api/v1/todos/99999").status_code == 404
+    
+    def create(title):
+        async def operation(session):
+            todo = Todo(title=title, completed=False)
+            session.add(todo)
+            await session.flush()
+            return WriteOutcome(todo.id, change_payload(), [todo.id])
+        return operation
+    
+    async def missing(session):
+        raise HTTPException(status_code=404, detail="待办事项不存在")
+    
+    async def scenario():
+        writer = GroupCommitWriter(window_ms=50, max_batch=100)
+        results = await asyncio.gather(
+            *(writer.submit(TestingSessionLocal, create(f"合并{i}")) for i in range(5)),
+            writer.submit(TestingSessionLocal, missing),
+            return_exceptions=True
+        )
+        await writer.stop()
+        return writer, results
+    
+    writer, results = asyncio.run(scenario())
+    assert (writer.batches, writer.operations) == (1, 6)
+    assert len(set(results[:5])) == 5
+    assert isinstance(results[5], HTTPException) and results[5].status_code == 404
+    assert len(client.get("/api/v1/todos").json()["data"]) == 6
+
+def test_search_todos():
+    """测试全文搜索"""
+    client.post("/api/v1/todos", json={"title": "学习FastAPI框架", "description": "阅读官方文档"})
+    client.post("/api/v1/todos", json={"title": "部署服务", "description": "使用FastAPI部署"})
+    todo_id = client.post("/api/v1/todos", json={"title": "购物清单"}).json()["data"]["id"]
+    
+    response = client.get("/api/v1/todos/search", params={"q": "fastapi"})
+    assert response.status_code == 200
+    results = response.json()["data"]
+    # 标题命中的权重高于描述命中
+    assert [r["title"] for r in results] == ["学习FastAPI框架", "部署服务"]
+    assert "<mark>FastAPI</mark>" in results[0]["title_snippet"]
+    
+    # 短关键词退化为LIKE匹配
+    results = client.get("/api/v1/todos/search", params={"q": "购物"}).json()["data"]
+    assert [r["id"] for r in results] == [todo_id]
+    assert results[0]["title_snippet"] == "<mark>购物</mark>清单"
+    
+    # 片段中的原文经过HTML转义，只有高亮标记是标签
+    client.post("/api/v1/todos", json={"title": "<b>脚本</b>", "description": "<script>注入测试</script>"})
+    results = client.get("/api/v1/todos/search", params={"q": "注入测试 脚本"}).json()["data"]
+    assert results[0]["title_snippet"] == "&lt;b&gt;<mark>脚本</mark>&lt;/b&gt;"
+    assert results[0]["description_snippet"].startswith("&lt;script&gt;<mark>注入测试</mark>&lt;/")
+    
+    # 更新和删除后索引同步
+    client.put(f"/api/v1/todos/{todo_id}", json={"title": "FastAPI购物"})
+    assert len(client.get("/api/v1/todos/search", params={"q": "fastapi"}).json()["data"]) == 3
+    client.delete(f"/api/v1/todos/{todo_id}")
+    assert len(client.get("/api/v1/todos/search", params={"q": "fastapi"}).json()["data"]) == 2
+    
+    response = client.get("/api/v1/todos/search", params={"q": "fastapi", "limit": 1})
+    assert response.json()["next_offset"] == 1
+
+def test_todo_stats():
+    """测试统计接口与增量维护的汇总数据"""
+    ids = [
+        client.post("/api/v1/todos", json={"title": f"统计{i}"}).json()["data"]["id"]
+        for i in range(3)
+    ]
+    client.put(f"/api/v1/todos/{ids[0]}", json={"completed": True})
+    client.put(f"/api/v1/todos/{ids[0]}", json={"title": "统计0-改名"})
+    client.delete(f"/api/v1/todos/{ids[1]}")
+    
+    response = client.get("/api/v1/todos/stats")
+    assert response.status_code == 200
+    stats = response.json()["data"]
+    assert (stats["total"], stats["active"], stats["completed"]) == (2, 1, 1)
+    assert sum(day["count"] for day in stats["created_per_day"]) == 2
+    assert sum(day["count"] for day in stats["completed_per_day"]) == 1
+    
+    # 全量校正的结果与增量维护一致
+    with engine.begin() as connection:
+        reconcile_stats(connection)
+    assert client.get("/api/v1/todos/stats").json()["data"] == stats
+
+def test_completed_day_stats():
+    """测试完成日期取完成状态改变的时间，完成后编辑其他字段不移动完成日期"""
+    todo_id = client.post("/api/v1/todos", json={"title": "上周完成"}).json()["data"]["id"]
+    client.put(f"/api/v1/todos/{todo_id}", json={"completed": True})
+    with engine.begin() as connection:
+        connection.execute(
+            text("UPDATE todos SET completed_at = datetime('now', '-3 days') WHERE id = :id"), {"id": todo_id}
+        )
+    completed_day = client.get("/api/v1/todos/stats").json()["data"]["completed_per_day"]
+    assert len(completed_day) == 1
+    
+    client.put(f"/api/v1/todos/{todo_id}", json={"title": "上周完成-改名", "completed": True})
+    client.post("/api/v1/todos:batch", json={"operations": [
+        {"op": "update", "id": todo_id, "data": {"description": "补充说明", "completed": True}}
+    ]})
+    assert client.get("/api/v1/todos/stats").json()["data"]["completed_per_day"] == completed_day
+    with engine.begin() as connection:
+        reconcile_stats(connection)
+    assert client.get("/api/v1/todos/stats").json()["data"]["completed_per_day"] == completed_day
+    
+    # 取消完成后清空完成时间，再次完成记为当天
+    client.put(f"/api/v1/todos/{todo_id}", json={"completed": False})
+    assert client.get("/api/v1/todos/stats").json()["data"]["completed_per_day"] == []
+    client.post("/api/v1/todos:batch", json={"operations": [{"op": "update", "id": todo_id, "data": {"completed": True}}]})
+    stats = client.get("/api/v1/todos/stats").json()["data"]
+    assert [day["date"] for day in stats["completed_per_day"]] == [stats["created_per_day"][-1]["date"]]
+
+def test_soft_delete_and_purge():
+    """测试软删除对所有查询不可见，统计立即扣除，维护任务清除后索引和统计保持一致"""
+    ids = [
+        client.post("/api/v1/todos", json={"title": f"软删除{i}"}).json()["data"]["id"]
+        for i in range(4)
+    ]
+    client.put(f"/api/v1/todos/{ids[1]}", json={"completed": True})
+    client.delete(f"/api/v1/todos/{ids[0]}")
+    client.delete("/api/v1/todos/completed")
+    
+    assert [todo["id"] for todo in client.get("/api/v1/todos").json()["data"]] == [ids[3], ids[2]]
+    assert client.get(f"/api/v1/todos/{ids[0]}").status_code == 404
+    assert client.put(f"/api/v1/todos/{ids[0]}", json={"title": "复活"}).status_code == 404
+    assert client.delete(f"/api/v1/todos/{ids[0]}").status_code == 404
+    assert len(client.get("/api/v1/todos/search", params={"q": "软删除"}).json()["data"]) == 2
+    stats = client.get("/api/v1/todos/stats").json()["data"]
+    assert (stats["total"], stats["completed"]) == (2, 0)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM todos")).scalar() == 4
+    
+    maintenance = DatabaseMaintenance(
+        interval=0, idle_ms=0, retention_seconds=0, purge_batch_size=1,
+        vacuum_step_pages=16, analyze_threshold=1, optimize_interval=0
+    )
+    asyncio.run(maintenance.run_once(TestingSessionLocal, force=True))
+    assert (maintenance.purged, maintenance.tombstones) == (2, 0)
+    assert maintenance.last_analyze_at is not None
+    with engine.begin() as connection:
+        assert connection.execute(text("SELECT count(*) FROM todos")).scalar() == 2
+        connection.execute(text("INSERT INTO todos_fts(todos_fts, rank) VALUES ('integrity-check', 1)"))
+        reconcile_stats(connection)
+    assert client.get("/api/v1/todos/stats").json()["data"] == stats
+
+def test_server_timing_and_metrics():
+    """测试Server-Timing响应头与/metrics指标"""
+    client.post("/api/v1/todos", json={"title": "剖析"})
+    response = client.get("/api/v1/todos", params={"limit": 10})
+    assert response.status_code == 200
+    timing = response.headers["server-timing"]
+    assert 'desc="1 queries"' in timing
+    assert "ser;dur=" in timing and "total;dur=" in timing
+    
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert 'http_requests_total{method="GET",route="/api/v1/todos",status="200"}' in metrics.text
+    assert 'db_queries_total{method="POST",route="/api/v1/todos"}' in metrics.text
+
+def test_profile_request(monkeypatch):
+    """测试?profile=1返回折叠格式的调用栈"""
+    response = client.get("/api/v1/todos", params={"profile": 1})
+    assert response.headers["content-type"].startswith("application/json")
+    
+    monkeypatch.setattr(settings, "profile_enabled", True)
+    monkeypatch.setattr(settings, "profile_interval_ms", 0.1)
+    response = client.get("/api/v1/todos", params={"profile": 1})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    for line in response.text.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack
+        assert int(count) > 0
+
+def test_export_import_todos(monkeypatch):
+    """测试NDJSON/CSV导出后再导入"""
+    monkeypatch.setattr(settings, "transfer_batch_size", 2)
+    for i in range(5):
+        client.post("/api/v1/todos", json={"title": f"导出{i}", "description": "含,逗号\n和换行" if i == 0 else None})
+    
+    exported = {}
+    for fmt in ("ndjson", "csv"):
+        response = client.get("/api/v1/todos/export", params={"format": fmt})
+        assert response.status_code == 200
+        exported[fmt] = response.content
+    lines = exported["ndjson"].decode("utf-8").splitlines()
+    assert len(lines) == 5
+    assert json.loads(lines[0])["description"] == "含,逗号\n和换行"
+    assert exported["csv"].decode("utf-8").startswith("id,title,description,completed,created_at,updated_at,completed_at\n")
+    
+    client.delete("/api/v1/todos/all")
+    response = client.post(
+        "/api/v1/todos/import", content=exported["csv"], headers={"Content-Type": "text/csv"}
+    )
+    assert response.status_code == 200
+    assert response.json()["data"]["imported"] == 5
+    assert client.get("/api/v1/todos/export", params={"format": "ndjson"}).content != b""
+    
+    # 保留ID导入时与已有记录冲突
+    response = client.post("/api/v1/todos/import", params={"keep_ids": True}, content=exported["ndjson"])
+    assert response.status_code == 409
+    response = client.post("/api/v1/todos/import", content=exported["ndjson"])
+    assert response.json()["data"]["imported"] == 5
+    todos = client.get("/api/v1/todos").json()["data"]
+    assert len(todos) == 10
+    assert sum(todo["description"] == "含,逗号\n和换行" for todo in todos) == 2
+
+def test_import_invalid_record(monkeypatch):
+    """测试导入无效记录时所在批次回滚，之前已提交的批次保留"""
+    body = '{"title": "有效"}\n{"title": ""}\n'.encode("utf-8")
+    response = client.post("/api/v1/todos/import", content=body)
+    assert response.status_code == 400
+    assert "第2条记录" in response.json()["detail"]
+    assert client.get("/api/v1/todos").json()["data"] == []
+    
+    monkeypatch.setattr(settings, "transfer_batch_size", 1)
+    response = client.post("/api/v1/todos/import", content=body)
+    assert response.status_code == 400
+    assert "前 1 条已导入" in response.json()["detail"]
+    assert [todo["title"] for todo in client.get("/api/v1/todos").json()["data"]] == ["有效"]
+    # 每批提交时记录变更，结束（包括失败）时再发布reset
+    events = [(event.event, event.data.get("imported")) for event in list(event_hub.history)[-2:]]
+    assert events == [("change", 1), ("reset", 1)]
+    
+    # 带时区的时间换算为UTC
+    client.post("/api/v1/todos/import", content=b'{"title": "t", "created_at": "2020-01-01T08:00:00+08:00"}\n')
+    exported = client.get("/api/v1/todos/export", params={"format": "ndjson"}).content.decode("utf-8")
+    assert json.loads(exported.splitlines()[-1])["created_at"] == "2020-01-01T00:00:00"
+
 def test_filter_todos():
     """测试筛选功能"""
     # 创建未完成和已完成的待办事项
@@ -167,6 +639,285 @@ def test_filter_todos():
     assert response.status_code == 200
     assert len(response.json()["data"]) == 1
 
+def test_filter_and_sort_todos():
+    """测试服务端筛选与多字段排序"""
+    for title in ["买牛奶", "买面包", "写报告", "买鸡蛋"]:
+        client.post("/api/v1/todos", json={"title": title})
+    todo_id = client.get("/api/v1/todos?title_prefix=买面").json()["data"][0]["id"]
+    client.put(f"/api/v1/todos/{todo_id}", json={"completed": True})
+
+    # 标题前缀
+    response = client.get("/api/v1/todos?title_prefix=买")
+    assert response.status_code == 200
+    assert sorted(todo["title"] for todo in response.json()["data"]) == ["买牛奶", "买面包", "买鸡蛋"]
+
+    # 时间范围（带时区的时间换算为UTC比较）
+    assert len(client.get("/api/v1/todos?created_after=2000-01-01T00:00:00Z").json()["data"]) == 4
+    assert client.get("/api/v1/todos?created_before=2000-01-01T00:00:00Z").json()["data"] == []
+    assert client.get("/api/v1/todos?updated_since=2999-01-01T00:00:00%2B08:00").json()["data"] == []
+
+    # 多字段排序，逐页翻页结果与一次取出一致
+    expected = sorted(
+        client.get("/api/v1/todos").json()["data"], key=lambda todo: (-todo["completed"], todo["title"])
+    )
+    response = client.get("/api/v1/todos?sort=-completed,title")
+    assert response.json()["data"] == expected
+    titles, url = [], "/api/v1/todos?sort=-completed,title&limit=1"
+    while url:
+        body = client.get(url).json()
+        titles.extend(todo["title"] for todo in body["data"])
+        cursor = body["next_cursor"]
+        url = f"/api/v1/todos?sort=-completed,title&limit=1&cursor={cursor}" if cursor else None
+    assert titles == [todo["title"] for todo in expected]
+
+    # 不在白名单内的排序字段
+    assert client.get("/api/v1/todos?sort=description").status_code == 400
+    assert client.get("/api/v1/todos?sort=title,-title").status_code == 400
+
+    # 前缀的最后一个字符为U+D7FF时上界跳过代理区，为最大码位时没有上界
+    for title in ["a\ud7ff", "a\ue000", "\U0010ffff!"]:
+        client.post("/api/v1/todos", json={"title": title})
+    response = client.get("/api/v1/todos?title_prefix=a%ED%9F%BF")
+    assert response.status_code == 200
+    assert [todo["title"] for todo in response.json()["data"]] == ["a\ud7ff"]
+    response = client.get("/api/v1/todos", params={"title_prefix": "\U0010ffff"})
+    assert [todo["title"] for todo in response.json()["data"]] == ["\U0010ffff!"]
+
+def test_explain_query_plan(monkeypatch):
+    """测试查询计划调试：筛选与排序的组合都走索引"""
+    assert client.get("/api/v1/todos?explain=true").status_code == 403
+
+    monkeypatch.setattr(settings, "explain_enabled", True)
+    for query in [
+        "sort=-updated_at&limit=20",
+        "completed=false&sort=title&limit=20",
+        "title_prefix=买&limit=20",
+        "created_after=2024-01-01T00:00:00&sort=created_at&limit=20",
+        "completed=true&updated_since=2024-01-01T00:00:00&sort=-updated_at&limit=20",
+    ]:
+        response = client.get(f"/api/v1/todos?{query}&explain=true")
+        assert response.status_code == 200
+        plan = response.json()["data"]
+        assert plan["plan"]
+        assert plan["full_scan"] is False, (query, plan["plan"])
+
+def test_paginate_todos():
+    """测试游标分页"""
+    # 同一秒内创建的记录created_at相同，依赖id保证翻页稳定
+    for i in range(5):
+        client.post("/api/v1/todos", json={"title": f"分页{i+1}"})
+    
+    titles = []
+    cursor = None
+    pages = 0
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/v1/todos", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["data"]) <= 2
+        titles.extend(todo["title"] for todo in data["data"])
+        pages += 1
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    
+    assert pages == 3
+    assert titles == [f"分页{i}" for i in range(5, 0, -1)]
+
+def test_paginate_invalid_cursor():
+    """测试无效游标"""
+    response = client.get("/api/v1/todos", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def test_read_model(monkeypatch):
+    """测试读模型加载、写穿同步及reset后重新加载，列表和详情与SQLite路径返回相同的结果"""
+    monkeypatch.setattr(response_cache, "enabled", False)
+    monkeypatch.setattr(todo_store, "loaded", False)
+    records = "".join(
+        json.dumps({"title": f"导入{i}", "completed": i % 2 == 0, "created_at": f"2024-01-0{i + 1}T08:00:00"}) + "\n"
+        for i in range(4)
+    )
+    client.post("/api/v1/todos/import", content=records.encode("utf-8"))
+    
+    monkeypatch.setattr(todo_store, "enabled", True)
+    with engine.connect() as connection:
+        change_feed.load(connection)
+    assert todo_store.ready and len(todo_store.table) == 4
+    pages = []
+    page_from_store = todo_store.page
+    monkeypatch.setattr(todo_store, "page", lambda *args: pages.append(args) or page_from_store(*args))
+    
+    ids = [client.post("/api/v1/todos", json={"title": f"新建{i}"}).json()["data"]["id"] for i in range(3)]
+    client.put(f"/api/v1/todos/{ids[0]}", json={"completed": True})
+    client.delete(f"/api/v1/todos/{ids[1]}")
+    client.post("/api/v1/todos:batch", json={"operations": [
+        {"op": "create", "data": {"title": "批量"}}, {"op": "update", "id": ids[2], "data": {"title": "改名"}}
+    ]})
+    client.post("/api/v1/todos", json={"title": "其他"}, headers={"X-Workspace": "other"})
+    assert len(todo_store.table) == 8
+    
+    def read_both(path, params=None):
+        from_store = client.get(path, params=params)
+        monkeypatch.setattr(todo_store, "enabled", False)
+        from_sqlite = client.get(path, params=params)
+        monkeypatch.setattr(todo_store, "enabled", True)
+        assert from_store.status_code == from_sqlite.status_code
+        assert from_store.json() == from_sqlite.json(), params
+        return from_store.json()
+    
+    queries = [
+        {}, {"completed": True}, {"completed": False}, {"sort": "created_at"},
+        {"created_after": "2024-01-02T00:00:00", "created_before": "2024-01-04T00:00:00"},
+        {"limit": 3}, {"limit": 2, "sort": "created_at", "completed": False},
+    ]
+    for params in queries:
+        page = read_both("/api/v1/todos", params)
+        while page["next_cursor"]:
+            page = read_both("/api/v1/todos", {**params, "cursor": page["next_cursor"]})
+    for todo_id in ids:
+        read_both(f"/api/v1/todos/{todo_id}")
+    assert client.get(f"/api/v1/todos/{ids[0]}").json()["completed"] is True
+    
+    # reset事件使读模型失效，同步时重新加载
+    loads = todo_store.loads
+    client.post("/api/v1/todos/import", content='{"title": "再导入"}\n'.encode("utf-8"))
+    assert todo_store.loads == loads + 1 and len(todo_store.table) == 9
+    client.delete("/api/v1/todos/completed")
+    assert not any(todo["completed"] for todo in read_both("/api/v1/todos")["data"])
+    assert len(pages) > len(queries)
+
+def test_workspace_isolation():
+    """测试工作空间之间的数据、统计和事件互不可见"""
+    alpha = {"X-Workspace": "alpha"}
+    todo_id = client.post("/api/v1/todos", json={"title": "甲"}, headers=alpha).json()["data"]["id"]
+    client.post("/api/v1/todos", json={"title": "乙"})
+    
+    assert [t["title"] for t in client.get("/api/v1/todos", headers=alpha).json()["data"]] == ["甲"]
+    assert [t["title"] for t in client.get("/api/v1/todos").json()["data"]] == ["乙"]
+    # 查询参数与请求头等价
+    assert client.get("/api/v1/todos", params={"workspace": "alpha"}).json()["data"][0]["id"] == todo_id
+    assert client.get("/api/v1/todos/stats", headers=alpha).json()["data"]["total"] == 1
+    
+    # 其他工作空间中的记录视为不存在
+    assert client.get(f"/api/v1/todos/{todo_id}").status_code == 404
+    assert client.put(f"/api/v1/todos/{todo_id}", json={"completed": True}).status_code == 404
+    assert client.delete(f"/api/v1/todos/{todo_id}").status_code == 404
+    assert client.get(f"/api/v1/todos/{todo_id}", headers=alpha).status_code == 200
+    
+    client.delete("/api/v1/todos")
+    assert len(client.get("/api/v1/todos", headers=alpha).json()["data"]) == 1
+    assert client.get("/api/v1/todos", headers={"X-Workspace": "../x"}).status_code == 400
+    assert client.get("/api/v1/todos?workspace=abc%0A").status_code == 400
+    
+    event = event_hub.history[-1]
+    assert event.data["workspace"] == "default"
+    assert visible_to(event, "default") and not visible_to(event, "alpha")
+
+def test_shard_router(tmp_path):
+    """测试工作空间路由到各自的分片，迁移后记录随工作空间移动"""
+    template = f"sqlite:///{tmp_path}/todos-{{shard}}.db"
+    router = ShardRouter(2, template, default=None)
+    workspaces = {shard_for(name, 2): name for name in ("a", "b", "c", "d", "e")}
+    assert set(workspaces) == {0, 1}
+    
+    try:
+        first = asyncio.run(router.route(workspaces[0]))
+        second = asyncio.run(router.route(workspaces[1]))
+        assert (first.index, second.index) == (0, 1)
+        assert asyncio.run(router.route(workspaces[0])) is first
+        assert first.engine.url.database.endswith("todos-0.db")
+        
+        with first.engine.begin() as connection:
+            connection.execute(Todo.__table__.insert().values(
+                title="迁移", workspace=workspaces[1], completed=True,
+                created_at=text("datetime('now', '-10 days')"), completed_at=text("datetime('now', '-3 days')"),
+            ))
+        
+        def completion(shard):
+            with shard.engine.connect() as connection:
+                completed_at = connection.execute(text("SELECT completed_at FROM todos")).scalar()
+            
+            async def stats():
+                async with shard.session_factory() as db:
+                    return (await read_stats(db, 30, workspaces[1]))["completed_per_day"]
+            return completed_at, asyncio.run(stats())
+        
+        before = completion(first)
+        assert before[0] is not None and len(before[1]) == 1
+        assert move_workspace(first.engine, second.engine, workspaces[1], 100, replace=False) == 1
+        with second.engine.connect() as connection:
+            rows = workspace_rows(connection)
+        assert [(row.workspace, row.live) for row in rows] == [(workspaces[1], 1)]
+        # 完成时间随记录迁移，完成日期的统计不变
+        assert completion(second) == before
+        with first.engine.connect() as connection:
+            assert workspace_rows(connection) == []
+    finally:
+        asyncio.run(router.stop())
+
+def test_schema_hash(tmp_path):
+    """测试表结构哈希未变化时跳过建表，变化后重新建表和升级"""
+    schema_engine = build_engine(f"sqlite:///{tmp_path}/schema.db")
+    try:
+        assert init_db(schema_engine) is True
+        assert applied_schema_hash(schema_engine) == schema_hash(schema_engine.dialect)
+        assert init_db(schema_engine) is False
+        
+        # 旧版本代码创建的数据库：哈希不一致，缺少的触发器被补上
+        with schema_engine.begin() as connection:
+            connection.execute(text("UPDATE schema_info SET hash = 'old'"))
+            connection.execute(text("DROP TRIGGER todo_stats_ai"))
+        assert init_db(schema_engine) is True
+        with schema_engine.connect() as connection:
+            assert connection.execute(
+                text("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name = 'todo_stats_ai'")
+            ).scalar() == 1
+        assert init_db(schema_engine) is False
+    finally:
+        schema_engine.dispose()
+
+def test_idempotency_key():
+    """测试幂等键：重试返回首次的响应，不同请求体被拒绝，并发的重复请求等待首次完成"""
+    idempotency_store.responses.clear()
+    key = {"Idempotency-Key": "create-1"}
+    first = client.post("/api/v1/todos", json={"title": "幂等"}, headers=key)
+    retry = client.post("/api/v1/todos", json={"title": "幂等"}, headers=key)
+    assert retry.json()["data"]["id"] == first.json()["data"]["id"]
+    assert retry.headers[REPLAYED_HEADER] == "true" and REPLAYED_HEADER not in first.headers
+    assert len(client.get("/api/v1/todos").json()["data"]) == 1
+    
+    # 内存中的响应丢失后（如进程重启）从数据库重放
+    idempotency_store.responses.clear()
+    assert client.post("/api/v1/todos", json={"title": "幂等"}, headers=key).headers[REPLAYED_HEADER] == "true"
+    assert client.post("/api/v1/todos", json={"title": "其他"}, headers=key).status_code == 422
+    # 键按工作空间隔离
+    other = client.post("/api/v1/todos", json={"title": "幂等"}, headers={**key, "X-Workspace": "alpha"})
+    assert REPLAYED_HEADER not in other.headers
+    
+    # 4xx响应同样保存，重试得到相同的结果
+    missing = {"Idempotency-Key": "delete-missing"}
+    assert client.delete("/api/v1/todos/99999", headers=missing).status_code == 404
+    replayed = client.delete("/api/v1/todos/99999", headers=missing)
+    assert replayed.status_code == 404 and replayed.headers[REPLAYED_HEADER] == "true"
+    assert client.post("/api/v1/todos", json={"title": "x"}, headers={"Idempotency-Key": "k" * 256}).status_code == 400
+    
+    async def scenario():
+        claim = await idempotency_store.begin(TestingSessionLocal, "default", "concurrent", "f")
+        duplicate = asyncio.ensure_future(idempotency_store.begin(TestingSessionLocal, "default", "concurrent", "f"))
+        await asyncio.sleep(0.05)
+        assert not duplicate.done()
+        await claim.complete(Response(b"ok", status_code=201))
+        with pytest.raises(IdempotentReplay) as replay:
+            await duplicate
+        return replay.value.response
+    
+    response = asyncio.run(scenario())
+    assert (response.status_code, response.body) == (201, b"ok")
+    assert idempotency_store.waits >= 1
+
 # 清理函数
 def cleanup():
     try:
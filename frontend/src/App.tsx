@@ -2,7 +2,7 @@
  * 主应用组件 - 待办事项管理系统
  */
 import React, { useState, useEffect, useCallback } from 'react';
-import { Todo, TodoCreate, FilterType } from './types/todo';
+import { Todo, TodoCreate, FilterType, TodoChangeEvent, TodoStats } from './types/todo';
 import { apiService } from './services/api';
 import TodoForm from './components/TodoForm';
 import TodoList from './components/TodoList';
@@ -10,9 +10,34 @@ import FilterBar from './components/FilterBar';
 import './styles/globals.css';
 import './App.css';
 
+// 按id插入或替换：已存在时原位替换，否则插入到最前面
+const upsertTodo = (todos: Todo[], changed: Todo): Todo[] =>
+  todos.some(todo => todo.id === changed.id)
+    ? todos.map(todo => (todo.id === changed.id ? changed : todo))
+    : [changed, ...todos];
+
+// 将服务端推送的变更应用到本地列表
+const applyChange = (todos: Todo[], change: TodoChangeEvent): Todo[] => {
+  let next = todos;
+  if (change.cleared === 'all') {
+    next = [];
+  } else if (change.cleared === 'completed') {
+    next = next.filter(todo => !todo.completed);
+  }
+  if (change.deleted.length > 0) {
+    const deletedIds = new Set(change.deleted);
+    next = next.filter(todo => !deletedIds.has(todo.id));
+  }
+  for (const changed of change.upserted) {
+    next = upsertTodo(next, changed);
+  }
+  return next;
+};
+
 const App: React.FC = () => {
   // 状态管理
   const [todos, setTodos] = useState<Todo[]>([]);
+  const [stats, setStats] = useState<TodoStats | null>(null);
   const [filter, setFilter] = useState<FilterType>('all');
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState<string | null>(null);
@@ -38,17 +63,44 @@ const App: React.FC = () => {
     }
   }, []);
 
+  // 加载统计数据，失败时回退为按本地列表计数
+  const loadStats = useCallback(async () => {
+    try {
+      setStats(await apiService.getStats());
+    } catch (err) {
+      setStats(null);
+      console.error('加载统计失败:', err);
+    }
+  }, []);
+
   // 组件挂载时加载数据
   useEffect(() => {
     loadTodos();
-  }, [loadTodos]);
+    loadStats();
+  }, [loadTodos, loadStats]);
+
+  // 订阅服务端变更推送，其他窗口的修改无需轮询即可同步
+  useEffect(() => {
+    const unsubscribe = apiService.subscribeChanges(
+      (change) => {
+        setTodos(prevTodos => applyChange(prevTodos, change));
+        loadStats();
+      },
+      () => {
+        loadTodos();
+        loadStats();
+      }
+    );
+    return unsubscribe;
+  }, [loadTodos, loadStats]);
 
   // 添加新待办事项
   const handleAddTodo = async (todoData: TodoCreate) => {
     try {
       setLoading(true);
       const newTodo = await apiService.createTodo(todoData);
-      setTodos(prevTodos => [newTodo, ...prevTodos]);
+      // 变更推送可能先于响应到达并已插入该记录
+      setTodos(prevTodos => upsertTodo(prevTodos, newTodo));
     } catch (err) {
       showError('添加待办事项失败');
       throw err;
@@ -79,14 +131,16 @@ const App: React.FC = () => {
   const handleUpdateTodo = async (id: number, title: string, description?: string) => {
     try {
       setLoading(true);
-      const updatedTodo = await apiService.updateTodo(id, { title, description });
+      // 带上编辑时看到的版本号，期间被其他人修改过时后端返回409
+      const version = todos.find(todo => todo.id === id)?.version;
+      const updatedTodo = await apiService.updateTodo(id, { title, description, version });
       setTodos(prevTodos =>
         prevTodos.map(todo =>
           todo.id === id ? updatedTodo : todo
         )
       );
     } catch (err) {
-      showError('更新待办事项失败');
+      showError(err instanceof Error ? err.message : '更新待办事项失败');
       throw err;
     } finally {
       setLoading(false);
@@ -147,9 +201,9 @@ const App: React.FC = () => {
     }
   };
 
-  // 统计数据
-  const completedCount = todos.filter(todo => todo.completed).length;
-  const totalCount = todos.length;
+  // 统计数据：优先使用服务端汇总，未加载时按本地列表计数
+  const completedCount = stats ? stats.completed : todos.filter(todo => todo.completed).length;
+  const totalCount = stats ? stats.total : todos.length;
 
   return (
     <div className="app">
@@ -9,7 +9,10 @@ import {
   TodoUpdate, 
   TodosResponse, 
   TodoResponse,
-  BatchDeleteResponse
+  BatchDeleteResponse,
+  TodoChangeEvent,
+  TodoStats,
+  TodoStatsResponse
 } from '../types/todo';
 
 class ApiService {
@@ -63,6 +66,20 @@ class ApiService {
     }
   }
 
+  /**
+   * 获取统计数据（按状态计数及每日创建/完成数）
+   */
+  async getStats(days?: number): Promise<TodoStats> {
+    try {
+      const params = days !== undefined ? { days } : {};
+      const response: AxiosResponse<TodoStatsResponse> = await this.api.get('/todos/stats', { params });
+      return response.data.data;
+    } catch (error) {
+      console.error('Error fetching stats:', error);
+      throw new Error('获取统计数据失败');
+    }
+  }
+
   /**
    * 获取单个待办事项
    */
@@ -98,6 +115,9 @@ class ApiService {
       return response.data.data;
     } catch (error) {
       console.error('Error updating todo:', error);
+      if (axios.isAxiosError(error) && error.response?.status === 409) {
+        throw new Error('待办事项已被修改，请刷新后重试');
+      }
       throw new Error('更新待办事项失败');
     }
   }
@@ -146,6 +166,20 @@ class ApiService {
   async toggleTodo(id: number, completed: boolean): Promise<Todo> {
     return this.updateTodo(id, { completed });
   }
+
+  /**
+   * 订阅服务端推送的变更事件（SSE）
+   * 断线后浏览器会携带Last-Event-ID自动重连续传；收到reset时需要重新加载列表
+   * 返回取消订阅函数
+   */
+  subscribeChanges(onChange: (change: TodoChangeEvent) => void, onReset: () => void): () => void {
+    const source = new EventSource(`${this.api.defaults.baseURL}/todos/events`);
+    source.addEventListener('change', (event) => {
+      onChange(JSON.parse((event as MessageEvent).data));
+    });
+    source.addEventListener('reset', () => onReset());
+    return () => source.close();
+  }
 }
 
 // 导出单例实例
@@ -9,6 +9,7 @@ export interface Todo {
   completed: boolean;
   created_at: string;
   updated_at: string;
+  version: number;
 }
 
 export interface TodoCreate {
@@ -20,6 +21,7 @@ export interface TodoUpdate {
   title?: string;
   description?: string;
   completed?: boolean;
+  version?: number;
 }
 
 export interface ApiResponse<T> {
@@ -30,6 +32,7 @@ export interface ApiResponse<T> {
 
 export interface TodosResponse extends ApiResponse<Todo[]> {
   data: Todo[];
+  next_cursor?: string | null;
 }
 
 export interface TodoResponse extends ApiResponse<Todo> {
@@ -40,6 +43,31 @@ export interface BatchDeleteResponse extends ApiResponse<{ deleted_count: number
   data: { deleted_count: number };
 }
 
+export interface DailyCount {
+  date: string;
+  count: number;
+}
+
+export interface TodoStats {
+  total: number;
+  active: number;
+  completed: number;
+  created_per_day: DailyCount[];
+  completed_per_day: DailyCount[];
+}
+
+export interface TodoStatsResponse extends ApiResponse<TodoStats> {
+  data: TodoStats;
+}
+
+export interface TodoChangeEvent {
+  seq: number;
+  workspace: string | null;
+  upserted: Todo[];
+  deleted: number[];
+  cleared: 'completed' | 'all' | null;
+}
+
 export type FilterType = 'all' | 'active' | 'completed';
 
 export interface AppState {